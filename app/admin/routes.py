@@ -2,14 +2,18 @@ import secrets
 import string
 
 from fastapi import APIRouter, Depends, Form, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse
 from sqlalchemy.orm import Session
 from passlib.hash import argon2
 
 from ..db import get_db
 from ..auth.session import get_session_username
-from ..auth.models import Admin
-from ..settings_service import get_settings
+from ..auth.models import Admin, ApiToken
+from ..api.tokens import create_token
+from ..settings_service import get_settings, get_cached_settings, bump_settings_version
+from ..invalidation import publish
+from ..observability.models import ProfilerArm
+from ..observability.profiler import list_profiles, profile_path, reload_arms
 
 router = APIRouter()
 
@@ -51,15 +55,21 @@ def superadmin_home(request: Request, db: Session = Depends(get_db)):
     if redir:
         return redir
 
-    settings = get_settings(db)
+    settings = get_cached_settings(db)
     admins = db.query(Admin).order_by(Admin.username.asc()).all()
+    arms = db.query(ProfilerArm).filter(ProfilerArm.remaining > 0).order_by(ProfilerArm.created_at.desc()).all()
 
     return _templates(request).TemplateResponse(
         "superadmin.html",
-        {"request": request, "admins": admins, "settings": settings, "error": None, "message": None, "temp_password": None},
+        {"request": request, "admins": admins, "settings": settings, "error": None, "message": None, "temp_password": None,
+         "profiler_arms": arms, "profiles": list_profiles(), "api_tokens": _api_tokens(db)},
     )
 
 
+def _api_tokens(db: Session) -> list[ApiToken]:
+    return db.query(ApiToken).filter(ApiToken.revoked == False).order_by(ApiToken.created_at.desc()).all()  # noqa: E712
+
+
 @router.post("/superadmin/settings/update")
 def superadmin_update_settings(
     request: Request,
@@ -80,8 +90,10 @@ def superadmin_update_settings(
     s.warn_group_clear_count = int(warn_group_clear_count)
     s.warn_create_count = int(warn_create_count)
     s.require_typed_confirm = (require_typed_confirm == "on")
+    bump_settings_version(s)
 
     db.add(s)
+    publish(db, "settings")
     db.commit()
     return RedirectResponse("/superadmin", status_code=303)
 
@@ -105,7 +117,7 @@ def superadmin_create_admin(
     if db.query(Admin).filter(Admin.username == uname).first():
         return _templates(request).TemplateResponse(
             "superadmin.html",
-            {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_settings(db),
+            {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_cached_settings(db),
              "error": "Admin already exists", "message": None, "temp_password": None},
         )
 
@@ -119,6 +131,7 @@ def superadmin_create_admin(
         force_password_change=False,
     )
     db.add(a)
+    publish(db, "admin", a.username)
     db.commit()
     return RedirectResponse("/superadmin", status_code=303)
 
@@ -144,12 +157,13 @@ def superadmin_toggle_superadmin(
         if a.is_superadmin and _superadmin_count(db) <= 1:
             return _templates(request).TemplateResponse(
                 "superadmin.html",
-                {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_settings(db),
+                {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_cached_settings(db),
                  "error": "Cannot remove the last super admin.", "message": None, "temp_password": None},
             )
 
     a.is_superadmin = want
     db.add(a)
+    publish(db, "admin", a.username)
     db.commit()
     return RedirectResponse("/superadmin", status_code=303)
 
@@ -174,12 +188,13 @@ def superadmin_toggle_disabled(
     if want_disable and a.is_superadmin and _superadmin_count(db) <= 1:
         return _templates(request).TemplateResponse(
             "superadmin.html",
-            {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_settings(db),
+            {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_cached_settings(db),
              "error": "Cannot disable the last super admin.", "message": None, "temp_password": None},
         )
 
     a.is_disabled = want_disable
     db.add(a)
+    publish(db, "admin", a.username)
     db.commit()
     return RedirectResponse("/superadmin", status_code=303)
 
@@ -202,11 +217,102 @@ def superadmin_reset_password(
     a.password_hash = argon2.hash(temp_pw)
     a.force_password_change = True
     db.add(a)
+    publish(db, "admin", a.username)
     db.commit()
 
     return _templates(request).TemplateResponse(
         "superadmin.html",
-        {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_settings(db),
+        {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_cached_settings(db),
          "error": None, "message": f"Temporary password generated for {a.username}. Copy it now (shown once).",
          "temp_password": temp_pw},
     )
+
+
+@router.post("/superadmin/profiler/arm")
+def superadmin_profiler_arm(
+    request: Request,
+    path_prefix: str = Form(default=""),
+    count: int = Form(default=1),
+    db: Session = Depends(get_db),
+):
+    redir = require_superadmin(request, db)
+    if redir:
+        return redir
+
+    db.add(ProfilerArm(
+        path_prefix=path_prefix.strip(),
+        remaining=max(1, min(int(count), 100)),
+        created_by=get_session_username(request) or "unknown",
+    ))
+    publish(db, "profiler")
+    db.commit()
+    reload_arms()
+    return RedirectResponse("/superadmin", status_code=303)
+
+
+@router.post("/superadmin/profiler/cancel")
+def superadmin_profiler_cancel(
+    request: Request,
+    arm_id: str = Form(...),
+    db: Session = Depends(get_db),
+):
+    redir = require_superadmin(request, db)
+    if redir:
+        return redir
+
+    db.query(ProfilerArm).filter(ProfilerArm.id == arm_id).delete()
+    publish(db, "profiler")
+    db.commit()
+    reload_arms()
+    return RedirectResponse("/superadmin", status_code=303)
+
+
+@router.get("/superadmin/profiles/{name}")
+def superadmin_profile_download(request: Request, name: str, db: Session = Depends(get_db)):
+    redir = require_superadmin(request, db)
+    if redir:
+        return redir
+
+    path = profile_path(name)
+    if not path:
+        return RedirectResponse("/superadmin", status_code=303)
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{name}.folded")
+
+
+@router.post("/superadmin/api_tokens/create")
+def superadmin_api_token_create(
+    request: Request,
+    name: str = Form(...),
+    db: Session = Depends(get_db),
+):
+    redir = require_superadmin(request, db)
+    if redir:
+        return redir
+
+    name = name.strip()
+    if not name:
+        return RedirectResponse("/superadmin", status_code=303)
+
+    _row, token = create_token(db, name, get_session_username(request) or "unknown")
+
+    return _templates(request).TemplateResponse(
+        "superadmin.html",
+        {"request": request, "admins": db.query(Admin).order_by(Admin.username.asc()).all(), "settings": get_cached_settings(db),
+         "error": None, "message": f"API token '{name}' created. Copy it now (shown once).",
+         "temp_password": None, "api_token": token, "api_tokens": _api_tokens(db)},
+    )
+
+
+@router.post("/superadmin/api_tokens/revoke")
+def superadmin_api_token_revoke(
+    request: Request,
+    token_id: str = Form(...),
+    db: Session = Depends(get_db),
+):
+    redir = require_superadmin(request, db)
+    if redir:
+        return redir
+
+    db.query(ApiToken).filter(ApiToken.id == token_id).update({"revoked": True})
+    db.commit()
+    return RedirectResponse("/superadmin", status_code=303)
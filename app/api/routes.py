@@ -0,0 +1,306 @@
+"""
+Versioned JSON API (/api/v1) for automation.
+
+Authenticates with "Authorization: Bearer <token>" (tokens are created in
+/superadmin) and runs the same preview/apply pipeline as the web UI; audit
+entries name the token as actor "api:<token name>". Applies are asynchronous:
+they are queued (app/importer/queue.py) and return a job to poll.
+
+Errors are JSON {"detail": "..."} with a 4xx status.
+"""
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from ..db import SessionLocal, get_db
+from ..history.routes import redact
+from ..importer.models import ApplyJob, AuditLog, ImportBatch, ImportRow
+from ..importer.queue import BatchNotApplicable, enqueue_apply, queue_position
+from ..importer.service import PreviewOptions, apply_refusal, item_from_row, load_batch_users, run_preview, summary_dict
+from ..pritunl.store import ensure_fresh, iter_target_users
+from ..settings_service import get_cached_settings, guardrail_warnings
+from ..targets.models import Target
+from .tokens import verify_token
+
+router = APIRouter(prefix="/api/v1")
+
+
+def api_actor(request: Request, db: Session = Depends(get_db)) -> str:
+    auth = request.headers.get("authorization", "")
+    scheme, _, token = auth.partition(" ")
+    row = verify_token(db, token.strip()) if scheme.lower() == "bearer" else None
+    if row is None:
+        raise HTTPException(status_code=401, detail="Missing or invalid API token.", headers={"WWW-Authenticate": "Bearer"})
+    return f"api:{row.name}"
+
+
+def _target(db: Session, target_id: str) -> Target:
+    t = db.query(Target).filter(Target.id == target_id).first()
+    if not t:
+        raise HTTPException(status_code=404, detail="Target not found.")
+    return t
+
+
+def _batch(db: Session, t: Target, batch_id: str) -> ImportBatch:
+    batch = db.query(ImportBatch).filter(ImportBatch.id == batch_id, ImportBatch.target_id == t.id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found for this target.")
+    return batch
+
+
+def _target_dict(t: Target) -> dict:
+    return {
+        "id": t.id,
+        "name": t.name,
+        "base_url": t.base_url,
+        "auth_mode": t.auth_mode,
+        "org_name": t.org_name or "",
+        "supports_groups": t.supports_groups,
+    }
+
+
+def _batch_dict(batch: ImportBatch) -> dict:
+    meta = batch.meta or {}
+    return {
+        "id": batch.id,
+        "target_id": batch.target_id,
+        "status": batch.status,
+        "created_by": batch.created_by,
+        "created_at": batch.created_at,
+        "csv_sha256": batch.csv_sha256,
+        "preview_sha256": batch.preview_sha256,
+        "mode": meta.get("mode"),
+        "orgs": meta.get("orgs", []),
+        "summary": batch.summary or {},
+    }
+
+
+def _job_dict(db: Session, job: ApplyJob) -> dict:
+    d = {
+        "id": job.id,
+        "target_id": job.target_id,
+        "batch_id": job.batch_id,
+        "actor": job.actor,
+        "status": job.status,
+        "rows": job.rows,
+        "enqueued_at": job.enqueued_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "results": job.results or {},
+        "error": job.error,
+    }
+    if job.status == "queued":
+        d["queue"] = queue_position(db, job)
+    return d
+
+
+@router.get("/targets")
+def api_targets(db: Session = Depends(get_db), actor: str = Depends(api_actor)):
+    return {"targets": [_target_dict(t) for t in db.query(Target).order_by(Target.name.asc()).all()]}
+
+
+@router.get("/targets/{target_id}/users")
+def api_target_users(target_id: str, db: Session = Depends(get_db), actor: str = Depends(api_actor)):
+    """The target's users as JSON lines, streamed from the user store."""
+    t = _target(db, target_id)
+    try:
+        sync = ensure_fresh(db, t)
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    org_names = {o["id"]: o.get("name") or "" for o in (sync.orgs or [])}
+    tid = t.id
+
+    def _lines():
+        # The request's session is closed before the body streams
+        sdb = SessionLocal()
+        try:
+            buf: list[str] = []
+            for u in iter_target_users(sdb, tid):
+                buf.append(json.dumps({**u, "org": org_names.get(u["organization"], "")}, separators=(",", ":")))
+                if len(buf) >= 1000:
+                    yield ("\n".join(buf) + "\n").encode("utf-8")
+                    buf = []
+            if buf:
+                yield ("\n".join(buf) + "\n").encode("utf-8")
+        finally:
+            sdb.close()
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
+@router.post("/targets/{target_id}/previews")
+async def api_preview(
+    request: Request,
+    target_id: str,
+    mode: str = Query(default="actions"),
+    disable_missing: bool = Query(default=False),
+    base_batch_id: str | None = Query(default=None),
+    db: Session = Depends(get_db),
+    actor: str = Depends(api_actor),
+):
+    """Preview the CSV sent as the request body (Content-Type: text/csv)."""
+    t = _target(db, target_id)
+    csv_bytes = await request.body()
+    try:
+        options = PreviewOptions(mode=mode.strip().lower(), disable_missing=disable_missing, base_batch_id=base_batch_id or None)
+        outcome = run_preview(db, t, csv_bytes, actor, options=options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    _warn, warn_msgs = guardrail_warnings(get_cached_settings(db), outcome.summary)
+    return {
+        "batch": _batch_dict(outcome.batch),
+        "preview_sha256": outcome.preview_sha256,
+        "reused": outcome.reused,
+        "summary": summary_dict(outcome.summary),
+        "warnings": warn_msgs,
+        "delta": (outcome.batch.meta or {}).get("delta"),
+        "can_apply": outcome.summary.actioned_rows > 0 and outcome.summary.errors == 0,
+    }
+
+
+@router.get("/targets/{target_id}/batches/{batch_id}")
+def api_batch(target_id: str, batch_id: str, db: Session = Depends(get_db), actor: str = Depends(api_actor)):
+    t = _target(db, target_id)
+    batch = _batch(db, t, batch_id)
+    jobs = db.query(ApplyJob).filter(ApplyJob.batch_id == batch.id).order_by(ApplyJob.enqueued_at.asc()).all()
+    return {"batch": _batch_dict(batch), "jobs": [_job_dict(db, j) for j in jobs]}
+
+
+@router.get("/targets/{target_id}/batches/{batch_id}/rows")
+def api_batch_rows(
+    target_id: str,
+    batch_id: str,
+    after: int = Query(default=0, ge=0, description="return rows with a row number greater than this"),
+    limit: int = Query(default=500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    actor: str = Depends(api_actor),
+):
+    """One page of a batch's rows in file order; pass next_after back as after."""
+    t = _target(db, target_id)
+    batch = _batch(db, t, batch_id)
+    rows = db.execute(
+        select(ImportRow)
+        .where(ImportRow.batch_id == batch.id, ImportRow.row_num > after)
+        .order_by(ImportRow.row_num.asc())
+        .limit(limit)
+    ).scalars().all()
+    users = load_batch_users(db, batch) if any(r.derived for r in rows) else {}
+
+    out = []
+    for r in rows:
+        it = item_from_row(r, users)
+        out.append({
+            "row": it.row,
+            "action": it.action,
+            "email": it.email,
+            "username": it.username,
+            "status": it.status,
+            "will_apply": it.will_apply,
+            "before": it.before,
+            "after": it.after,
+            "error": it.error,
+            "desired": it.desired,
+            "diff": it.diff,
+            "apply_status": r.apply_status,
+            "apply_result": r.apply_result or {},
+        })
+    return {"rows": out, "next_after": rows[-1].row_num if len(rows) == limit else None}
+
+
+class ApplyRequest(BaseModel):
+    # Plan hash returned by the preview: the batch is only applied as previewed
+    preview_sha256: str
+
+
+@router.post("/targets/{target_id}/batches/{batch_id}/apply", status_code=202)
+def api_apply(
+    target_id: str,
+    batch_id: str,
+    body: ApplyRequest,
+    db: Session = Depends(get_db),
+    actor: str = Depends(api_actor),
+):
+    t = _target(db, target_id)
+    batch = _batch(db, t, batch_id)
+    refusal = apply_refusal(batch, body.preview_sha256)
+    if refusal:
+        raise HTTPException(status_code=409, detail=refusal)
+
+    try:
+        job = enqueue_apply(db, t, batch, actor, wake=True)
+    except BatchNotApplicable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _job_dict(db, job)
+
+
+@router.get("/jobs/{job_id}")
+def api_job(job_id: str, db: Session = Depends(get_db), actor: str = Depends(api_actor)):
+    job = db.query(ApplyJob).filter(ApplyJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Apply job not found.")
+    return _job_dict(db, job)
+
+
+@router.get("/history")
+def api_history(
+    target_id: str | None = Query(default=None),
+    actor_filter: str | None = Query(default=None, alias="actor"),
+    operation: str | None = Query(default=None),
+    email: str | None = Query(default=None),
+    success: bool | None = Query(default=None),
+    batch_id: str | None = Query(default=None),
+    before: str | None = Query(default=None, description="next_before of the previous page"),
+    limit: int = Query(default=200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    actor: str = Depends(api_actor),
+):
+    """Audit entries, newest first, with secrets redacted."""
+    q = db.query(AuditLog)
+    if target_id:
+        q = q.filter(AuditLog.target_id == target_id)
+    if actor_filter:
+        q = q.filter(AuditLog.actor.ilike(f"%{actor_filter.strip()}%"))
+    if operation:
+        q = q.filter(AuditLog.operation.ilike(f"%{operation.strip()}%"))
+    if email:
+        q = q.filter(AuditLog.email.ilike(f"%{email.strip()}%"))
+    if batch_id:
+        q = q.filter(AuditLog.batch_id == batch_id.strip())
+    if success is not None:
+        q = q.filter(AuditLog.success == success)
+    if before:
+        ts_s, _, log_id = before.partition("|")
+        try:
+            ts = datetime.fromisoformat(ts_s)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid before cursor.")
+        q = q.filter(or_(AuditLog.ts < ts, and_(AuditLog.ts == ts, AuditLog.id < log_id)))
+
+    logs = q.order_by(AuditLog.ts.desc(), AuditLog.id.desc()).limit(limit).all()
+    entries = [
+        {
+            "id": log.id,
+            "ts": log.ts,
+            "actor": log.actor,
+            "target_id": log.target_id,
+            "batch_id": log.batch_id,
+            "row_id": log.row_id,
+            "email": log.email,
+            "operation": log.operation,
+            "success": log.success,
+            "error": log.error,
+            "request": redact(log.request or {}),
+            "response": redact(log.response or {}),
+        }
+        for log in logs
+    ]
+    next_before = f"{logs[-1].ts.isoformat()}|{logs[-1].id}" if len(logs) == limit else None
+    return {"entries": entries, "next_before": next_before}
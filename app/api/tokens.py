@@ -0,0 +1,42 @@
+"""
+API tokens: random bearer secrets of which only the sha256 is stored. Tokens
+are high-entropy, so a plain hash lookup is enough (no per-token salt).
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+
+from sqlalchemy.orm import Session
+
+from ..auth.models import ApiToken
+from ..importer.apply import now_utc
+
+TOKEN_PREFIX = "pba_"
+# last_used_at is informational; don't write it on every call
+_TOUCH_INTERVAL = timedelta(minutes=1)
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def create_token(db: Session, name: str, created_by: str) -> tuple[ApiToken, str]:
+    """Returns (row, token). The token itself is not stored; show it once. Commits."""
+    token = TOKEN_PREFIX + secrets.token_urlsafe(32)
+    row = ApiToken(name=name, token_sha256=_digest(token), token_prefix=token[:12], created_by=created_by)
+    db.add(row)
+    db.commit()
+    return row, token
+
+
+def verify_token(db: Session, token: str) -> ApiToken | None:
+    if not token.startswith(TOKEN_PREFIX):
+        return None
+    row = db.query(ApiToken).filter(ApiToken.token_sha256 == _digest(token)).first()
+    if row is None or row.revoked:
+        return None
+    now = now_utc()
+    if row.last_used_at is None or now - row.last_used_at > _TOUCH_INTERVAL:
+        row.last_used_at = now
+        db.commit()
+    return row
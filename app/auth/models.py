@@ -24,3 +24,21 @@ class Admin(Base):
 
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+
+class ApiToken(Base):
+    """Bearer token for the JSON API (/api/v1), managed from /superadmin."""
+    __tablename__ = "api_tokens"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    name: Mapped[str] = mapped_column(String)
+
+    # Only the sha256 of the token is kept; the prefix identifies it in the UI
+    token_sha256: Mapped[str] = mapped_column(String, unique=True, index=True)
+    token_prefix: Mapped[str] = mapped_column(String)
+
+    created_by: Mapped[str] = mapped_column(String, default="unknown")
+    revoked: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    last_used_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -8,6 +8,7 @@ from .models import Admin
 from .session import set_session, clear_session, get_session_username
 from ..crypto import decrypt_str
 from .totp import totp_now_ok
+from ..invalidation import publish
 
 router = APIRouter()
 
@@ -124,6 +125,7 @@ def change_password_post(
     admin.password_hash = argon2.hash(new_password)
     admin.force_password_change = False
     db.add(admin)
+    publish(db, "admin", admin.username)
     db.commit()
 
     return RedirectResponse(url="/targets", status_code=303)
@@ -0,0 +1,246 @@
+"""
+Headless entry point for bulk jobs (cron, scripts):
+
+  python -m app.cli targets
+  python -m app.cli export TARGET > users.jsonl
+  python -m app.cli preview TARGET users.csv [--mode sync] [--rows] [--apply]
+  python -m app.cli apply TARGET --batch BATCH_ID [--preview-sha256 HASH]
+
+TARGET is a target id or name; the CSV is read from a file or from stdin
+("-" or omitted). Results go to stdout as JSON lines, progress to stderr.
+Runs the same preview/apply pipeline as the web UI, so batches, rows and audit
+entries show up in History as usual (actor "cli:<user>" unless --actor is
+given). Applies go through the per-target queue like the web UI's.
+
+Exit status: 0 ok, 1 preview errors or failed rows, 2 bad arguments or target.
+"""
+import argparse
+import getpass
+import json
+import sys
+import time
+from typing import Any, TextIO
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .importer.models import ApplyJob, ImportBatch
+from .importer.queue import BatchNotApplicable, enqueue_apply, queue_position, run_next
+from .importer.service import PreviewOptions, apply_refusal, iter_batch_items, run_preview, summary_dict
+from .migrations import ensure_schema
+from .pritunl.store import ensure_fresh, iter_target_users
+from .settings import settings
+from .settings_service import get_cached_settings, guardrail_warnings
+from .targets.models import Target
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+class CliError(Exception):
+    """Bad arguments or target; reported on stderr with EXIT_USAGE."""
+
+
+class _Out:
+    def __init__(self, stream: TextIO, quiet: bool):
+        self.stream = stream
+        self.quiet = quiet
+        self.started = time.monotonic()
+
+    def emit(self, record: dict[str, Any]) -> None:
+        self.stream.write(json.dumps(record, default=str, separators=(",", ":")) + "\n")
+
+    def progress(self, msg: str) -> None:
+        if not self.quiet:
+            print(f"[{time.monotonic() - self.started:7.1f}s] {msg}", file=sys.stderr, flush=True)
+
+
+def _target(db: Session, ref: str) -> Target:
+    t = db.query(Target).filter(or_(Target.id == ref, Target.name == ref)).first()
+    if t is None:
+        raise CliError(f"Target '{ref}' not found.")
+    return t
+
+
+def _read_csv(path: str) -> bytes:
+    if path == "-":
+        return sys.stdin.buffer.read()
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError as e:
+        raise CliError(f"Cannot read {path}: {e}") from e
+
+
+def cmd_targets(db: Session, args: argparse.Namespace, out: _Out) -> int:
+    for t in db.query(Target).order_by(Target.name.asc()).all():
+        out.emit({"id": t.id, "name": t.name, "base_url": t.base_url, "auth_mode": t.auth_mode, "org_name": t.org_name or ""})
+    return EXIT_OK
+
+
+def cmd_export(db: Session, args: argparse.Namespace, out: _Out) -> int:
+    t = _target(db, args.target)
+    out.progress(f"checking user store of '{t.name}'")
+    sync = ensure_fresh(db, t)
+    org_names = {o["id"]: o.get("name") or "" for o in (sync.orgs or [])}
+
+    n = 0
+    for n, u in enumerate(iter_target_users(db, t.id), start=1):
+        out.emit({**u, "org": org_names.get(u["organization"], "")})
+        if n % 10000 == 0:
+            out.progress(f"{n} users")
+    out.progress(f"exported {n} users")
+    return EXIT_OK
+
+
+def cmd_preview(db: Session, args: argparse.Namespace, out: _Out) -> int:
+    t = _target(db, args.target)
+    csv_bytes = _read_csv(args.csv)
+    options = PreviewOptions(mode=args.mode, disable_missing=args.disable_missing, base_batch_id=args.base_batch)
+
+    out.progress(f"previewing {len(csv_bytes)} bytes against '{t.name}'")
+    try:
+        outcome = run_preview(db, t, csv_bytes, args.actor, options=options)
+    except (ValueError, RuntimeError) as e:
+        raise CliError(str(e)) from e
+    batch = outcome.batch
+    _warn, warn_msgs = guardrail_warnings(get_cached_settings(db), outcome.summary)
+    out.progress(
+        f"batch {batch.id}: {outcome.summary.total_rows} rows, {outcome.summary.actioned_rows} actioned, "
+        f"{outcome.summary.errors} errors{' (reused earlier preview)' if outcome.reused else ''}"
+    )
+    for msg in warn_msgs:
+        out.progress(f"warning: {msg}")
+
+    if args.rows:
+        for _r, it in iter_batch_items(db, batch):
+            out.emit({
+                "type": "row", "row": it.row, "action": it.action, "email": it.email, "status": it.status,
+                "will_apply": it.will_apply, "before": it.before, "after": it.after, "error": it.error,
+            })
+
+    out.emit({
+        "type": "preview",
+        "target": t.name,
+        "batch_id": batch.id,
+        "preview_sha256": outcome.preview_sha256,
+        "reused": outcome.reused,
+        "summary": summary_dict(outcome.summary),
+        "warnings": warn_msgs,
+    })
+
+    if outcome.summary.errors:
+        return EXIT_FAILED
+    if args.apply:
+        if outcome.summary.actioned_rows == 0:
+            out.progress("nothing to apply")
+            return EXIT_OK
+        return _apply(db, t, batch, outcome.preview_sha256, args, out)
+    return EXIT_OK
+
+
+def cmd_apply(db: Session, args: argparse.Namespace, out: _Out) -> int:
+    t = _target(db, args.target)
+    batch = db.query(ImportBatch).filter(ImportBatch.id == args.batch, ImportBatch.target_id == t.id).first()
+    if batch is None:
+        raise CliError(f"Batch '{args.batch}' not found for target '{t.name}'.")
+    return _apply(db, t, batch, args.preview_sha256, args, out)
+
+
+def _apply(db: Session, t: Target, batch: ImportBatch, preview_sha256: str | None, args: argparse.Namespace, out: _Out) -> int:
+    refusal = apply_refusal(batch, preview_sha256)
+    if refusal:
+        raise CliError(refusal)
+
+    try:
+        job = enqueue_apply(db, t, batch, args.actor)
+    except BatchNotApplicable as e:
+        raise CliError(str(e)) from e
+    job_id = job.id
+    out.progress(f"apply job {job_id} for batch {batch.id} ({job.rows} rows)")
+
+    # Run it here as soon as it is next in line; a web worker's queue runner may also pick it up
+    while True:
+        run_next(db, t.id, only=job_id)
+        job = db.get(ApplyJob, job_id, populate_existing=True)
+        if job.status not in {"queued", "running"}:
+            break
+        if job.status == "queued":
+            pos = queue_position(db, job)
+            out.progress(f"queued behind {pos['ahead']} apply(s), estimated start in {pos['eta_s']:.0f}s")
+        else:
+            out.progress("running in another process")
+        db.rollback()
+        time.sleep(settings.apply_queue_poll_s)
+
+    if job.status == "error":
+        out.emit({"type": "apply", "batch_id": batch.id, "job_id": job_id, "status": job.status, "error": job.error})
+        return EXIT_FAILED
+
+    for r, _it in iter_batch_items(db, batch):
+        out.emit({
+            "type": "row", "row": r.row_num, "action": (r.action or "").strip().lower(), "email": r.email,
+            "apply_status": r.apply_status, "result": r.apply_result,
+        })
+    results = job.results or {}
+    out.emit({"type": "apply", "batch_id": batch.id, "job_id": job_id, "status": job.status, **results})
+    out.progress(
+        f"{results.get('applied', 0)} applied, {results.get('skipped', 0)} skipped, {results.get('failed', 0)} failed"
+        + (f", {len(results['drifted'])} drifted since preview" if results.get("drifted") else "")
+    )
+    return EXIT_OK if job.status == "applied" else EXIT_FAILED
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m app.cli", description="Bulk export/preview/apply without the web UI.")
+    p.add_argument("--actor", default=f"cli:{getpass.getuser()}", help="name recorded in batches and audit entries")
+    p.add_argument("--quiet", action="store_true", help="no progress on stderr")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("targets", help="list targets")
+
+    sp = sub.add_parser("export", help="stream a target's users")
+    sp.add_argument("target", help="target id or name")
+
+    sp = sub.add_parser("preview", help="preview a CSV (optionally apply it)")
+    sp.add_argument("target", help="target id or name")
+    sp.add_argument("csv", nargs="?", default="-", help="CSV file, or - for stdin (default)")
+    sp.add_argument("--mode", default="actions", choices=("actions", "sync"))
+    sp.add_argument("--disable-missing", action="store_true", help="sync mode: disable users missing from the file")
+    sp.add_argument("--base-batch", default=None, help="actions mode: delta preview against this batch")
+    sp.add_argument("--rows", action="store_true", help="also emit every evaluated row")
+    sp.add_argument("--apply", action="store_true", help="apply right away when the preview has no errors")
+
+    sp = sub.add_parser("apply", help="apply a previewed batch")
+    sp.add_argument("target", help="target id or name")
+    sp.add_argument("--batch", required=True)
+    sp.add_argument("--preview-sha256", default=None, help="refuse unless the batch's plan hash matches")
+    return p
+
+
+COMMANDS = {
+    "targets": cmd_targets,
+    "export": cmd_export,
+    "preview": cmd_preview,
+    "apply": cmd_apply,
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    out = _Out(sys.stdout, args.quiet)
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        return COMMANDS[args.command](db, args, out)
+    except CliError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Response compression for HTML, CSV and JSON.
+
+Pure ASGI middleware: picks brotli when the client accepts it and the optional
+`brotli` package is installed, else gzip. Complete bodies smaller than
+COMPRESSION_MIN_SIZE are sent as is; streamed bodies (exports) are compressed
+chunk by chunk and flushed after each one so downloads still progress.
+"""
+import zlib
+from typing import Any
+
+from .settings import settings
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+_COMPRESSIBLE = ("text/html", "text/csv", "text/plain", "application/json", "application/x-ndjson")
+
+
+def _accepted(scope: dict[str, Any]) -> set[str]:
+    for k, v in scope.get("headers", []):
+        if k == b"accept-encoding":
+            out = set()
+            for part in v.decode("latin-1").split(","):
+                name, *params = part.split(";")
+                q = 1.0
+                for p in params:
+                    key, _, val = p.strip().partition("=")
+                    if key == "q":
+                        try:
+                            q = float(val)
+                        except ValueError:
+                            q = 0.0
+                if q > 0:
+                    out.add(name.strip().lower())
+            return out
+    return set()
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=settings.compression_brotli_quality)
+        else:
+            self._c = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.finish()
+        return self._c.compress(data) + self._c.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = _accepted(scope)
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start: dict[str, Any] | None = None
+        encoder: _Encoder | None = None
+        passthrough = False
+
+        async def send_wrapper(message: dict[str, Any]) -> None:
+            nonlocal start, encoder, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                ctype = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip().lower()
+                passthrough = (
+                    ctype not in _COMPRESSIBLE
+                    or b"content-encoding" in headers
+                    or message["status"] in (204, 304)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message  # held until we know the body size
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+
+            if start is not None:
+                held, start = start, None
+                if not more and len(body) < settings.compression_min_size:
+                    passthrough = True
+                    await send(held)
+                    await send(message)
+                    return
+                encoder = _Encoder(encoding)
+                headers = [(k, v) for k, v in held.get("headers", []) if k.lower() not in (b"content-length", b"vary")]
+                vary = [v for k, v in held.get("headers", []) if k.lower() == b"vary"]
+                headers.append((b"content-encoding", encoding.encode("ascii")))
+                headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+                if not more:
+                    body = encoder.finish(body)
+                    headers.append((b"content-length", str(len(body)).encode("ascii")))
+                    await send({**held, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send({**held, "headers": headers})
+
+            data = encoder.chunk(body) if more else encoder.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
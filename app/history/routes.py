@@ -24,7 +24,7 @@ REDACT_KEYS = {
 }
 
 
-def _redact(obj):
+def redact(obj):
     """Recursively redact sensitive fields before displaying in UI."""
     if isinstance(obj, dict):
         out = {}
@@ -33,10 +33,10 @@ def _redact(obj):
             if lk in REDACT_KEYS or any(x in lk for x in ["password", "secret", "token", "auth", "cookie"]):
                 out[k] = "***REDACTED***"
             else:
-                out[k] = _redact(v)
+                out[k] = redact(v)
         return out
     if isinstance(obj, list):
-        return [_redact(x) for x in obj]
+        return [redact(x) for x in obj]
     return obj
 
 
@@ -113,8 +113,8 @@ def history_detail(request: Request, log_id: str, db: Session = Depends(get_db))
     target = db.query(Target).filter(Target.id == log.target_id).first()
     target_name = target.name if target else log.target_id
 
-    safe_request = _redact(log.request or {})
-    safe_response = _redact(log.response or {})
+    safe_request = redact(log.request or {})
+    safe_response = redact(log.response or {})
 
     return _templates(request).TemplateResponse(
         "history_detail.html",
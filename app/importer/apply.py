@@ -1,10 +1,12 @@
 import hashlib
 import json
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Iterator
 
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+
+from ..db import engine
 
 
 def sha256_hex(b: bytes) -> str:
@@ -24,14 +26,26 @@ def advisory_lock_key_from_str(s: str) -> int:
     return n
 
 
-def acquire_target_lock(db: Session, target_id: str):
-    k = advisory_lock_key_from_str(target_id)
-    db.execute(text("SELECT pg_advisory_lock(:k)"), {"k": k})
+class TargetBusy(RuntimeError):
+    """Another apply holds the target's lock."""
 
 
-def release_target_lock(db: Session, target_id: str):
+@contextmanager
+def target_lock(target_id: str) -> Iterator[None]:
+    """
+    Per-target apply lock. Never waits: raises TargetBusy when it is held
+    (callers queue the apply instead, see app/importer/queue.py). The lock
+    lives on a dedicated connection, so it is not lost or leaked when the ORM
+    session hands its connection back to the pool on commit.
+    """
     k = advisory_lock_key_from_str(target_id)
-    db.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": k})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": k}).scalar():
+            raise TargetBusy("Another apply is running for this target.")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": k})
 
 
 def now_utc():
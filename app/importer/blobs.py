@@ -0,0 +1,58 @@
+"""
+Content-addressed storage for uploaded CSVs.
+
+Each distinct upload is stored once in content_blobs, keyed by the sha256 of
+its bytes (the batch's csv_sha256) and compressed with zlib at level 1, which
+is fast and shrinks CSV exports several times over. Re-previewing the same
+file adds a batch row but no new payload. Payloads are only read (and
+decompressed) when a batch's upload is asked for again.
+"""
+import zlib
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .apply import sha256_hex
+from .models import ContentBlob, ImportBatch
+
+# Speed over ratio: compression runs inside the preview request
+_ZLIB_LEVEL = 1
+
+
+def put_blob(db: Session, data: bytes, kind: str = "csv") -> str:
+    """Store data unless already present. Returns its sha256. Runs in the caller's transaction."""
+    sha = sha256_hex(data)
+    if db.execute(select(ContentBlob.sha256).where(ContentBlob.sha256 == sha)).first():
+        return sha
+
+    packed = zlib.compress(data, _ZLIB_LEVEL)
+    codec = "zlib"
+    if len(packed) >= len(data):
+        packed, codec = data, "none"
+
+    db.execute(
+        pg_insert(ContentBlob)
+        .values(sha256=sha, kind=kind, codec=codec, size=len(data), stored_size=len(packed), data=packed)
+        .on_conflict_do_nothing(index_elements=[ContentBlob.sha256])
+    )
+    return sha
+
+
+def get_blob(db: Session, sha256: str) -> bytes | None:
+    row = db.execute(select(ContentBlob.codec, ContentBlob.data).where(ContentBlob.sha256 == sha256)).first()
+    if row is None:
+        return None
+    if row.codec == "zlib":
+        return zlib.decompress(row.data)
+    if row.codec == "none":
+        return row.data
+    raise RuntimeError(f"Unknown blob codec '{row.codec}'")
+
+
+def batch_csv(db: Session, batch: ImportBatch) -> bytes | None:
+    """The batch's original upload; older batches still carry it inline."""
+    data = get_blob(db, batch.csv_sha256)
+    if data is None:
+        data = batch.csv_bytes
+    return data
@@ -0,0 +1,39 @@
+"""
+Canonical user comparison shared by preview and apply.
+
+Pritunl returns groups in whatever order they were saved and the CSV may list
+them in any order or case; disabled may come back as a bool or a string.
+Comparisons go through these helpers so a reordered groups cell or a
+"True"/true difference is a no-op rather than a write.
+"""
+from typing import Any
+
+_TRUE_STRINGS = {"true", "1", "yes", "y", "on", "disabled"}
+
+
+def canonical_bool(v: Any) -> bool:
+    if isinstance(v, bool):
+        return v
+    if v is None:
+        return False
+    if isinstance(v, (int, float)):
+        return v != 0
+    return str(v).strip().lower() in _TRUE_STRINGS
+
+
+def canonical_groups(groups: Any) -> frozenset[str]:
+    """List or comma-separated string -> set of stripped, case-folded names."""
+    if groups is None:
+        return frozenset()
+    if isinstance(groups, str):
+        groups = groups.split(",")
+    return frozenset(s for s in (str(g).strip().casefold() for g in groups) if s)
+
+
+def same_groups(a: Any, b: Any) -> bool:
+    return canonical_groups(a) == canonical_groups(b)
+
+
+def same_disabled(a: Any, b: Any) -> bool:
+    return canonical_bool(a) == canonical_bool(b)
+
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import String, Boolean, DateTime, func, LargeBinary, Integer
+from sqlalchemy import String, Boolean, DateTime, Index, func, LargeBinary, Integer
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -14,11 +14,12 @@ class ImportBatch(Base):
     target_id: Mapped[str] = mapped_column(String, index=True)
     created_by: Mapped[str] = mapped_column(String, default="unknown")
 
-    status: Mapped[str] = mapped_column(String, default="previewed")  # previewed|applying|applied|failed
+    status: Mapped[str] = mapped_column(String, default="previewed")  # previewed|queued|applying|applied|failed
 
-    # Immutable snapshot
+    # Immutable snapshot: the upload lives in content_blobs under csv_sha256
     csv_sha256: Mapped[str] = mapped_column(String, index=True)
-    csv_bytes: Mapped[bytes] = mapped_column(LargeBinary)
+    # Only batches created before content_blobs carry their upload inline
+    csv_bytes: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True, deferred=True)
 
     # Hash of the preview plan shown to the user (prevents tampering)
     preview_sha256: Mapped[str] = mapped_column(String, index=True)
@@ -53,6 +54,16 @@ class ImportRow(Base):
 
     will_apply: Mapped[bool] = mapped_column(Boolean, default=False)
 
+    # Content hashes of the CSV row and of the user it was evaluated against (delta previews)
+    row_hash: Mapped[str | None] = mapped_column(String, nullable=True)
+    user_hash: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    # Pritunl id of the user the row was evaluated against. When derived is
+    # set, before/after are empty and rendered from desired/diff plus that
+    # user's preview-time state (batch meta "users_blob").
+    user_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    derived: Mapped[bool] = mapped_column(Boolean, default=False)
+
     apply_status: Mapped[str] = mapped_column(String, default="pending")  # pending|skipped|applied|failed
     apply_result: Mapped[dict] = mapped_column(JSONB, default=dict)
 
@@ -79,3 +90,43 @@ class AuditLog(Base):
 
     request: Mapped[dict] = mapped_column(JSONB, default=dict)
     response: Mapped[dict] = mapped_column(JSONB, default=dict)
+
+
+class ContentBlob(Base):
+    """Content-addressed, compressed payload (see app/importer/blobs.py)."""
+    __tablename__ = "content_blobs"
+
+    sha256: Mapped[str] = mapped_column(String, primary_key=True)  # of the uncompressed bytes
+    kind: Mapped[str] = mapped_column(String, default="csv")
+    codec: Mapped[str] = mapped_column(String, default="zlib")  # zlib|none
+
+    size: Mapped[int] = mapped_column(Integer)
+    stored_size: Mapped[int] = mapped_column(Integer)
+    data: Mapped[bytes] = mapped_column(LargeBinary, deferred=True)
+
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class ApplyJob(Base):
+    """One apply of a batch, queued behind the target's lock (see app/importer/queue.py)."""
+    __tablename__ = "apply_jobs"
+    __table_args__ = (
+        Index("ix_apply_jobs_target_status", "target_id", "status", "enqueued_at"),
+    )
+
+    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    target_id: Mapped[str] = mapped_column(String)
+    batch_id: Mapped[str] = mapped_column(String, index=True)
+    actor: Mapped[str] = mapped_column(String, default="unknown")
+
+    status: Mapped[str] = mapped_column(String, default="queued")  # queued|running|applied|failed|error
+    # Rows that will be written; the queue's start-time estimate is based on it
+    rows: Mapped[int] = mapped_column(Integer, default=0)
+
+    # Apply counts and drift; per-row outcomes stay on import_rows
+    results: Mapped[dict] = mapped_column(JSONB, default=dict)
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    enqueued_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
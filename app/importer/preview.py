@@ -1,12 +1,22 @@
 import csv
+import hashlib
 import io
+import json
 import uuid
-from dataclasses import dataclass
-from typing import Any
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Iterator
+
+from .canonical import canonical_bool, same_groups
 
 # User-facing actions (blank/skip rows are ignored)
 VALID_ACTIONS = {"create", "update", "disable", "enable", "delete", "skip", ""}
 
+_ACTION_COUNTERS = {"create": "creates", "update": "updates", "disable": "disables", "enable": "enables", "delete": "deletes"}
+
+# User fields a row evaluation reads
+_USER_HASH_FIELDS = ("id", "email", "name", "disabled", "groups")
+
 
 @dataclass
 class PreviewItem:
@@ -23,6 +33,16 @@ class PreviewItem:
     diff: dict[str, Any]
     will_apply: bool
 
+    # Content hashes used by delta previews (not part of the preview plan hash)
+    row_hash: str = ""
+    user_hash: str = ""
+    # Id of the user the row was evaluated against ("" = none); lets stored
+    # rows re-render before/after instead of keeping the strings
+    user_id: str = ""
+    # Copied by a delta preview from a stored derived row: before/after stay
+    # empty (also in the plan hash) and are rendered from user_id's state
+    derived: bool = False
+
 
 @dataclass
 class PreviewSummary:
@@ -36,6 +56,10 @@ class PreviewSummary:
     clears: int = 0
     skips: int = 0
     errors: int = 0
+    # Rows whose user is already in the requested state (never sent to Pritunl)
+    noops: int = 0
+    # Rows merged into a later row for the same email
+    folded: int = 0
 
 
 def _norm(s: Any) -> str:
@@ -76,18 +100,96 @@ def build_user_index_by_email(users: list[dict[str, Any]]) -> dict[str, dict[str
     return idx
 
 
-def preview_csv_against_users(
-    csv_bytes: bytes,
-    existing_users: list[dict[str, Any]],
-) -> tuple[str, PreviewSummary, list[PreviewItem], list[PreviewItem]]:
+class UserDirectory:
     """
-    Returns: job_id, summary, items_for_ui (first 200), full_items
+    A target's users across its orgs, looked up by (org id, email).
+
+    A row's org comes from its CSV org column, else the target's only org,
+    else the one org its email exists in.
     """
-    job_id = uuid.uuid4().hex
-    summary = PreviewSummary()
 
-    user_by_email = build_user_index_by_email(existing_users)
+    def __init__(self, orgs: list[dict[str, Any]] | None, users: list[dict[str, Any]]):
+        # Callers that only have a user list (benchmarks, tests) get one anonymous org
+        self.orgs = orgs or [{"id": "", "name": ""}]
+        self.org_names = {str(o.get("id") or ""): _norm(o.get("name")) for o in self.orgs}
+        self._ids_by_name = {name: oid for oid, name in self.org_names.items()}
+        self.by_org: dict[str, dict[str, dict[str, Any]]] = {oid: {} for oid in self.org_names}
+        self._orgs_by_email: dict[str, list[str]] = defaultdict(list)
+
+        single = next(iter(self.org_names)) if len(self.orgs) == 1 else None
+        for u in users:
+            email = _norm(u.get("email")).lower()
+            if not email:
+                continue
+            oid = single if single is not None else str(u.get("organization") or "")
+            idx = self.by_org.get(oid)
+            if idx is None or email in idx:
+                continue
+            idx[email] = u
+            self._orgs_by_email[email].append(oid)
+
+    @property
+    def multi_org(self) -> bool:
+        return len(self.orgs) > 1
+
+    def get(self, org_id: str | None, email: str) -> dict[str, Any] | None:
+        if org_id is None:
+            return None
+        return self.by_org.get(org_id, {}).get(email)
+
+    def resolve(self, email: str, org_cell: str, creating: bool) -> tuple[str | None, str | None]:
+        """Return (org_id, error). (None, None) means "no such user in any org"."""
+        if org_cell:
+            oid = self._ids_by_name.get(org_cell)
+            if oid is None:
+                return None, f"Org '{org_cell}' is not part of this target"
+            return oid, None
+        if not self.multi_org:
+            return next(iter(self.org_names)), None
+        found = self._orgs_by_email.get(email, [])
+        if len(found) == 1:
+            return found[0], None
+        if found:
+            names = ", ".join(self.org_names[o] for o in found)
+            return None, f"Email exists in several orgs ({names}); set the org column"
+        if creating:
+            return None, "Target has several orgs; set the org column for creates"
+        return None, None
+
+    def users(self) -> Iterator[tuple[str, str, dict[str, Any]]]:
+        for oid, idx in self.by_org.items():
+            for email, u in idx.items():
+                yield oid, email, u
+
 
+@dataclass
+class CsvRow:
+    row: int
+    action: str
+    email: str
+    username: str | None
+    groups_mode: str
+    groups_cell: str
+    org: str = ""
+
+    def content_hash(self) -> str:
+        """Identity of the row's content, independent of its position in the file."""
+        parts = [self.action, self.email, self.username or "", self.groups_mode, self.groups_cell]
+        if self.org:
+            parts.append(self.org)
+        raw = "\x1f".join(parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def user_state_hash(user: dict[str, Any] | None) -> str:
+    """Hash of the user fields a row evaluation depends on ("" = no such user)."""
+    if not user:
+        return ""
+    raw = json.dumps([user.get(f) for f in _USER_HASH_FIELDS], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def iter_csv_rows(csv_bytes: bytes) -> Iterator[CsvRow]:
     text = csv_bytes.decode("utf-8-sig", errors="replace")
     reader = csv.DictReader(io.StringIO(text))
 
@@ -98,147 +200,583 @@ def preview_csv_against_users(
         missing = ", ".join(sorted(required_cols - cols))
         raise ValueError(f"CSV missing required columns: {missing}. Required: action,email")
 
-    items: list[PreviewItem] = []
-
     for i, row in enumerate(reader, start=2):
-        summary.total_rows += 1
+        yield CsvRow(
+            row=i,
+            action=_norm(row.get("action")).lower(),
+            email=_norm(row.get("email")).lower(),
+            username=_norm(row.get("username")) or None,
+            # groups_mode is only "replace" or "clear" from a user POV.
+            # If blank/unknown => do not modify groups.
+            groups_mode=_norm(row.get("groups_mode")).lower(),
+            groups_cell=_norm(row.get("groups")),
+            org=_norm(row.get("org")),
+        )
 
-        action = _norm(row.get("action")).lower()
-        email = _norm(row.get("email")).lower()
-        username = _norm(row.get("username")) or None
 
-        # groups_mode is only "replace" or "clear" from a user POV.
-        # If blank/unknown => do not modify groups.
-        groups_mode = _norm(row.get("groups_mode")).lower()
-        groups_cell = _norm(row.get("groups"))
+def _noop(i: int, action: str, email: str, username: str | None, state: str, reason: str) -> PreviewItem:
+    return PreviewItem(i, action, email, username, "skip", state, state, None, {"email": email, "noop": reason}, {}, False)
 
-        if action not in VALID_ACTIONS:
-            items.append(PreviewItem(i, action, email, username, "error", "", "", f"Invalid action '{action}'", {}, {}, False))
-            continue
 
-        if action == "" or action == "skip":
+def summarize(items: list[PreviewItem]) -> PreviewSummary:
+    summary = PreviewSummary(total_rows=len(items))
+    for it in items:
+        if it.desired.get("noop"):
+            summary.noops += 1
+            continue
+        if it.desired.get("folded_into"):
+            summary.folded += 1
+            continue
+        if it.status == "skip":
             summary.skips += 1
-            items.append(PreviewItem(i, action or "skip", email, username, "skip", "", "", None, {}, {}, False))
             continue
-
-        if not email:
+        if it.status == "error":
             summary.errors += 1
-            items.append(PreviewItem(i, action, email, username, "error", "", "", "Missing email", {}, {}, False))
+
+        counter = _ACTION_COUNTERS.get(it.action)
+        if counter is None or not it.email:
             continue
+        summary.actioned_rows += 1
+        setattr(summary, counter, getattr(summary, counter) + 1)
 
-        existing = user_by_email.get(email)
-        before_str = _fmt_state(existing)
-        after_str = before_str
+        if it.status != "ok":
+            continue
+        # A combined update (sync mode, folded rows) also flips the disabled flag
+        if it.action == "update" and "disabled" in it.diff:
+            if it.diff["disabled"]["to"]:
+                summary.disables += 1
+            else:
+                summary.enables += 1
+        if it.action in {"create", "update"} and it.desired.get("groups_mode") == "clear":
+            summary.clears += 1
+    return summary
+
+
+def evaluate_row(r: CsvRow, existing: dict[str, Any] | None) -> PreviewItem:
+    i, action, email, username = r.row, r.action, r.email, r.username
+    groups_mode, groups_cell = r.groups_mode, r.groups_cell
+
+    if action not in VALID_ACTIONS:
+        return PreviewItem(i, action, email, username, "error", "", "", f"Invalid action '{action}'", {}, {}, False)
+
+    if action == "" or action == "skip":
+        return PreviewItem(i, action or "skip", email, username, "skip", "", "", None, {}, {}, False)
+
+    if not email:
+        return PreviewItem(i, action, email, username, "error", "", "", "Missing email", {}, {}, False)
+
+    before_str = _fmt_state(existing)
+    after_str = before_str
+
+    desired: dict[str, Any] = {
+        "email": email,
+        "groups_mode": groups_mode,
+        "groups_cell": groups_cell,
+    }
+    diff: dict[str, Any] = {}
+
+    # Determine proposed groups changes (only for create/update)
+    proposed_groups: list[str] | None = None
+    if action in {"create", "update"}:
+        if groups_mode == "clear":
+            proposed_groups = []
+        elif groups_mode == "replace":
+            if groups_cell != "":
+                proposed_groups = _split_groups(groups_cell)
+        else:
+            # blank/unknown => do not modify groups
+            proposed_groups = None
+
+    if action == "create":
+        if existing:
+            return PreviewItem(i, action, email, username, "error", before_str, "", "User already exists (email match)", {}, {}, False)
+        if not username:
+            return PreviewItem(i, action, email, username, "error", "(not found)", "", "Create requires username", {}, {}, False)
+
+        desired["username"] = username
+        desired["groups"] = proposed_groups or []
+        diff = {"create": True}
+        after_str = f"email={email}, name={username}, disabled=False, groups={','.join(desired['groups'])}"
+        return PreviewItem(i, action, email, username, "ok", "(not found)", after_str, None, desired, diff, True)
+
+    if action == "update":
+        if not existing:
+            return PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for update (email match)", {}, {}, False)
+
+        if proposed_groups is None:
+            return _noop(i, action, email, username, before_str, "no group change requested")
+        if same_groups(existing.get("groups"), proposed_groups):
+            return _noop(i, action, email, username, before_str, "groups already match")
+
+        # username is read-only: we do NOT propose name changes
+        if username:
+            desired["username_ignored"] = True
+
+        final_groups = existing.get("groups")
+        if proposed_groups is not None:
+            desired["groups"] = proposed_groups
+            diff["groups"] = {"from": existing.get("groups"), "to": proposed_groups}
+            final_groups = proposed_groups
+
+        if isinstance(final_groups, list):
+            final_groups_str = ",".join([str(g) for g in final_groups])
+        else:
+            final_groups_str = _norm(final_groups)
+
+        disabled = bool(existing.get("disabled", False))
+        after_str = f"email={email}, name={_norm(existing.get('name'))}, disabled={disabled}, groups={final_groups_str}"
+        return PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True)
+
+    if action == "disable":
+        if not existing:
+            return PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for disable (email match)", {}, {}, False)
+        if canonical_bool(existing.get("disabled")):
+            return _noop(i, action, email, username, before_str, "already disabled")
+        diff = {"disabled": {"from": False, "to": True}}
+        after_str = f"email={email}, name={_norm(existing.get('name'))}, disabled=True, groups={','.join(existing.get('groups') or []) if isinstance(existing.get('groups'), list) else _norm(existing.get('groups'))}"
+        return PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True)
+
+    if action == "enable":
+        if not existing:
+            return PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for enable (email match)", {}, {}, False)
+        if not canonical_bool(existing.get("disabled")):
+            return _noop(i, action, email, username, before_str, "already enabled")
+        diff = {"disabled": {"from": True, "to": False}}
+        after_str = f"email={email}, name={_norm(existing.get('name'))}, disabled=False, groups={','.join(existing.get('groups') or []) if isinstance(existing.get('groups'), list) else _norm(existing.get('groups'))}"
+        return PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True)
+
+    if action == "delete":
+        if not existing:
+            return PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for delete (email match)", {}, {}, False)
+        diff = {"delete": True}
+        after_str = "(deleted)"
+        return PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True)
+
+    return PreviewItem(i, action, email, username, "error", before_str, "", "Unhandled action", {}, {}, False)
+
+
+def describe_item(it: PreviewItem, user: dict[str, Any] | None) -> tuple[str, str]:
+    """
+    The before/after text of an ok or no-op row, rebuilt from its structured
+    desired/diff and the user it was evaluated against. Stored rows only drop
+    their strings when this reproduces them exactly (see _persist_preview).
+    """
+    before = _fmt_state(user)
+    if it.desired.get("noop"):
+        return before, before
+    if it.action == "create":
+        return before, _fmt_state({
+            "email": it.email,
+            "name": it.desired.get("username") or "",
+            "disabled": False,
+            "groups": it.desired.get("groups") or [],
+        })
+    if it.action == "delete":
+        return before, "(deleted)"
+    return before, _fmt_state(_state_after(user, it))
+
+
+def _state_after(existing: dict[str, Any] | None, it: PreviewItem) -> dict[str, Any] | None:
+    """The user as it will be once an ok row has been applied (None = gone/not created yet)."""
+    if existing is None or it.action == "delete":
+        return None
+    after = dict(existing)
+    if "groups" in it.desired:
+        after["groups"] = list(it.desired["groups"])
+    if it.action in {"disable", "enable"}:
+        after["disabled"] = it.action == "disable"
+    if "disabled" in it.desired:
+        after["disabled"] = bool(it.desired["disabled"])
+    return after
+
+
+def _evaluate_rows(
+    rows: list[CsvRow],
+    directory: UserDirectory,
+    reuse: Callable[[CsvRow, str, str], PreviewItem | None] | None = None,
+) -> list[PreviewItem]:
+    """
+    Evaluate rows in file order. Rows for a user (org, email) that appears
+    more than once are evaluated against the state left by the earlier rows
+    (and are never reused), so fold_repeated_emails can merge them afterwards.
+    """
+    resolved: list[tuple[CsvRow, str | None, str | None]] = []
+    for r in rows:
+        if r.email and r.action in _ACTION_COUNTERS:
+            oid, err = directory.resolve(r.email, r.org, creating=r.action == "create")
+        else:
+            oid, err = None, None
+        resolved.append((r, oid, err))
+
+    counts = Counter((oid, r.email) for r, oid, err in resolved if r.email and oid is not None)
+    repeated = {k for k, n in counts.items() if n > 1}
+    state: dict[tuple[str, str], dict[str, Any] | None] = {}
 
-        desired: dict[str, Any] = {
-            "email": email,
-            "groups_mode": groups_mode,
-            "groups_cell": groups_cell,
-        }
-        diff: dict[str, Any] = {}
+    items: list[PreviewItem] = []
+    for r, oid, err in resolved:
+        if err:
+            items.append(PreviewItem(r.row, r.action, r.email, r.username, "error", "", "", err, {}, {}, False))
+            continue
 
-        # Determine proposed groups changes (only for create/update)
-        proposed_groups: list[str] | None = None
-        if action in {"create", "update"}:
-            if groups_mode == "clear":
-                proposed_groups = []
-                summary.clears += 1
-            elif groups_mode == "replace":
-                if groups_cell != "":
-                    proposed_groups = _split_groups(groups_cell)
-            else:
-                # blank/unknown => do not modify groups
-                proposed_groups = None
-
-        if action == "create":
-            summary.actioned_rows += 1
-            summary.creates += 1
-            if existing:
-                summary.errors += 1
-                items.append(PreviewItem(i, action, email, username, "error", before_str, "", "User already exists (email match)", {}, {}, False))
-                continue
-            if not username:
-                summary.errors += 1
-                items.append(PreviewItem(i, action, email, username, "error", "(not found)", "", "Create requires username", {}, {}, False))
-                continue
+        key = (oid or "", r.email)
+        if key in repeated:
+            existing = state[key] if key in state else directory.get(oid, r.email)
+        else:
+            existing = directory.get(oid, r.email)
+        row_hash = r.content_hash()
+        user_hash = user_state_hash(existing)
+
+        it = None
+        if reuse is not None and key not in repeated:
+            it = reuse(r, row_hash, user_hash)
+        if it is None:
+            it = evaluate_row(r, existing)
+            it.row_hash = row_hash
+            it.user_hash = user_hash
+            it.user_id = str((existing or {}).get("id") or "")
+            if it.status == "ok" and oid:
+                it.desired["org_id"] = oid
+
+        # Nothing is simulated after a create: later rows still see "not found"
+        if key in repeated and it.status == "ok" and existing is not None:
+            state[key] = _state_after(existing, it)
+        items.append(it)
+
+    return fold_repeated_emails(items, directory, repeated)
+
+
+def fold_repeated_emails(
+    items: list[PreviewItem],
+    directory: UserDirectory,
+    keys: set[tuple[str, str]],
+) -> list[PreviewItem]:
+    """
+    Turn several ok rows for one user (org, email) into a single operation
+    from the live user to the final state. The last ok row carries the merged
+    operation (desired.folded_rows lists the others); earlier ones are marked
+    desired.folded_into and are not applied.
+    """
+    if not keys:
+        return items
 
-            desired["username"] = username
-            desired["groups"] = proposed_groups or []
-            diff = {"create": True}
-            after_str = f"email={email}, name={username}, disabled=False, groups={','.join(desired['groups'])}"
-            items.append(PreviewItem(i, action, email, username, "ok", "(not found)", after_str, None, desired, diff, True))
+    ok_by_key: dict[tuple[str, str], list[int]] = defaultdict(list)
+    for idx, it in enumerate(items):
+        key = (it.desired.get("org_id", ""), it.email)
+        if it.status == "ok" and key in keys:
+            ok_by_key[key].append(idx)
+
+    for (oid, email), idxs in ok_by_key.items():
+        if len(idxs) < 2:
+            continue
+        original = directory.get(oid, email)
+        if original is None:
             continue
 
-        if action == "update":
-            summary.actioned_rows += 1
-            summary.updates += 1
-            if not existing:
-                summary.errors += 1
-                items.append(PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for update (email match)", {}, {}, False))
-                continue
+        final: dict[str, Any] | None = original
+        for idx in idxs:
+            final = _state_after(final, items[idx])
+
+        carrier = items[idxs[-1]]
+        folded_rows = [items[idx].row for idx in idxs[:-1]]
+        for idx in idxs[:-1]:
+            it = items[idx]
+            it.status = "skip"
+            it.will_apply = False
+            it.after = f"(folded into row {carrier.row})"
+            it.desired = {"email": email, "folded_into": carrier.row}
+            it.diff = {}
+
+        # The carrier's user_hash describes the live user, not the simulated state
+        items[idxs[-1]] = replace(_folded_carrier(carrier, original, final, folded_rows, oid),
+                                  user_hash=user_state_hash(original))
+
+    return items
+
+
+def _folded_carrier(
+    carrier: PreviewItem,
+    original: dict[str, Any],
+    final: dict[str, Any] | None,
+    folded_rows: list[int],
+    org_id: str,
+) -> PreviewItem:
+    before_str = _fmt_state(original)
+    desired: dict[str, Any] = {"email": carrier.email, "folded_rows": folded_rows}
+    if org_id:
+        desired["org_id"] = org_id
+
+    if final is None:
+        return replace(carrier, action="delete", before=before_str, after="(deleted)", desired=desired, diff={"delete": True})
+
+    diff: dict[str, Any] = {}
+    groups_change = not same_groups(original.get("groups"), final.get("groups"))
+    status_change = canonical_bool(original.get("disabled")) != canonical_bool(final.get("disabled"))
+    if status_change:
+        diff["disabled"] = {"from": canonical_bool(original.get("disabled")), "to": canonical_bool(final.get("disabled"))}
+
+    if not groups_change and not status_change:
+        desired["noop"] = f"rows {', '.join(str(n) for n in folded_rows + [carrier.row])} cancel out"
+        return replace(carrier, status="skip", will_apply=False, before=before_str, after=before_str, desired=desired, diff={})
+
+    if groups_change:
+        groups = list(final.get("groups") or [])
+        desired.update({"groups_mode": "replace" if groups else "clear", "groups_cell": ",".join(groups), "groups": groups})
+        diff["groups"] = {"from": original.get("groups"), "to": groups}
+        if status_change:
+            desired["disabled"] = canonical_bool(final.get("disabled"))
+        action = "update"
+    else:
+        action = "disable" if canonical_bool(final.get("disabled")) else "enable"
+
+    return replace(carrier, action=action, before=before_str, after=_fmt_state(final), desired=desired, diff=diff)
 
-            # username is read-only: we do NOT propose name changes
-            if username:
-                desired["username_ignored"] = True
 
-            final_groups = existing.get("groups")
-            if proposed_groups is not None:
-                desired["groups"] = proposed_groups
-                diff["groups"] = {"from": existing.get("groups"), "to": proposed_groups}
-                final_groups = proposed_groups
+def preview_csv_against_users(
+    csv_bytes: bytes,
+    existing_users: list[dict[str, Any]],
+    orgs: list[dict[str, Any]] | None = None,
+) -> tuple[str, PreviewSummary, list[PreviewItem], list[PreviewItem]]:
+    """
+    Returns: job_id, summary, items_for_ui (first 200), full_items
+    """
+    job_id = uuid.uuid4().hex
+    directory = UserDirectory(orgs, existing_users)
 
-            if isinstance(final_groups, list):
-                final_groups_str = ",".join([str(g) for g in final_groups])
-            else:
-                final_groups_str = _norm(final_groups)
+    items = _evaluate_rows(list(iter_csv_rows(csv_bytes)), directory)
 
-            disabled = bool(existing.get("disabled", False))
-            after_str = f"email={email}, name={_norm(existing.get('name'))}, disabled={disabled}, groups={final_groups_str}"
-            items.append(PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True))
-            continue
+    summary = summarize(items)
+    return job_id, summary, items[:200], items
 
-        if action == "disable":
-            summary.actioned_rows += 1
-            summary.disables += 1
-            if not existing:
-                summary.errors += 1
-                items.append(PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for disable (email match)", {}, {}, False))
-                continue
-            diff = {"disabled": {"from": bool(existing.get("disabled", False)), "to": True}}
-            after_str = f"email={email}, name={_norm(existing.get('name'))}, disabled=True, groups={','.join(existing.get('groups') or []) if isinstance(existing.get('groups'), list) else _norm(existing.get('groups'))}"
-            items.append(PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True))
+
+@dataclass
+class DeltaStats:
+    base_batch_id: str
+    added: int = 0        # row content not in the base, email not in the base either
+    changed: int = 0      # row content not in the base, email was
+    unchanged: int = 0    # same row content and same user state: base evaluation reused
+    user_changed: int = 0  # same row content but the user changed since the base: re-evaluated
+    removed: int = 0      # emails in the base that are gone from this file
+    removed_emails: list[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class BaseRow:
+    """The part of a base batch row a delta preview matches on."""
+    row: int
+    row_hash: str
+    user_hash: str
+    email: str
+    # Folded rows describe a merge with other rows of the base file
+    folded: bool
+
+
+def preview_delta_against_users(
+    csv_bytes: bytes,
+    existing_users: list[dict[str, Any]],
+    base_batch_id: str,
+    base_rows: list[BaseRow],
+    load_items: Callable[[list[int]], list[PreviewItem]],
+    orgs: list[dict[str, Any]] | None = None,
+) -> tuple[PreviewSummary, list[PreviewItem], list[PreviewItem], DeltaStats]:
+    """
+    Like preview_csv_against_users, but rows whose content and user state match
+    a row of the base batch take the base evaluation instead of being
+    re-evaluated. The result is still the full plan for this file.
+
+    load_items(row_nums) returns the stored base rows with those numbers; it is
+    called once, for the base rows whose content reappears in this file.
+
+    Returns: summary, items_for_ui (new/changed rows first, max 200), full_items, stats
+    """
+    stats = DeltaStats(base_batch_id=base_batch_id)
+    directory = UserDirectory(orgs, existing_users)
+    rows = list(iter_csv_rows(csv_bytes))
+    hashes = {r.content_hash() for r in rows}
+
+    by_hash: dict[str, deque[BaseRow]] = defaultdict(deque)
+    base_emails: set[str] = set()
+    for b in sorted(base_rows, key=lambda b: b.row):
+        if b.email:
+            base_emails.add(b.email)
+        if not b.folded and b.row_hash in hashes:
+            by_hash[b.row_hash].append(b)
+
+    stored = {it.row: it for it in load_items([b.row for q in by_hash.values() for b in q])} if by_hash else {}
+    reused_rows: set[int] = set()
+
+    def reuse(r: CsvRow, row_hash: str, user_hash: str) -> PreviewItem | None:
+        candidates = by_hash.get(row_hash)
+        if candidates:
+            base = candidates.popleft()
+            if base.user_hash == user_hash:
+                stats.unchanged += 1
+                reused_rows.add(r.row)
+                return replace(stored[base.row], row=r.row)
+            stats.user_changed += 1
+        elif r.email in base_emails:
+            stats.changed += 1
+        else:
+            stats.added += 1
+        return None
+
+    items = _evaluate_rows(rows, directory, reuse=reuse)
+
+    # Rows evaluated without consulting the base (repeated emails) count as changed
+    stats.changed += len(rows) - stats.unchanged - stats.user_changed - stats.changed - stats.added
+
+    seen_emails = {r.email for r in rows if r.email}
+    stats.removed_emails = sorted(base_emails - seen_emails)
+    stats.removed = len(stats.removed_emails)
+
+    summary = summarize(items)
+    fresh = [it for it in items if it.row not in reused_rows]
+    ui = fresh[:200]
+    if len(ui) < 200:
+        ui += [it for it in items if it.row in reused_rows][: 200 - len(ui)]
+    return summary, ui, items, stats
+
+
+# Sync mode: status column values -> disabled
+SYNC_STATUSES = {"": False, "active": False, "enabled": False, "disabled": True, "inactive": True}
+
+
+def _sync_row_hash(*parts: str) -> str:
+    """CsvRow.content_hash for a sync row (or a disable-missing row)."""
+    return hashlib.sha256("\x1f".join(["sync", *parts]).encode("utf-8")).hexdigest()[:32]
+
+
+def preview_sync_against_users(
+    csv_bytes: bytes,
+    existing_users: list[dict[str, Any]],
+    disable_missing: bool = False,
+    manage_groups: bool = True,
+    orgs: list[dict[str, Any]] | None = None,
+) -> tuple[str, PreviewSummary, list[PreviewItem], list[PreviewItem]]:
+    """
+    Desired-state import: the CSV (email,name,groups,status - the export format
+    works as-is) is the complete roster. Each user gets at most one operation:
+    create, enable, disable, or an update that carries both the groups and the
+    disabled flag. Users already in the desired state are no-ops, as are
+    disabled users that do not exist yet. With disable_missing, enabled users
+    absent from the file get a disable row numbered after the last CSV row.
+    On a multi-org target an optional org column picks the org per row.
+
+    Returns: job_id, summary, items_for_ui (first 200), full_items
+    """
+    job_id = uuid.uuid4().hex
+
+    directory = UserDirectory(orgs, existing_users)
+
+    text = csv_bytes.decode("utf-8-sig", errors="replace")
+    reader = csv.DictReader(io.StringIO(text))
+    cols = set([c.strip().lower() for c in (reader.fieldnames or [])])
+    if "email" not in cols:
+        raise ValueError("Sync CSV missing required column: email. Columns: email,name,groups,status")
+
+    items: list[PreviewItem] = []
+    first_row: dict[tuple[str, str], int] = {}
+    last_row = 1
+
+    for i, row in enumerate(reader, start=2):
+        last_row = i
+
+        email = _norm(row.get("email")).lower()
+        name = _norm(row.get("name")) or _norm(row.get("username")) or None
+        status_cell = _norm(row.get("status")).lower()
+        groups_cell = _norm(row.get("groups"))
+
+        if not email:
+            items.append(PreviewItem(i, "sync", email, name, "error", "", "", "Missing email", {}, {}, False))
+            continue
+        if status_cell not in SYNC_STATUSES:
+            items.append(PreviewItem(i, "sync", email, name, "error", "", "", f"Invalid status '{status_cell}' (use active or disabled)", {}, {}, False))
             continue
+        want_disabled = SYNC_STATUSES[status_cell]
+        want_groups = _split_groups(groups_cell)
 
-        if action == "enable":
-            summary.actioned_rows += 1
-            summary.enables += 1
-            if not existing:
-                summary.errors += 1
-                items.append(PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for enable (email match)", {}, {}, False))
-                continue
-            diff = {"disabled": {"from": bool(existing.get("disabled", False)), "to": False}}
-            after_str = f"email={email}, name={_norm(existing.get('name'))}, disabled=False, groups={','.join(existing.get('groups') or []) if isinstance(existing.get('groups'), list) else _norm(existing.get('groups'))}"
-            items.append(PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True))
+        org_id, org_err = directory.resolve(email, _norm(row.get("org")), creating=not want_disabled)
+        if org_err:
+            items.append(PreviewItem(i, "sync", email, name, "error", "", "", org_err, {}, {}, False))
+            continue
+        key = (org_id or "", email)
+        if key in first_row:
+            items.append(PreviewItem(i, "sync", email, name, "error", "", "", f"Duplicate email (first at row {first_row[key]})", {}, {}, False))
             continue
+        first_row[key] = i
+
+        existing = directory.get(org_id, email)
+        before_str = _fmt_state(existing)
 
-        if action == "delete":
-            summary.actioned_rows += 1
-            summary.deletes += 1
-            if not existing:
-                summary.errors += 1
-                items.append(PreviewItem(i, action, email, username, "error", "(not found)", "", "User not found for delete (email match)", {}, {}, False))
+        if not existing:
+            if want_disabled:
+                items.append(_noop(i, "sync", email, name, "(not found)", "absent and desired disabled"))
+                continue
+            if not name:
+                items.append(PreviewItem(i, "create", email, name, "error", "(not found)", "", "Create requires name", {}, {}, False))
                 continue
-            diff = {"delete": True}
-            after_str = "(deleted)"
-            items.append(PreviewItem(i, action, email, username, "ok", before_str, after_str, None, desired, diff, True))
+            desired = {"email": email, "username": name, "groups_mode": "replace", "groups_cell": groups_cell,
+                       "groups": want_groups if manage_groups else []}
+            if org_id:
+                desired["org_id"] = org_id
+            after_str = _fmt_state({"email": email, "name": name, "disabled": False, "groups": desired["groups"]})
+            items.append(PreviewItem(i, "create", email, name, "ok", "(not found)", after_str, None, desired, {"create": True}, True,
+                                     row_hash=_sync_row_hash(email, name, groups_cell, status_cell, org_id or ""),
+                                     user_hash=user_state_hash(None)))
             continue
 
-        summary.errors += 1
-        items.append(PreviewItem(i, action, email, username, "error", before_str, "", "Unhandled action", {}, {}, False))
+        have_disabled = canonical_bool(existing.get("disabled"))
+        groups_change = manage_groups and not same_groups(existing.get("groups"), want_groups)
+        status_change = want_disabled != have_disabled
 
-    summary.errors = sum(1 for it in items if it.status == "error")
-    summary.skips = sum(1 for it in items if it.status == "skip")
+        desired = {"email": email}
+        if org_id:
+            desired["org_id"] = org_id
+        if name and name != _norm(existing.get("name")):
+            # username is read-only: we do NOT propose name changes
+            desired["username_ignored"] = True
 
+        if not groups_change and not status_change:
+            it = _noop(i, "sync", email, name, before_str, "in sync")
+            it.user_id = str(existing.get("id") or "")
+            items.append(it)
+            continue
+
+        diff: dict[str, Any] = {}
+        if status_change:
+            diff["disabled"] = {"from": have_disabled, "to": want_disabled}
+
+        if groups_change:
+            desired.update({"groups_mode": "replace" if want_groups else "clear", "groups_cell": groups_cell, "groups": want_groups})
+            diff["groups"] = {"from": existing.get("groups"), "to": want_groups}
+            if status_change:
+                desired["disabled"] = want_disabled
+            action = "update"
+        else:
+            action = "disable" if want_disabled else "enable"
+
+        after_str = _fmt_state({**existing, "disabled": want_disabled, "groups": want_groups if groups_change else existing.get("groups")})
+        items.append(PreviewItem(i, action, email, name, "ok", before_str, after_str, None, desired, diff, True,
+                                 row_hash=_sync_row_hash(email, name or "", groups_cell, status_cell, org_id or ""),
+                                 user_hash=user_state_hash(existing), user_id=str(existing.get("id") or "")))
+
+    if disable_missing:
+        n = last_row
+        for org_id, email, u in directory.users():
+            if (org_id, email) in first_row or canonical_bool(u.get("disabled")):
+                continue
+            n += 1
+            desired = {"email": email, "reason": "not in sync file"}
+            if org_id:
+                desired["org_id"] = org_id
+            after_str = _fmt_state({**u, "disabled": True})
+            items.append(PreviewItem(
+                n, "disable", email, _norm(u.get("name")) or None, "ok", _fmt_state(u), after_str, None,
+                desired, {"disabled": {"from": False, "to": True}}, True,
+                row_hash=_sync_row_hash("missing", email, org_id or ""), user_hash=user_state_hash(u),
+                user_id=str(u.get("id") or ""),
+            ))
+
+    summary = summarize(items)
     return job_id, summary, items[:200], items
 
 
@@ -0,0 +1,255 @@
+"""
+Per-target apply queue.
+
+Only one apply runs per target at a time (target_lock). The lock is only ever
+tried, never waited on, so a busy target no longer parks a worker thread and
+a pooled connection. An apply is recorded as an apply_jobs row instead: it
+runs inside the request when its target is idle, otherwise a queue runner
+picks it up once the apply ahead of it finishes. Jobs of one target run in
+the order they were queued.
+
+Every worker runs one runner thread (APPLY_RUNNER). It wakes on an
+"apply_queue" invalidation, published whenever a job finishes or is queued
+for runners only (the JSON API), and otherwise polls every
+APPLY_QUEUE_POLL_S. A job left "running" by a worker that died is marked as
+an error by the next job of its target: whoever holds the lock knows nothing
+else is running there.
+
+A batch is queued at most once: enqueue_apply moves it to "queued" with a
+conditional UPDATE, so of two concurrent submits (UI, CLI, API) only one
+gets a job, and a job whose batch is no longer "queued" is not run.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..db import SessionLocal
+from ..invalidation import publish, register_handler
+from ..settings import settings
+from ..targets.models import Target
+from .apply import TargetBusy, now_utc, target_lock
+from .models import ApplyJob, ImportBatch, ImportRow
+from .service import apply_locked
+
+log = logging.getLogger(__name__)
+
+# Seconds per applied row assumed until a target has finished jobs to learn from
+_DEFAULT_ROW_SECONDS = 0.25
+_ETA_SAMPLE = 20
+
+# Batch statuses apply_refusal lets through
+_APPLICABLE = ("previewed", "failed")
+
+
+class BatchNotApplicable(RuntimeError):
+    """The batch was queued or applied by someone else since it was validated."""
+
+
+def enqueue_apply(db: Session, target: Target, batch: ImportBatch, actor: str, wake: bool = False) -> ApplyJob:
+    """
+    Queue a validated batch for apply. Commits. Pass wake=True when the caller
+    will not try run_next itself, so a runner starts the job right away.
+    Raises BatchNotApplicable when a concurrent submit queued the batch first.
+    """
+    claimed = db.execute(
+        update(ImportBatch)
+        .where(ImportBatch.id == batch.id, ImportBatch.status.in_(_APPLICABLE))
+        .values(status="queued")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        db.refresh(batch)
+        raise BatchNotApplicable(f"Batch status is '{batch.status}', cannot apply.")
+
+    rows = db.execute(
+        select(func.count()).select_from(ImportRow).where(ImportRow.batch_id == batch.id, ImportRow.will_apply.is_(True))
+    ).scalar() or 0
+    job = ApplyJob(target_id=target.id, batch_id=batch.id, actor=actor, rows=int(rows))
+    db.add(job)
+    db.commit()
+    if wake:
+        # After the commit: this worker's runner wakes immediately and must see the job
+        publish(db, "apply_queue", target.id)
+        db.commit()
+    return job
+
+
+def _reap_orphans(db: Session, target_id: str) -> None:
+    """Jobs still "running" while we hold the target's lock lost their worker."""
+    orphans = db.execute(
+        select(ApplyJob).where(ApplyJob.target_id == target_id, ApplyJob.status == "running")
+    ).scalars().all()
+    for job in orphans:
+        job.status = "error"
+        job.error = "worker stopped during apply"
+        job.finished_at = now_utc()
+        db.execute(update(ImportBatch).where(ImportBatch.id == job.batch_id).values(status="failed"))
+    if orphans:
+        db.commit()
+
+
+def _head(db: Session, target_id: str) -> ApplyJob | None:
+    return db.execute(
+        select(ApplyJob)
+        .where(ApplyJob.target_id == target_id, ApplyJob.status == "queued")
+        .order_by(ApplyJob.enqueued_at.asc(), ApplyJob.id.asc())
+        .limit(1)
+    ).scalars().first()
+
+
+def _execute(db: Session, job: ApplyJob) -> None:
+    batch = db.get(ImportBatch, job.batch_id, populate_existing=True)
+    if batch is not None and batch.status != "queued":
+        # Another job already took this batch; running it again would re-apply it
+        job.status = "error"
+        job.error = f"batch is '{batch.status}', not queued: not applied again"
+        job.finished_at = now_utc()
+        db.add(job)
+        publish(db, "apply_queue", job.target_id)
+        db.commit()
+        return
+
+    job.status = "running"
+    job.started_at = now_utc()
+    db.add(job)
+    db.commit()
+
+    job_id = job.id
+    try:
+        target = db.get(Target, job.target_id)
+        batch = db.get(ImportBatch, job.batch_id)
+        if target is None or batch is None:
+            raise RuntimeError("target or batch no longer exists")
+        results, _ = apply_locked(db, target, batch, job.actor)
+        job.status = "applied" if results["failed"] == 0 else "failed"
+        job.results = {k: v for k, v in results.items() if k != "details"}
+    except Exception as e:
+        log.exception("apply job %s failed", job_id)
+        db.rollback()
+        job = db.get(ApplyJob, job_id)
+        job.status = "error"
+        job.error = str(e)
+        db.execute(update(ImportBatch).where(ImportBatch.id == job.batch_id).values(status="failed"))
+
+    job.finished_at = now_utc()
+    db.add(job)
+    publish(db, "apply_queue", job.target_id)
+    db.commit()
+
+
+def run_next(db: Session, target_id: str, only: str | None = None) -> ApplyJob | None:
+    """
+    Run the target's oldest queued job if its lock is free (when only is
+    given, just that job, and only if it is next in line). Returns the job
+    that ran, or None.
+    """
+    try:
+        with target_lock(target_id):
+            _reap_orphans(db, target_id)
+            job = _head(db, target_id)
+            if job is None or (only is not None and job.id != only):
+                return None
+            _execute(db, job)
+            return job
+    except TargetBusy:
+        return None
+
+
+def run_pending(db: Session) -> int:
+    """Run the queued jobs of every idle target, in order. Returns how many ran."""
+    ran = 0
+    target_ids = db.execute(select(ApplyJob.target_id).where(ApplyJob.status == "queued").distinct()).scalars().all()
+    db.rollback()
+    for target_id in target_ids:
+        while run_next(db, target_id) is not None:
+            ran += 1
+    return ran
+
+
+def _row_seconds(db: Session, target_id: str) -> float:
+    """Average seconds per row over the target's recent finished jobs."""
+    recent = db.execute(
+        select(ApplyJob.rows, ApplyJob.started_at, ApplyJob.finished_at)
+        .where(
+            ApplyJob.target_id == target_id,
+            ApplyJob.status.in_(("applied", "failed")),
+            ApplyJob.started_at.is_not(None),
+            ApplyJob.finished_at.is_not(None),
+        )
+        .order_by(ApplyJob.finished_at.desc())
+        .limit(_ETA_SAMPLE)
+    ).all()
+    rows = sum(r.rows for r in recent)
+    if rows <= 0:
+        return _DEFAULT_ROW_SECONDS
+    return sum((r.finished_at - r.started_at).total_seconds() for r in recent) / rows
+
+
+def queue_position(db: Session, job: ApplyJob) -> dict[str, Any]:
+    """
+    Where a queued job stands: {"ahead": jobs before it (running included),
+    "eta_s": estimated seconds until it starts, "starts_at": that as a time}.
+    """
+    ahead = db.execute(
+        select(ApplyJob)
+        .where(
+            ApplyJob.target_id == job.target_id,
+            (ApplyJob.status == "running")
+            | ((ApplyJob.status == "queued") & ((ApplyJob.enqueued_at < job.enqueued_at)
+                                               | ((ApplyJob.enqueued_at == job.enqueued_at) & (ApplyJob.id < job.id)))),
+        )
+    ).scalars().all()
+
+    per_row = _row_seconds(db, job.target_id)
+    now = now_utc()
+    eta = 0.0
+    for other in ahead:
+        cost = other.rows * per_row
+        if other.status == "running" and other.started_at is not None:
+            cost -= (now - other.started_at).total_seconds()
+        eta += max(0.0, cost)
+
+    starts_at: datetime = now + timedelta(seconds=eta)
+    return {"ahead": len(ahead), "eta_s": round(eta, 1), "starts_at": starts_at}
+
+
+_runner: threading.Thread | None = None
+_wake = threading.Event()
+_stop = threading.Event()
+
+
+def _on_queue_change(_key: str | None) -> None:
+    _wake.set()
+
+
+register_handler("apply_queue", _on_queue_change)
+
+
+def _run_forever() -> None:
+    while not _stop.is_set():
+        _wake.clear()
+        try:
+            with SessionLocal() as db:
+                run_pending(db)
+        except Exception:
+            log.exception("apply queue runner failed; retrying")
+        _wake.wait(settings.apply_queue_poll_s)
+
+
+def start_runner() -> None:
+    global _runner
+    if _runner is not None and _runner.is_alive():
+        return
+    _stop.clear()
+    _runner = threading.Thread(target=_run_forever, name="apply-queue-runner", daemon=True)
+    _runner.start()
+
+
+def stop_runner() -> None:
+    _stop.set()
+    _wake.set()
@@ -0,0 +1,896 @@
+"""
+Preview/apply orchestration shared by the web routes and offline tooling.
+
+Nothing in here renders templates or builds HTTP responses; callers turn the
+returned objects (or raised RuntimeError/ValueError) into whatever they need.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Iterator
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from ..invalidation import publish
+from ..observability.metrics import PREVIEW_STAGE_SECONDS, observe_apply
+from ..observability.tracing import Span, span, submit_in_context
+from ..pritunl.client import PritunlClient
+from ..pritunl.service import build_client, fetch_users, fetch_users_by_id, org_label, org_workers, resolve_orgs
+from ..pritunl.snapshots import get_user_snapshot
+from ..pritunl.store import load_target_users, mark_stale, org_user_counts, stored_shape
+from ..pritunl.write import create_user, update_user_full, delete_user
+from ..settings import settings
+from ..targets.models import Target
+from .canonical import canonical_bool, same_disabled, same_groups
+from .blobs import get_blob, put_blob
+from .apply import sha256_hex, stable_json_hash, target_lock, now_utc
+from .models import ImportBatch, ImportRow, AuditLog
+from .preview import (
+    BaseRow,
+    DeltaStats,
+    PreviewItem,
+    PreviewSummary,
+    build_user_index_by_email,
+    describe_item,
+    user_state_hash,
+    preview_csv_against_users,
+    preview_delta_against_users,
+    preview_sync_against_users,
+)
+
+
+PREVIEW_MODES = ("actions", "sync")
+
+
+@dataclass(frozen=True)
+class PreviewOptions:
+    mode: str = "actions"  # actions: per-row action column | sync: CSV is the desired roster
+    disable_missing: bool = False  # sync only: disable enabled users absent from the file
+    base_batch_id: str | None = None  # actions only: delta preview against this batch
+
+    @property
+    def mode_key(self) -> str:
+        """Part of the preview memo key: results of different modes are never interchangeable."""
+        if self.mode == "sync" and self.disable_missing:
+            return "sync+disable_missing"
+        return self.mode
+
+    def validate(self) -> None:
+        if self.mode not in PREVIEW_MODES:
+            raise ValueError(f"Unknown import mode '{self.mode}'")
+        if self.mode == "sync" and self.base_batch_id:
+            raise ValueError("Delta preview is only available in actions mode.")
+
+
+@dataclass
+class PreviewOutcome:
+    batch: ImportBatch
+    summary: PreviewSummary
+    items_ui: list[PreviewItem]
+    preview_sha256: str
+    # True when an earlier identical preview (same CSV, same users) was returned
+    reused: bool = False
+    # Set for delta previews (base_batch_id given)
+    delta: DeltaStats | None = None
+
+
+def preview_plan_hash(items: list[PreviewItem]) -> str:
+    plan_for_hash = [
+        {
+            "row": it.row,
+            "action": it.action,
+            "email": it.email,
+            "username": it.username,
+            "status": it.status,
+            "before": it.before,
+            "after": it.after,
+            "error": it.error,
+            "desired": it.desired,
+            "diff": it.diff,
+            "will_apply": it.will_apply,
+        }
+        for it in items
+    ]
+    return stable_json_hash(plan_for_hash)
+
+
+def summary_from_dict(d: dict[str, Any]) -> PreviewSummary:
+    known = {f.name for f in fields(PreviewSummary)}
+    return PreviewSummary(**{k: int(v) for k, v in (d or {}).items() if k in known})
+
+
+# User fields describe_item reads; the only ones kept in a batch's users blob
+_DESCRIBE_FIELDS = ("id", "email", "name", "disabled", "groups")
+
+
+def item_from_row(r: ImportRow, users: dict[str, dict[str, Any]]) -> PreviewItem:
+    """users: the batch's preview-time user states (load_batch_users), used by derived rows."""
+    it = PreviewItem(
+        row=r.row_num,
+        action=r.action,
+        email=r.email,
+        username=r.username,
+        status=r.status,
+        before=r.before,
+        after=r.after,
+        error=r.error,
+        desired=r.desired or {},
+        diff=r.diff or {},
+        will_apply=r.will_apply,
+        row_hash=r.row_hash or "",
+        user_hash=r.user_hash or "",
+        user_id=r.user_id or "",
+    )
+    if r.derived:
+        it.before, it.after = describe_item(it, users.get(it.user_id) if it.user_id else None)
+    return it
+
+
+def load_batch_users(db: Session, batch: ImportBatch) -> dict[str, dict[str, Any]]:
+    sha = (batch.meta or {}).get("users_blob")
+    if not sha:
+        return {}
+    data = get_blob(db, sha)
+    if data is None:
+        raise RuntimeError(f"User snapshot of batch {batch.id} is missing.")
+    return json.loads(data)
+
+
+def items_from_rows(db: Session, batch: ImportBatch, rows: list[ImportRow]) -> list[PreviewItem]:
+    users = load_batch_users(db, batch) if any(r.derived for r in rows) else {}
+    return [item_from_row(r, users) for r in rows]
+
+
+def target_settings_key(target: Target) -> str:
+    """Part of the preview memo key: the target settings row evaluation reads (sync manages groups only with them)."""
+    return f"groups={int(bool(target.supports_groups))}"
+
+
+def find_reusable_preview(
+    db: Session, target: Target, csv_sha256: str, snapshot_fp: str, mode_key: str,
+) -> ImportBatch | None:
+    """Latest still-previewed batch for the same CSV, mode and target settings evaluated against the same users."""
+    return (
+        db.query(ImportBatch)
+        .filter(
+            ImportBatch.target_id == target.id,
+            ImportBatch.csv_sha256 == csv_sha256,
+            ImportBatch.status == "previewed",
+            ImportBatch.meta["snapshot_fp"].astext == snapshot_fp,
+            ImportBatch.meta["mode"].astext == mode_key,
+            ImportBatch.meta["settings_key"].astext == target_settings_key(target),
+        )
+        .order_by(ImportBatch.created_at.desc())
+        .first()
+    )
+
+
+def summary_dict(summary: PreviewSummary) -> dict[str, int]:
+    return {
+        "total_rows": summary.total_rows,
+        "actioned_rows": summary.actioned_rows,
+        "creates": summary.creates,
+        "updates": summary.updates,
+        "disables": summary.disables,
+        "enables": summary.enables,
+        "deletes": summary.deletes,
+        "clears": summary.clears,
+        "skips": summary.skips,
+        "errors": summary.errors,
+        "noops": summary.noops,
+        "folded": summary.folded,
+    }
+
+
+@contextmanager
+def _preview_stage(name: str, **attributes: Any) -> Iterator[Span]:
+    with PREVIEW_STAGE_SECONDS.labels(name).time(), span(f"preview.{name}", **attributes) as sp:
+        yield sp
+
+
+def _commit(db: Session, what: str) -> None:
+    with span("db.commit", what=what):
+        db.commit()
+
+
+def run_preview(
+    db: Session,
+    target: Target,
+    csv_bytes: bytes,
+    actor: str,
+    client: PritunlClient | None = None,
+    options: PreviewOptions | None = None,
+) -> PreviewOutcome:
+    """
+    Evaluate csv_bytes against the target's users and persist the result as an
+    ImportBatch + ImportRows. If the same CSV was already previewed in the same
+    mode against an identical user list, that batch is returned instead
+    (outcome.reused).
+
+    With options.base_batch_id (delta mode), rows that are unchanged since that
+    batch and whose user is unchanged reuse the base evaluation.
+
+    Raises ValueError for CSV problems and RuntimeError for target problems.
+    """
+    options = options or PreviewOptions()
+    options.validate()
+    with span("preview", target=target.name, csv_bytes=len(csv_bytes), mode=options.mode_key,
+              delta=bool(options.base_batch_id)) as root:
+        return _run_preview(db, target, csv_bytes, actor, client, options, root)
+
+
+def load_base_rows(db: Session, target: Target, base_batch_id: str) -> tuple[ImportBatch, list[BaseRow]]:
+    base = db.query(ImportBatch).filter(ImportBatch.id == base_batch_id, ImportBatch.target_id == target.id).first()
+    if not base:
+        raise ValueError("Base batch not found for this target.")
+    folded = or_(ImportRow.desired.has_key("folded_into"), ImportRow.desired.has_key("folded_rows")).label("folded")
+    rows = db.execute(
+        select(ImportRow.row_num, ImportRow.row_hash, ImportRow.user_hash, ImportRow.email, folded)
+        .where(ImportRow.batch_id == base.id)
+    ).all()
+    if any(r.row_hash is None for r in rows):
+        raise ValueError("Base batch was previewed before delta support; choose a newer batch.")
+    return base, [
+        BaseRow(row=r.row_num, row_hash=r.row_hash, user_hash=r.user_hash or "", email=r.email or "", folded=bool(r.folded))
+        for r in rows
+    ]
+
+
+def load_stored_items(db: Session, batch: ImportBatch, row_nums: list[int], chunk: int = 1000) -> list[PreviewItem]:
+    """
+    The given rows of a batch as stored: derived rows keep their empty
+    before/after and come back with derived set (see PreviewItem.derived).
+    """
+    cols = (
+        ImportRow.row_num, ImportRow.action, ImportRow.email, ImportRow.username, ImportRow.status,
+        ImportRow.before, ImportRow.after, ImportRow.error, ImportRow.desired, ImportRow.diff,
+        ImportRow.will_apply, ImportRow.row_hash, ImportRow.user_hash, ImportRow.user_id, ImportRow.derived,
+    )
+    items: list[PreviewItem] = []
+    for i in range(0, len(row_nums), chunk):
+        part = row_nums[i:i + chunk]
+        for r in db.execute(select(*cols).where(ImportRow.batch_id == batch.id, ImportRow.row_num.in_(part))):
+            items.append(PreviewItem(
+                row=r.row_num,
+                action=r.action,
+                email=r.email,
+                username=r.username,
+                status=r.status,
+                before=r.before,
+                after=r.after,
+                error=r.error,
+                desired=r.desired or {},
+                diff=r.diff or {},
+                will_apply=r.will_apply,
+                row_hash=r.row_hash or "",
+                user_hash=r.user_hash or "",
+                user_id=r.user_id or "",
+                derived=bool(r.derived),
+            ))
+    return items
+
+
+def _run_preview(
+    db: Session,
+    target: Target,
+    csv_bytes: bytes,
+    actor: str,
+    client: PritunlClient | None,
+    options: PreviewOptions,
+    root: Span,
+) -> PreviewOutcome:
+    def load() -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        # Lists from Pritunl only when the store is stale (see app/pritunl/store.py)
+        with _preview_stage("list_users") as sp:
+            stored = load_target_users(db, target, client)
+            sp.attributes["users"] = len(stored.users)
+            sp.attributes["orgs"] = len(stored.orgs)
+        return stored.orgs, stored.users
+
+    snap, cached = get_user_snapshot(target.id, load)
+    orgs, users = snap.orgs, snap.users
+    root.attributes["org"] = org_label(orgs)
+    root.attributes["users_cached"] = cached
+
+    csv_sha = sha256_hex(csv_bytes)
+    with _preview_stage("memo_lookup") as sp:
+        prior = find_reusable_preview(db, target, csv_sha, snap.fingerprint, options.mode_key)
+        sp.attributes["hit"] = prior is not None
+    if prior is not None:
+        root.attributes["reused_batch_id"] = prior.id
+        return _reused_outcome(db, prior)
+
+    delta: DeltaStats | None = None
+    if options.mode == "sync":
+        with _preview_stage("csv_parse", mode="sync") as sp:
+            _job_id, summary, items_ui, items_full = preview_sync_against_users(
+                csv_bytes, users, disable_missing=options.disable_missing, manage_groups=target.supports_groups, orgs=orgs,
+            )
+            sp.attributes["rows"] = summary.total_rows
+            sp.attributes["errors"] = summary.errors
+    elif options.base_batch_id:
+        with _preview_stage("delta_base") as sp:
+            base, base_rows = load_base_rows(db, target, options.base_batch_id)
+            sp.attributes["rows"] = len(base_rows)
+        with _preview_stage("csv_parse", delta=True) as sp:
+            summary, items_ui, items_full, delta = preview_delta_against_users(
+                csv_bytes, users, options.base_batch_id, base_rows,
+                lambda row_nums: load_stored_items(db, base, row_nums), orgs=orgs,
+            )
+            sp.attributes["rows"] = summary.total_rows
+            sp.attributes["reused_rows"] = delta.unchanged
+            sp.attributes["errors"] = summary.errors
+        # Only the rows shown get their copied text rendered; the plan keeps it empty
+        by_id = {str(u.get("id")): u for u in users if u.get("id")}
+        items_ui = [_rendered(it, by_id) if it.derived else it for it in items_ui]
+    else:
+        # CSV parsing and row evaluation happen in one streaming pass
+        with _preview_stage("csv_parse") as sp:
+            _job_id, summary, items_ui, items_full = preview_csv_against_users(csv_bytes, users, orgs=orgs)
+            sp.attributes["rows"] = summary.total_rows
+            sp.attributes["errors"] = summary.errors
+
+    with _preview_stage("plan_hash", rows=len(items_full)):
+        preview_sha = preview_plan_hash(items_full)
+
+    root.attributes["rows"] = summary.total_rows
+    root.attributes["actioned_rows"] = summary.actioned_rows
+
+    meta: dict[str, Any] = {
+        "org_id": orgs[0]["id"],
+        "org_name": org_label(orgs),
+        "orgs": [{"id": o["id"], "name": o.get("name")} for o in orgs],
+        "snapshot_fp": snap.fingerprint,
+        "mode": options.mode_key,
+        "settings_key": target_settings_key(target),
+    }
+    if delta is not None:
+        meta["delta"] = asdict(delta)
+        meta["delta"]["removed_emails"] = delta.removed_emails[:500]
+
+    batch = ImportBatch(
+        target_id=target.id,
+        created_by=actor,
+        status="previewed",
+        csv_sha256=csv_sha,
+        preview_sha256=preview_sha,
+        summary=summary_dict(summary),
+        meta=meta,
+    )
+    with _preview_stage("persist", rows=len(items_full)):
+        # Committed together with the batch row
+        put_blob(db, csv_bytes)
+        _persist_preview(db, batch, items_full, users)
+    root.attributes["batch_id"] = batch.id
+
+    return PreviewOutcome(batch=batch, summary=summary, items_ui=items_ui, preview_sha256=preview_sha, delta=delta)
+
+
+def _reused_outcome(db: Session, batch: ImportBatch) -> PreviewOutcome:
+    with _preview_stage("memo_load"):
+        rows = (
+            db.query(ImportRow)
+            .filter(ImportRow.batch_id == batch.id)
+            .order_by(ImportRow.row_num.asc())
+            .limit(200)
+            .all()
+        )
+    return PreviewOutcome(
+        batch=batch,
+        summary=summary_from_dict(batch.summary),
+        items_ui=items_from_rows(db, batch, rows),
+        preview_sha256=batch.preview_sha256,
+        reused=True,
+    )
+
+
+def _describe_state(user: dict[str, Any]) -> dict[str, Any]:
+    return {k: user[k] for k in _DESCRIBE_FIELDS if k in user}
+
+
+def _rendered(it: PreviewItem, by_id: dict[str, dict[str, Any]]) -> PreviewItem:
+    user = by_id.get(it.user_id) if it.user_id else None
+    before, after = describe_item(it, _describe_state(user) if user is not None else None)
+    return replace(it, before=before, after=after, derived=False)
+
+
+def _compact_rows(
+    items: list[PreviewItem],
+    users: list[dict[str, Any]],
+) -> tuple[set[int], dict[str, dict[str, Any]]]:
+    """
+    Rows (by index) whose before/after text describe_item reproduces exactly
+    from their user's state, and the preview-time user states to keep: those
+    rows need them, and apply compares every applied row's live user with its
+    state to name drifted fields. Anything else (errors, folded rows, rows
+    evaluated against simulated state) keeps its text. Rows a delta preview
+    copied from a derived base row (it.derived) stay derived.
+    """
+    by_id = {str(u.get("id")): u for u in users if u.get("id")}
+    derived: set[int] = set()
+    states: dict[str, dict[str, Any]] = {}
+    for idx, it in enumerate(items):
+        if it.status != "ok" and not it.desired.get("noop"):
+            continue
+        state = None
+        if it.user_id:
+            user = by_id.get(it.user_id)
+            if user is None:
+                continue
+            state = _describe_state(user)
+            if it.will_apply and it.status == "ok":
+                states[it.user_id] = state
+        if not it.derived and describe_item(it, state) != (it.before, it.after):
+            continue
+        derived.add(idx)
+        if state is not None:
+            states[it.user_id] = state
+    return derived, states
+
+
+def _persist_preview(db: Session, batch: ImportBatch, items_full: list[PreviewItem], users: list[dict[str, Any]]) -> None:
+    derived, states = _compact_rows(items_full, users)
+    if states:
+        # Content-addressed: an unchanged user set re-previewed is stored once
+        blob = json.dumps(states, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        batch.meta = {**(batch.meta or {}), "users_blob": put_blob(db, blob, kind="users")}
+
+    db.add(batch)
+    _commit(db, "import_batch")
+
+    for idx, it in enumerate(items_full):
+        compact = idx in derived
+        r = ImportRow(
+            batch_id=batch.id,
+            row_num=it.row,
+            action=it.action,
+            email=it.email,
+            username=it.username,
+            status=it.status,
+            before="" if compact else it.before,
+            after="" if compact else it.after,
+            error=it.error,
+            desired=it.desired or {},
+            diff=it.diff or {},
+            will_apply=bool(it.will_apply and it.status == "ok"),
+            row_hash=it.row_hash,
+            user_hash=it.user_hash,
+            user_id=it.user_id or None,
+            derived=compact,
+        )
+        db.add(r)
+    _commit(db, "import_rows")
+
+
+def _audit(db: Session, actor: str, target: Target, batch: ImportBatch, r: ImportRow, email: str, **kw: Any) -> None:
+    db.add(AuditLog(
+        actor=actor,
+        target_id=target.id,
+        batch_id=batch.id,
+        row_id=r.id,
+        email=email,
+        **kw,
+    ))
+
+
+@dataclass(frozen=True)
+class _RowTask:
+    """What a worker thread needs from an ImportRow; ORM objects stay on the main thread."""
+    row_id: str
+    row_num: int
+    action: str
+    email: str
+    username: str | None
+    desired: dict[str, Any]
+    # Pritunl id and user_state_hash of the user the row was previewed against ("" = none/unknown)
+    user_id: str = ""
+    user_hash: str | None = None
+
+
+@dataclass
+class _RowOutcome:
+    status: str
+    result: dict[str, Any]
+    # AuditLog fields for the write, recorded by the main thread
+    audit: dict[str, Any] | None = None
+    applied_at: Any = None
+    # The live user (store shape) when it no longer matches what preview saw
+    drift: dict[str, Any] | None = None
+
+
+def _apply_one(
+    client: PritunlClient,
+    org_id: str,
+    target: Target,
+    task: _RowTask,
+    existing: dict[str, Any] | None,
+) -> _RowOutcome:
+    """
+    Execute one previewed row against the target. Only talks to Pritunl, so
+    it can run on an org worker thread. Exceptions are left to the caller.
+    """
+    email, action, desired = task.email, task.action, task.desired
+
+    if action == "create":
+        if existing:
+            return _RowOutcome("skipped", {"reason": "idempotent: already exists"})
+
+        name = (task.username or "").strip()
+        if not name:
+            raise RuntimeError("Create requires username")
+
+        groups = desired.get("groups") or []
+        resp = create_user(
+            client,
+            org_id,
+            name=name,
+            email=email,
+            groups=groups if target.supports_groups else None,
+            send_key_email=True,
+        )
+
+        audit = dict(operation="user.create", success=True,
+                     request={"email": email, "name": name, "groups": groups},
+                     response={"result": resp})
+
+    elif action == "update":
+        if not existing:
+            return _RowOutcome("skipped", {"reason": "missing user for update; ignored"})
+
+        user_id = existing.get("id")
+        if not user_id:
+            raise RuntimeError("Existing user record missing id")
+
+        merged = dict(existing)
+
+        # Username is read-only for update; do NOT set merged["name"]
+
+        gm = (desired.get("groups_mode") or "").lower()
+        groups_cell = desired.get("groups_cell") or ""
+        desired_groups = desired.get("groups")
+
+        if target.supports_groups:
+            if gm == "clear":
+                merged["groups"] = []
+            elif gm == "replace":
+                if str(groups_cell) != "":
+                    merged["groups"] = desired_groups or []
+            else:
+                pass  # blank/unknown => do nothing
+
+        # Sync mode folds a status change into the same write
+        if "disabled" in desired:
+            merged["disabled"] = bool(desired["disabled"])
+
+        # idempotent best-effort
+        if same_groups(merged.get("groups"), existing.get("groups")) and same_disabled(merged.get("disabled"), existing.get("disabled")):
+            return _RowOutcome("skipped", {"reason": "idempotent: no change"})
+
+        resp = update_user_full(client, org_id, user_id, merged)
+
+        audit = dict(operation="user.update", success=True,
+                     request={"user_id": user_id, **({"disabled": merged["disabled"]} if "disabled" in desired else {})},
+                     response={"result": resp})
+
+    elif action in {"disable", "enable"}:
+        want_disabled = action == "disable"
+        if not existing:
+            return _RowOutcome("skipped", {"reason": f"missing user for {action}; ignored"})
+
+        user_id = existing.get("id")
+        if not user_id:
+            raise RuntimeError("Existing user record missing id")
+
+        if canonical_bool(existing.get("disabled")) is want_disabled:
+            return _RowOutcome("skipped", {"reason": f"idempotent: already {action}d"})
+
+        merged = dict(existing)
+        merged["disabled"] = want_disabled
+
+        resp = update_user_full(client, org_id, user_id, merged)
+
+        audit = dict(operation=f"user.{action}", success=True,
+                     request={"user_id": user_id, "disabled": want_disabled},
+                     response={"result": resp})
+
+    elif action == "delete":
+        if not settings.allow_delete:
+            return _RowOutcome("failed", {"error": "ALLOW_DELETE=false"})
+
+        if not existing:
+            return _RowOutcome("skipped", {"reason": "missing user for delete; ignored"})
+
+        user_id = existing.get("id")
+        if not user_id:
+            raise RuntimeError("Existing user record missing id")
+
+        resp = delete_user(client, org_id, user_id)
+
+        audit = dict(operation="user.delete", success=True,
+                     request={"user_id": user_id},
+                     response={"result": resp if isinstance(resp, dict) else {"text": str(resp)}})
+
+    else:
+        return _RowOutcome("skipped", {"reason": f"unknown/unsupported action '{action}'"})
+
+    return _RowOutcome("applied", {"result": resp}, audit=audit, applied_at=now_utc())
+
+
+def _failed(task: _RowTask, error: str) -> _RowOutcome:
+    return _RowOutcome("failed", {"error": error}, audit=dict(
+        operation=f"user.{task.action}", success=False, error=error,
+        request={"row": task.row_num, "action": task.action},
+        response={},
+    ))
+
+
+# Assumed users per listing page, and what fetching one page costs relative
+# to a single-user GET (bigger payload, slower server side)
+_LIST_PAGE_SIZE = 100
+_PAGE_COST = 4
+
+
+def plan_user_fetch(tasks: list[_RowTask], org_size: int | None, concurrency: int) -> str:
+    """
+    "targeted" when looking up each affected user by id is cheaper than
+    re-listing the org, else "full". Creates always need the live full list:
+    only it proves no user with that email appeared in Pritunl since the
+    store or snapshot the preview read was listed.
+    """
+    if org_size is None:
+        return "full"
+    if any(t.action == "create" or not t.user_id for t in tasks):
+        return "full"
+    conc = max(1, concurrency)
+    lookups = len({t.user_id for t in tasks if t.user_id})
+    pages = org_size // _LIST_PAGE_SIZE + 1
+    full_cost = _PAGE_COST * (1 + -(-(pages - 1) // conc))
+    targeted_cost = -(-lookups // conc)
+    return "targeted" if targeted_cost < full_cost else "full"
+
+
+def _targeted_users(client: PritunlClient, org_id: str, tasks: list[_RowTask]) -> dict[str, dict[str, Any]] | None:
+    """
+    Live users of the rows, looked up by id and indexed by email. None when a
+    user is gone or its email changed since the preview: the caller then
+    re-lists the org so rows match by email exactly as a full list would.
+    """
+    found = fetch_users_by_id(client, org_id, sorted({t.user_id for t in tasks if t.user_id}))
+    by_email: dict[str, dict[str, Any]] = {}
+    for t in tasks:
+        u = found.get(t.user_id)
+        if u is None or (u.get("email") or "").strip().lower() != t.email:
+            return None
+        by_email[t.email] = u
+    return by_email
+
+
+def _apply_org(
+    client: PritunlClient,
+    target: Target,
+    org: dict[str, Any],
+    tasks: list[_RowTask],
+    org_size: int | None,
+) -> list[tuple[_RowTask, _RowOutcome]]:
+    """Re-read the affected live users of one org, then apply its rows in file order."""
+    plan = plan_user_fetch(tasks, org_size, client.page_concurrency)
+    with span("apply.list_users", org=org.get("name"), plan=plan, org_size=org_size) as sp:
+        try:
+            user_by_email = _targeted_users(client, org["id"], tasks) if plan == "targeted" else None
+            if user_by_email is None:
+                if plan == "targeted":
+                    sp.attributes["fallback"] = True
+                users = fetch_users(client, org["id"])
+                user_by_email = build_user_index_by_email(users)
+            sp.attributes["users"] = len(user_by_email)
+        except Exception as e:
+            sp.attributes["error"] = str(e)
+            return [(t, _failed(t, f"listing users of org '{org.get('name')}' failed: {e}")) for t in tasks]
+
+    out: list[tuple[_RowTask, _RowOutcome]] = []
+    for t in tasks:
+        existing = user_by_email.get(t.email)
+        with span("apply.row", row=t.row_num, action=t.action, org=org.get("name")) as sp:
+            try:
+                outcome = _apply_one(client, org["id"], target, t, existing)
+            except Exception as e:
+                outcome = _failed(t, str(e))
+            sp.attributes["apply_status"] = outcome.status
+        if t.user_hash is not None:
+            live = stored_shape(existing)
+            if user_state_hash(live) != t.user_hash:
+                outcome.drift = live or {}
+        out.append((t, outcome))
+    return out
+
+
+def _drift_entry(task: _RowTask, live: dict[str, Any], previewed: dict[str, Any] | None) -> dict[str, Any]:
+    """What changed about a row's user between preview and apply."""
+    if not live:
+        fields = ["missing"] if task.user_id else []
+    elif not task.user_id:
+        fields = ["created"]
+    elif previewed is None:
+        fields = ["unknown"]
+    else:
+        fields = [f for f in ("email", "name", "disabled") if previewed.get(f) != live.get(f)]
+        if not same_groups(previewed.get("groups"), live.get("groups")):
+            fields.append("groups")
+    return {"row": task.row_num, "email": task.email, "user_id": task.user_id or live.get("id"), "changed": fields}
+
+
+def _not_applied_reason(r: ImportRow) -> str:
+    desired = r.desired or {}
+    if desired.get("noop"):
+        return f"no-op: {desired['noop']}"
+    if desired.get("folded_into"):
+        return f"folded into row {desired['folded_into']}"
+    return "will_apply=false or status!=ok"
+
+
+def apply_refusal(batch: ImportBatch, preview_sha256: str | None = None) -> str | None:
+    """Why the batch cannot be applied, or None. preview_sha256 is the plan hash the caller was shown."""
+    if preview_sha256 is not None and batch.preview_sha256 != preview_sha256:
+        return "Preview hash mismatch. Re-run preview."
+    if batch.status not in {"previewed", "failed"}:
+        return f"Batch status is '{batch.status}', cannot apply."
+    if int((batch.summary or {}).get("errors", 0)) != 0:
+        return "Batch contains preview errors. Fix CSV and re-run preview."
+    return None
+
+
+def iter_batch_items(db: Session, batch: ImportBatch, chunk: int = 1000) -> Iterator[tuple[ImportRow, PreviewItem]]:
+    """Every row of a batch in file order, streamed in chunks."""
+    users = load_batch_users(db, batch)
+    rows = db.execute(
+        select(ImportRow)
+        .where(ImportRow.batch_id == batch.id)
+        .order_by(ImportRow.row_num.asc())
+        .execution_options(yield_per=chunk)
+    ).scalars()
+    for r in rows:
+        yield r, item_from_row(r, users)
+
+
+def run_apply(
+    db: Session,
+    target: Target,
+    batch: ImportBatch,
+    actor: str,
+    client: PritunlClient | None = None,
+) -> tuple[dict[str, Any], list[ImportRow]]:
+    """
+    Apply a previewed batch under the per-target lock. The caller is expected
+    to have validated the batch (hash, status, errors) first. Raises
+    TargetBusy instead of waiting when another apply holds the lock (the web
+    routes go through app/importer/queue.py instead).
+    Returns (results, rows).
+    """
+    with target_lock(target.id):
+        return apply_locked(db, target, batch, actor, client)
+
+
+def apply_locked(
+    db: Session,
+    target: Target,
+    batch: ImportBatch,
+    actor: str,
+    client: PritunlClient | None = None,
+) -> tuple[dict[str, Any], list[ImportRow]]:
+    """run_apply for callers that already hold target_lock(target.id)."""
+    with span("apply", target=target.name, batch_id=batch.id) as root:
+        return _run_apply_locked(db, target, batch, actor, client, root)
+
+
+def _run_apply_locked(
+    db: Session,
+    target: Target,
+    batch: ImportBatch,
+    actor: str,
+    client: PritunlClient | None,
+    root: Span,
+) -> tuple[dict[str, Any], list[ImportRow]]:
+    started = time.perf_counter()
+
+    batch.status = "applying"
+    db.add(batch)
+    _commit(db, "batch_status")
+
+    if client is None:
+        client = build_client(target)
+
+    with span("apply.org_lookup") as sp:
+        orgs = resolve_orgs(client, target)
+        sp.attributes["orgs"] = len(orgs)
+    orgs_by_id = {o["id"]: o for o in orgs}
+    root.attributes["org"] = org_label(orgs)
+
+    with span("apply.load_rows"):
+        rows = db.query(ImportRow).filter(ImportRow.batch_id == batch.id).order_by(ImportRow.row_num.asc()).all()
+    root.attributes["rows"] = len(rows)
+
+    # Rows without an org in desired were previewed against a single-org target
+    default_org_id = orgs[0]["id"] if len(orgs) == 1 else (batch.meta or {}).get("org_id")
+
+    outcomes: dict[str, _RowOutcome] = {}
+    tasks_by_row: dict[str, _RowTask] = {}
+    tasks_by_org: dict[str, list[_RowTask]] = {}
+    for r in rows:
+        if not r.will_apply:
+            continue
+        desired = r.desired or {}
+        task = _RowTask(
+            row_id=r.id,
+            row_num=r.row_num,
+            action=(r.action or "").strip().lower(),
+            email=(r.email or "").strip().lower(),
+            username=r.username,
+            desired=desired,
+            user_id=r.user_id or "",
+            # Rows stored before user_id (or, for sync rows, user_hash) existed cannot be checked for drift
+            user_hash=r.user_hash if r.row_hash is not None and (r.action == "create" or (r.user_id and r.user_hash)) else None,
+        )
+        tasks_by_row[r.id] = task
+        org_id = desired.get("org_id") or default_org_id
+        if org_id not in orgs_by_id:
+            outcomes[r.id] = _failed(task, "org of this row is no longer part of the target")
+            continue
+        tasks_by_org.setdefault(org_id, []).append(task)
+
+    # Sizes from the user store decide between targeted lookups and a full re-list
+    org_sizes = org_user_counts(db, target.id)
+
+    # Orgs are independent: list + apply each on its own worker
+    with ThreadPoolExecutor(max_workers=org_workers(len(tasks_by_org)), thread_name_prefix="org-apply") as pool:
+        futures = [submit_in_context(pool, _apply_org, client, target, orgs_by_id[oid], tasks, org_sizes.get(oid))
+                   for oid, tasks in tasks_by_org.items()]
+        for f in futures:
+            for task, outcome in f.result():
+                outcomes[task.row_id] = outcome
+
+    results: dict[str, Any] = {"applied": 0, "skipped": 0, "failed": 0, "details": [], "drifted": []}
+    previewed_users: dict[str, dict[str, Any]] | None = None
+
+    for r in rows:
+        outcome = outcomes.get(r.id)
+        if outcome is None:
+            r.apply_status = "skipped"
+            r.apply_result = {"reason": _not_applied_reason(r)}
+            results["skipped"] += 1
+            db.add(r)
+            continue
+
+        email = (r.email or "").strip().lower()
+        r.apply_status = outcome.status
+        r.apply_result = outcome.result
+        if outcome.applied_at is not None:
+            r.applied_at = outcome.applied_at
+        results[outcome.status] += 1
+        if outcome.audit is not None:
+            _audit(db, actor, target, batch, r, email, **outcome.audit)
+
+        if outcome.drift is not None:
+            if previewed_users is None:
+                previewed_users = load_batch_users(db, batch)
+            task = tasks_by_row[r.id]
+            entry = _drift_entry(task, outcome.drift, previewed_users.get(task.user_id))
+            results["drifted"].append(entry)
+            r.apply_result = {**(r.apply_result or {}), "drift": entry["changed"]}
+
+        db.add(r)
+        results["details"].append({"row": r.row_num, "email": email, "action": (r.action or "").strip().lower(), "status": r.apply_status})
+
+    batch.status = "applied" if results["failed"] == 0 else "failed"
+    db.add(batch)
+    if results["applied"]:
+        publish(db, "users", target.id)
+        mark_stale(db, target.id)
+    _commit(db, "apply_results")
+
+    root.attributes.update({k: results[k] for k in ("applied", "skipped", "failed")})
+    root.attributes["drifted"] = len(results["drifted"])
+    observe_apply(target.name, results, time.perf_counter() - started)
+    return results, rows
@@ -0,0 +1,120 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Writers call publish() inside their DB transaction. Postgres only delivers the
+notification once that transaction commits, so other workers never drop a
+cache entry before the new data is visible to them.
+
+Every worker runs one listener thread that dispatches incoming messages to the
+handlers registered for their kind:
+  settings    - guardrail settings (key unused)
+  target      - a target row was created/edited (key = target id)
+  admin       - an admin account changed (key = username)
+  users       - a target's Pritunl users changed (key = target id)
+  apply_queue - an apply was queued for a runner or finished (key = target id); wakes queue runners
+
+A handler receives the key, or None meaning "drop everything of this kind"
+(sent after the listener reconnects, since messages may have been missed).
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable
+
+import psycopg
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .db import engine
+
+CHANNEL = "pbadmin_invalidate"
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[str | None], None]
+
+_handlers: dict[str, list[Handler]] = defaultdict(list)
+_handlers_lock = threading.Lock()
+
+_listener: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def register_handler(kind: str, fn: Handler) -> None:
+    with _handlers_lock:
+        _handlers[kind].append(fn)
+
+
+def _dispatch(kind: str, key: str | None) -> None:
+    with _handlers_lock:
+        fns = list(_handlers.get(kind, []))
+    for fn in fns:
+        try:
+            fn(key)
+        except Exception:
+            log.exception("invalidation handler failed (kind=%s key=%s)", kind, key)
+
+
+def _dispatch_all() -> None:
+    with _handlers_lock:
+        kinds = list(_handlers.keys())
+    for kind in kinds:
+        _dispatch(kind, None)
+
+
+def publish(db: Session, kind: str, key: str | None = None) -> None:
+    """
+    Queue an invalidation for all workers (delivered on commit) and apply it
+    to this worker's caches right away.
+    """
+    payload = json.dumps({"kind": kind, "key": key}, separators=(",", ":"))
+    db.execute(text("SELECT pg_notify(:ch, :payload)"), {"ch": CHANNEL, "payload": payload})
+    _dispatch(kind, key)
+
+
+def _handle_payload(payload: str) -> None:
+    try:
+        msg = json.loads(payload)
+    except ValueError:
+        log.warning("ignoring malformed invalidation payload: %r", payload[:200])
+        return
+    kind = msg.get("kind")
+    if kind:
+        _dispatch(str(kind), msg.get("key"))
+
+
+def _conninfo() -> str:
+    # libpq does not understand SQLAlchemy driver suffixes like "+psycopg"
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def _listen_forever() -> None:
+    backoff = 1.0
+    while not _stop.is_set():
+        try:
+            with psycopg.connect(_conninfo(), autocommit=True) as conn:
+                conn.execute(f"LISTEN {CHANNEL}")
+                # Anything published while we were disconnected was lost
+                _dispatch_all()
+                backoff = 1.0
+                while not _stop.is_set():
+                    for n in conn.notifies(timeout=5.0):
+                        _handle_payload(n.payload)
+        except Exception:
+            log.exception("invalidation listener disconnected; retrying in %.0fs", backoff)
+            _stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+def start_listener() -> None:
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen_forever, name="invalidation-listener", daemon=True)
+    _listener.start()
+
+
+def stop_listener() -> None:
+    _stop.set()
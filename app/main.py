@@ -1,23 +1,24 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from starlette.templating import Jinja2Templates
 
 from .settings import settings
-from .db import Base, engine
-
-from .bootstrap import is_bootstrapped
-
-# Ensure models are imported before create_all
-from .auth import models as _auth_models  # noqa: F401
-from .targets import models as _targets_models  # noqa: F401
-from .importer import models as _import_models  # noqa: F401
-from .settings_db import AppSettings as _app_settings_model  # noqa: F401
+from .compression import CompressionMiddleware
+from .templating import build_templates, warm_templates
+from .migrations import ensure_schema
+from .invalidation import start_listener, stop_listener
+from .importer.queue import start_runner, stop_runner
+from .db import engine
+from .observability.metrics import MetricsMiddleware, instrument_engine
+from .observability.tracing import exporter_from_settings, set_exporter
+from .observability.profiler import ProfilerMiddleware, reload_arms
 
 from .setup.routes import router as setup_router
 from .auth.routes import router as auth_router
 from .targets.routes import router as targets_router
 from .admin.routes import router as admin_router
 from .history.routes import router as history_router
+from .observability.routes import router as observability_router
+from .api.routes import router as api_router
 
 
 def create_app() -> FastAPI:
@@ -28,17 +29,35 @@ def create_app() -> FastAPI:
 
     app.mount('/static', StaticFiles(directory='app/static'), name='static')
 
-    Base.metadata.create_all(bind=engine)
+    # Schema is checked (and migrated if behind) when the worker starts, not at import
+    app.add_event_handler("startup", ensure_schema)
+    app.add_event_handler("startup", reload_arms)
+
+    app.state.templates = build_templates()
+    app.add_event_handler("startup", lambda: warm_templates(app.state.templates))
 
-    app.state.templates = Jinja2Templates(directory="app/templates")
+    instrument_engine(engine)
+    set_exporter(exporter_from_settings())
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(ProfilerMiddleware)
+    if settings.compression_enabled:
+        # Outermost, so the other middleware see uncompressed responses
+        app.add_middleware(CompressionMiddleware)
 
-    app.state.bootstrapped = is_bootstrapped()
+    if settings.invalidation_listen:
+        app.add_event_handler("startup", start_listener)
+        app.add_event_handler("shutdown", stop_listener)
+    if settings.apply_runner:
+        app.add_event_handler("startup", start_runner)
+        app.add_event_handler("shutdown", stop_runner)
 
     app.include_router(setup_router)
     app.include_router(auth_router)
     app.include_router(targets_router)
     app.include_router(admin_router)
     app.include_router(history_router)
+    app.include_router(observability_router)
+    app.include_router(api_router)
 
     return app
 
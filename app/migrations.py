@@ -0,0 +1,225 @@
+"""
+Versioned schema migrations.
+
+schema_migrations holds one row per applied migration. On boot a worker only
+reads the current version; migrations run when the DB is behind, serialized
+across workers/containers by an advisory lock.
+
+Rules for adding a migration:
+  - append it to MIGRATIONS with the next version number, never edit old ones
+  - keep it idempotent (IF NOT EXISTS etc.): the baseline builds tables from
+    the current models, so a fresh DB may already have what it adds
+  - CREATE INDEX CONCURRENTLY must use transactional=False
+
+Run manually with:  python -m app.migrations
+"""
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from .db import Base, engine
+from .settings import settings
+
+# Ensure models are imported before the baseline create_all
+from .auth import models as _auth_models  # noqa: F401
+from .targets import models as _targets_models  # noqa: F401
+from .importer import models as _import_models  # noqa: F401
+from .settings_db import AppSettings as _app_settings_model  # noqa: F401
+from .observability import models as _observability_models  # noqa: F401
+from .pritunl import models as _pritunl_models  # noqa: F401
+
+log = logging.getLogger(__name__)
+
+# Arbitrary constant shared by every worker
+MIGRATION_LOCK_KEY = 0x7062_6164_6D69_6E00  # "pbadmin\0"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+    transactional: bool = True
+
+
+def create_index_concurrently(conn: Connection, name: str, ddl: str) -> None:
+    """
+    ddl is everything after "ON", e.g. "import_rows (batch_id, row_num)".
+    A failed concurrent build leaves an INVALID index behind that IF NOT EXISTS
+    would happily skip, so drop it first.
+    """
+    invalid = conn.execute(
+        text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {ddl}"))
+
+
+def _m0001_baseline(conn: Connection) -> None:
+    Base.metadata.create_all(bind=conn)
+
+
+def _m0002_settings_version(conn: Connection) -> None:
+    conn.execute(text("ALTER TABLE app_settings ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _m0003_history_indexes(conn: Connection) -> None:
+    create_index_concurrently(conn, "ix_import_rows_batch_row", "import_rows (batch_id, row_num)")
+    create_index_concurrently(conn, "ix_audit_log_ts", "audit_log (ts DESC)")
+    create_index_concurrently(conn, "ix_audit_log_target_ts", "audit_log (target_id, ts DESC)")
+
+
+def _m0004_profiler_arms(conn: Connection) -> None:
+    _observability_models.ProfilerArm.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m0005_batch_memo_index(conn: Connection) -> None:
+    create_index_concurrently(conn, "ix_import_batches_target_csv", "import_batches (target_id, csv_sha256)")
+
+
+def _m0006_import_row_hashes(conn: Connection) -> None:
+    conn.execute(text("ALTER TABLE import_rows ADD COLUMN IF NOT EXISTS row_hash VARCHAR"))
+    conn.execute(text("ALTER TABLE import_rows ADD COLUMN IF NOT EXISTS user_hash VARCHAR"))
+
+
+def _m0007_user_store(conn: Connection) -> None:
+    _pritunl_models.TargetUser.__table__.create(bind=conn, checkfirst=True)
+    _pritunl_models.TargetUserSync.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m0008_content_blobs(conn: Connection) -> None:
+    _import_models.ContentBlob.__table__.create(bind=conn, checkfirst=True)
+    # New batches reference content_blobs instead of carrying the upload
+    conn.execute(text("ALTER TABLE import_batches ALTER COLUMN csv_bytes DROP NOT NULL"))
+
+
+def _m0009_compact_import_rows(conn: Connection) -> None:
+    conn.execute(text("ALTER TABLE import_rows ADD COLUMN IF NOT EXISTS user_id VARCHAR"))
+    conn.execute(text("ALTER TABLE import_rows ADD COLUMN IF NOT EXISTS derived BOOLEAN NOT NULL DEFAULT false"))
+
+
+def _m0010_user_store_fingerprint(conn: Connection) -> None:
+    conn.execute(text("ALTER TABLE target_user_syncs ADD COLUMN IF NOT EXISTS fingerprint VARCHAR"))
+
+
+def _m0011_apply_jobs(conn: Connection) -> None:
+    _import_models.ApplyJob.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m0012_api_tokens(conn: Connection) -> None:
+    _auth_models.ApiToken.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m0013_pritunl_sessions(conn: Connection) -> None:
+    _pritunl_models.PritunlSession.__table__.create(bind=conn, checkfirst=True)
+
+
+def _m0014_drop_user_store_fingerprint(conn: Connection) -> None:
+    # Apply no longer compares the preview's snapshot fingerprint with the store
+    conn.execute(text("ALTER TABLE target_user_syncs DROP COLUMN IF EXISTS fingerprint"))
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "baseline", _m0001_baseline),
+    Migration(2, "app_settings.version", _m0002_settings_version),
+    Migration(3, "history composite indexes", _m0003_history_indexes, transactional=False),
+    Migration(4, "profiler_arms", _m0004_profiler_arms),
+    Migration(5, "import_batches memo index", _m0005_batch_memo_index, transactional=False),
+    Migration(6, "import_rows content hashes", _m0006_import_row_hashes),
+    Migration(7, "target user store", _m0007_user_store),
+    Migration(8, "content_blobs for uploads", _m0008_content_blobs),
+    Migration(9, "compact import rows", _m0009_compact_import_rows),
+    Migration(10, "target_user_syncs.fingerprint", _m0010_user_store_fingerprint),
+    Migration(11, "apply_jobs", _m0011_apply_jobs),
+    Migration(12, "api_tokens", _m0012_api_tokens),
+    Migration(13, "pritunl_sessions", _m0013_pritunl_sessions),
+    Migration(14, "drop target_user_syncs.fingerprint", _m0014_drop_user_store_fingerprint),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(eng: Engine = engine) -> int:
+    with eng.connect() as conn:
+        exists = conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar()
+        if exists is None:
+            return 0
+        return int(conn.execute(text("SELECT coalesce(max(version), 0) FROM schema_migrations")).scalar() or 0)
+
+
+def migrate(eng: Engine = engine) -> list[int]:
+    """Apply all pending migrations. Returns the versions applied by this call."""
+    applied: list[int] = []
+
+    with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": MIGRATION_LOCK_KEY})
+        try:
+            lock_conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                " version INTEGER PRIMARY KEY,"
+                " name VARCHAR NOT NULL,"
+                " applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            ))
+
+            # Re-read under the lock: another worker may have just finished
+            current = current_version(eng)
+
+            for m in MIGRATIONS:
+                if m.version <= current:
+                    continue
+
+                log.info("applying migration %04d %s", m.version, m.name)
+                if m.transactional:
+                    with eng.begin() as conn:
+                        m.apply(conn)
+                        conn.execute(
+                            text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                            {"v": m.version, "n": m.name},
+                        )
+                else:
+                    with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        m.apply(conn)
+                        conn.execute(
+                            text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                            {"v": m.version, "n": m.name},
+                        )
+                applied.append(m.version)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": MIGRATION_LOCK_KEY})
+
+    return applied
+
+
+def ensure_schema() -> None:
+    """
+    Boot-time check: one cheap version read when the schema is current.
+    """
+    current = current_version()
+    if current >= LATEST_VERSION:
+        return
+
+    if not settings.auto_migrate:
+        raise RuntimeError(
+            f"Database schema is at version {current}, this build needs {LATEST_VERSION}. "
+            "Run `python -m app.migrations` or set AUTO_MIGRATE=true."
+        )
+
+    migrate()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    before = current_version()
+    done = migrate()
+    if done:
+        print(f"Migrated schema from version {before} to {done[-1]}")
+    else:
+        print(f"Schema already at version {before}")
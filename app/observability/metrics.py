@@ -0,0 +1,144 @@
+"""
+Prometheus instruments and the request/DB timing hooks that feed them.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory so /metrics aggregates all worker processes.
+"""
+import re
+import time
+from contextvars import ContextVar
+from typing import Any
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+PRITUNL_REQUEST_SECONDS = Histogram(
+    "pbadmin_pritunl_request_seconds",
+    "Latency of Pritunl API calls",
+    ["target", "method", "path"],
+    buckets=_LATENCY_BUCKETS,
+)
+PRITUNL_RESPONSES = Counter(
+    "pbadmin_pritunl_responses_total",
+    "Pritunl API responses by HTTP status class (error = no response)",
+    ["target", "method", "status_class"],
+)
+
+APPLY_ROWS = Counter(
+    "pbadmin_apply_rows_total",
+    "Import rows processed by apply, by apply_status",
+    ["target", "apply_status"],
+)
+APPLY_SECONDS = Histogram(
+    "pbadmin_apply_duration_seconds",
+    "Wall time of a batch apply",
+    ["target"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+APPLY_ROWS_PER_SECOND = Histogram(
+    "pbadmin_apply_rows_per_second",
+    "Actioned rows per second of a batch apply",
+    ["target"],
+    buckets=(0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+PREVIEW_STAGE_SECONDS = Histogram(
+    "pbadmin_preview_stage_seconds",
+    "Preview duration by pipeline stage",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "pbadmin_db_query_seconds",
+    "Total SQL time spent per HTTP request, by route",
+    ["route"],
+    buckets=_LATENCY_BUCKETS,
+)
+DB_QUERIES = Counter(
+    "pbadmin_db_queries_total",
+    "SQL statements executed, by route",
+    ["route"],
+)
+
+_OBJECT_ID = re.compile(r"^[0-9a-fA-F]{24}$")
+
+
+def path_template(path: str) -> str:
+    """/user/5f0c.../5f0d... -> /user/{id}/{id}, so label cardinality stays bounded."""
+    path = path.split("?", 1)[0]
+    return "/".join("{id}" if _OBJECT_ID.match(p) else p for p in path.split("/"))
+
+
+def status_class(status: int | None) -> str:
+    if not status:
+        return "error"
+    return f"{status // 100}xx"
+
+
+def observe_pritunl_call(target: str, method: str, path: str, status: int | None, seconds: float) -> None:
+    method = method.upper()
+    PRITUNL_REQUEST_SECONDS.labels(target or "-", method, path_template(path)).observe(seconds)
+    PRITUNL_RESPONSES.labels(target or "-", method, status_class(status)).inc()
+
+
+def observe_apply(target: str, results: dict[str, Any], seconds: float) -> None:
+    for status in ("applied", "skipped", "failed"):
+        n = int(results.get(status, 0))
+        if n:
+            APPLY_ROWS.labels(target, status).inc(n)
+    APPLY_SECONDS.labels(target).observe(seconds)
+    actioned = int(results.get("applied", 0)) + int(results.get("failed", 0))
+    if seconds > 0 and actioned:
+        APPLY_ROWS_PER_SECOND.labels(target).observe(actioned / seconds)
+
+
+# Per-request SQL accounting: {"seconds": float, "queries": int}
+_db_timing: ContextVar[dict[str, float] | None] = ContextVar("pbadmin_db_timing", default=None)
+
+
+def instrument_engine(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        conn.info.setdefault("pbadmin_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        starts = conn.info.get("pbadmin_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        acc = _db_timing.get()
+        if acc is None:
+            DB_QUERY_SECONDS.labels("background").observe(elapsed)
+            DB_QUERIES.labels("background").inc()
+            return
+        acc["seconds"] += elapsed
+        acc["queries"] += 1
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: attributes SQL time to the matched route template."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        acc = {"seconds": 0.0, "queries": 0}
+        token = _db_timing.set(acc)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _db_timing.reset(token)
+            if acc["queries"]:
+                route = scope.get("route")
+                label = getattr(route, "path", None) or "unmatched"
+                DB_QUERY_SECONDS.labels(label).observe(acc["seconds"])
+                DB_QUERIES.labels(label).inc(acc["queries"])
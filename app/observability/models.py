@@ -0,0 +1,19 @@
+import uuid
+from sqlalchemy import String, Integer, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..db import Base
+
+
+class ProfilerArm(Base):
+    """A superadmin request to profile the next `remaining` requests matching path_prefix."""
+    __tablename__ = "profiler_arms"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+
+    # "" matches every profiled route
+    path_prefix: Mapped[str] = mapped_column(String, default="")
+    remaining: Mapped[int] = mapped_column(Integer, default=1)
+
+    created_by: Mapped[str] = mapped_column(String, default="unknown")
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,248 @@
+"""
+On-demand sampling profiler.
+
+A superadmin arms the profiler for the next N requests whose path starts with
+a prefix (see /superadmin). Arms live in the profiler_arms table so every
+worker sees them; each worker keeps an in-memory copy refreshed through the
+invalidation bus, so unarmed requests pay nothing but a list check.
+
+While a claimed request runs, a background thread samples, every
+PROFILER_INTERVAL_MS, only the threads working for that request: the event
+loop thread while the request's task is the one running, and threadpool
+threads (sync endpoints, streamed bodies, submit_in_context workers) whose
+copied context carries the request's sampler. Other requests, the queue
+runner and the invalidation listener are left out. Output is written to
+PROFILE_DIR as folded stacks (flamegraph.pl / speedscope compatible) with a
+JSON sidecar describing the request.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from ..db import SessionLocal
+from ..invalidation import publish, register_handler
+from ..settings import settings
+from .models import ProfilerArm
+
+# Never profile these (and never let them consume an arm)
+EXCLUDED_PREFIXES = ("/static", "/metrics", "/superadmin/profiler", "/superadmin/profiles")
+
+# Threads whose innermost frame is in one of these files are idle, not working
+_IDLE_FILES = {"threading.py", "selectors.py", "queue.py"}
+
+# The sampler of the request being profiled; copied into its threadpool calls
+_active: contextvars.ContextVar["StackSampler | None"] = contextvars.ContextVar("profiler_active", default=None)
+# Frames that run work under a copied context, and the local holding it:
+# anyio's worker threads (run_in_threadpool) and tracing.submit_in_context
+_CONTEXT_CARRIERS = {"run": "context", "_run_in_context": "ctx"}
+
+PROFILE_NAME_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[A-Z]+-[A-Za-z0-9_.-]+-[0-9a-f]{8}$")
+
+
+@dataclass(frozen=True)
+class _Arm:
+    id: str
+    path_prefix: str
+
+
+_arms: list[_Arm] = []
+_arms_lock = threading.Lock()
+
+
+def reload_arms() -> None:
+    global _arms
+    db = SessionLocal()
+    try:
+        rows = db.query(ProfilerArm).filter(ProfilerArm.remaining > 0).all()
+        fresh = [_Arm(id=a.id, path_prefix=a.path_prefix or "") for a in rows]
+    finally:
+        db.close()
+    with _arms_lock:
+        _arms = fresh
+
+
+register_handler("profiler", lambda _key: reload_arms())
+
+
+def _match(path: str) -> _Arm | None:
+    if path.startswith(EXCLUDED_PREFIXES):
+        return None
+    with _arms_lock:
+        for a in _arms:
+            if path.startswith(a.path_prefix):
+                return a
+    return None
+
+
+def _claim(arm_id: str) -> bool:
+    """Atomically take one slot of an arm; False if another worker got the last one."""
+    db = SessionLocal()
+    try:
+        left = db.execute(
+            text("UPDATE profiler_arms SET remaining = remaining - 1 WHERE id = :id AND remaining > 0 RETURNING remaining"),
+            {"id": arm_id},
+        ).scalar()
+        exhausted = left is None or left == 0
+        if exhausted:
+            publish(db, "profiler")
+        db.commit()
+    finally:
+        db.close()
+
+    if exhausted:
+        reload_arms()
+    return left is not None
+
+
+class StackSampler:
+    def __init__(self, interval_s: float, loop: asyncio.AbstractEventLoop, task: "asyncio.Task[Any] | None"):
+        self.interval_s = interval_s
+        self.counts: Counter[str] = Counter()
+        self.samples = 0
+        # The request's own task on the event loop thread
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._task = task
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=2.0)
+
+    def _serves_request(self, tid: int, frame: Any) -> bool:
+        if tid == self._loop_thread:
+            return self._task is not None and asyncio.current_task(self._loop) is self._task
+        f = frame
+        while f is not None:
+            local = _CONTEXT_CARRIERS.get(f.f_code.co_name)
+            if local is not None:
+                ctx = f.f_locals.get(local)
+                if isinstance(ctx, contextvars.Context) and ctx.get(_active) is self:
+                    return True
+            f = f.f_back
+        return False
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == threading.get_ident():
+                    continue
+                if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                if not self._serves_request(tid, frame):
+                    continue
+                tname = names.get(tid, str(tid))
+                stack = []
+                f = frame
+                while f is not None:
+                    code = f.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{f.f_lineno})")
+                    f = f.f_back
+                stack.append(tname)
+                stack.reverse()
+                self.counts[";".join(stack)] += 1
+            self.samples += 1
+
+
+def _slug(path: str) -> str:
+    s = re.sub(r"[^A-Za-z0-9_.-]+", "_", path.strip("/")) or "root"
+    return s[:60]
+
+
+def save_profile(sampler: StackSampler, meta: dict[str, Any]) -> str:
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    name = "-".join([
+        time.strftime("%Y%m%d-%H%M%S", time.gmtime(meta["started_at"])),
+        meta["method"],
+        _slug(meta["path"]),
+        os.urandom(4).hex(),
+    ])
+    base = os.path.join(settings.profile_dir, name)
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        for stack, n in sampler.counts.most_common():
+            f.write(f"{stack} {n}\n")
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump({**meta, "name": name, "samples": sampler.samples}, f)
+    return name
+
+
+def list_profiles(limit: int = 100) -> list[dict[str, Any]]:
+    if not os.path.isdir(settings.profile_dir):
+        return []
+    out = []
+    for fn in os.listdir(settings.profile_dir):
+        if not fn.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(settings.profile_dir, fn), encoding="utf-8") as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    out.sort(key=lambda m: m.get("started_at", 0), reverse=True)
+    return out[:limit]
+
+
+def profile_path(name: str) -> str | None:
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = os.path.join(settings.profile_dir, name + ".folded")
+    return path if os.path.isfile(path) else None
+
+
+class ProfilerMiddleware:
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not _arms:
+            await self.app(scope, receive, send)
+            return
+
+        arm = _match(scope["path"])
+        if arm is None or not await run_in_threadpool(_claim, arm.id):
+            await self.app(scope, receive, send)
+            return
+
+        status: dict[str, int] = {}
+
+        async def send_wrapper(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        sampler = StackSampler(settings.profiler_interval_ms / 1000.0, asyncio.get_running_loop(), asyncio.current_task())
+        started_at = time.time()
+        t0 = time.perf_counter()
+        token = _active.set(sampler)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _active.reset(token)
+            meta = {
+                "arm_id": arm.id,
+                "method": scope.get("method", "GET"),
+                "path": scope["path"],
+                "status_code": status.get("code"),
+                "started_at": started_at,
+                "duration_s": round(time.perf_counter() - t0, 4),
+                "interval_ms": settings.profiler_interval_ms,
+            }
+            await run_in_threadpool(save_profile, sampler, meta)
@@ -0,0 +1,29 @@
+import hmac
+import os
+
+from fastapi import APIRouter, Request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from starlette.responses import Response
+
+from ..settings import settings
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def metrics(request: Request):
+    # Target names and traffic volume are not for anonymous callers: no token, no endpoint
+    if not settings.metrics_enabled or not settings.metrics_token:
+        return Response(status_code=404)
+
+    auth = request.headers.get("authorization", "")
+    if not hmac.compare_digest(auth, f"Bearer {settings.metrics_token}"):
+        return Response("Unauthorized", status_code=401)
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
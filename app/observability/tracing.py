@@ -0,0 +1,131 @@
+"""
+Lightweight tracing: nested, timed spans with attributes.
+
+    with span("apply", target=t.name) as sp:
+        ...
+        sp.attributes["rows"] = len(rows)
+
+Finished spans go to the configured exporter (TRACE_EXPORTER):
+  none       drop spans (default)
+  jsonfile   append one JSON object per span to TRACE_FILE
+  pkg.mod:fn call fn() once to build a custom exporter (anything with .export(span))
+"""
+import contextvars
+import importlib
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Iterator, Protocol
+
+from ..settings import settings
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start_ts: float
+    duration_s: float = 0.0
+    status: str = "ok"  # ok|error
+    error: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+class SpanExporter(Protocol):
+    def export(self, span: Span) -> None: ...
+
+
+class NullExporter:
+    def export(self, span: Span) -> None:
+        pass
+
+
+class JsonFileExporter:
+    """Appends spans as JSON lines; safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(asdict(span), default=str, separators=(",", ":"))
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_exporter: SpanExporter = NullExporter()
+_current: ContextVar[Span | None] = ContextVar("pbadmin_span", default=None)
+
+
+def set_exporter(exporter: SpanExporter) -> None:
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter() -> SpanExporter:
+    return _exporter
+
+
+def exporter_from_settings() -> SpanExporter:
+    kind = (settings.trace_exporter or "none").strip()
+    if kind == "none":
+        return NullExporter()
+    if kind == "jsonfile":
+        return JsonFileExporter(settings.trace_file)
+    if ":" in kind:
+        mod_name, attr = kind.split(":", 1)
+        return getattr(importlib.import_module(mod_name), attr)()
+    raise RuntimeError(f"Unknown TRACE_EXPORTER '{kind}'")
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    parent = _current.get()
+    sp = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start_ts=time.time(),
+        attributes=dict(attributes),
+    )
+    token = _current.set(sp)
+    t0 = time.perf_counter()
+    try:
+        yield sp
+    except BaseException as e:
+        sp.status = "error"
+        sp.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        sp.duration_s = time.perf_counter() - t0
+        _current.reset(token)
+        try:
+            _exporter.export(sp)
+        except Exception:
+            log.exception("span export failed")
+
+
+def _run_in_context(ctx: contextvars.Context, fn: Callable[..., Any], *args: Any) -> Any:
+    # A Python frame holding ctx lets the profiler tell whose work this thread is doing
+    return ctx.run(fn, *args)
+
+
+def submit_in_context(pool: Executor, fn: Callable[..., Any], *args: Any) -> Future:
+    """Executor.submit that carries the caller's contextvars (current span included) into the worker."""
+    return pool.submit(_run_in_context, contextvars.copy_context(), fn, *args)
@@ -0,0 +1,184 @@
+"""
+Transport shared by the Pritunl API clients.
+
+PritunlClient holds the keep-alive HTTP pool, metrics/tracing of every call
+and the read helpers (orgs, users, paged listing). Subclasses only decide how
+a request is authenticated:
+  EnterpriseHmacClient (enterprise_hmac.py) - signed API token headers
+  SessionLoginClient (session_login.py)     - admin login cookie + CSRF token
+The write helpers in write.py accept either.
+"""
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterator
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..observability.metrics import observe_pritunl_call, path_template
+from ..observability.tracing import span, submit_in_context
+
+
+class PritunlHTTPError(RuntimeError):
+    def __init__(self, status_code: int, path: str, body: str):
+        super().__init__(f"HTTP {status_code} from {path}: {body[:300]}")
+        self.status_code = status_code
+
+
+class PritunlConnectionError(RuntimeError):
+    """Pritunl could not be reached (refused, timed out, TLS failure, ...)."""
+
+
+class PritunlClient(ABC):
+    # Set by the subclasses (dataclass fields)
+    base_url: str
+    verify_tls: bool
+    timeout_s: int
+    target_name: str
+    page_concurrency: int
+    _session: requests.Session | None
+
+    def __post_init__(self) -> None:
+        # Built up front, not on first use: the per-org and per-page worker threads share it
+        self._session = self._new_session()
+
+    def _new_session(self) -> requests.Session:
+        # One keep-alive pool per client, sized for the concurrent page fetches
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, self.page_concurrency))
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        return s
+
+    def _http(self) -> requests.Session:
+        return self._session
+
+    def _send(
+        self,
+        method: str,
+        path: str,
+        headers: dict[str, str],
+        json_body: Any | None = None,
+        params: dict[str, Any] | None = None,
+        cookies: dict[str, str] | None = None,
+    ) -> requests.Response:
+        url = self.base_url.rstrip("/") + path
+        if params:
+            url += "?" + urlencode(params)
+
+        data = None
+        if json_body is not None:
+            headers = {**headers, "Content-Type": "application/json"}
+            data = json.dumps(json_body)
+
+        status = None
+        t0 = time.perf_counter()
+        with span("pritunl.request", target=self.target_name, method=method.upper(), path=path_template(path)) as sp:
+            try:
+                resp = self._http().request(
+                    method=method.upper(),
+                    url=url,
+                    headers=headers,
+                    data=data,
+                    cookies=cookies,
+                    timeout=self.timeout_s,
+                    verify=self.verify_tls,
+                )
+                status = resp.status_code
+                sp.attributes["status_code"] = status
+                sp.attributes["response_bytes"] = len(resp.content)
+            except requests.RequestException as e:
+                # Callers report RuntimeErrors to the user instead of failing with a 500
+                raise PritunlConnectionError(f"Cannot reach Pritunl at {self.base_url}: {e}") from e
+            finally:
+                observe_pritunl_call(self.target_name, method, path, status, time.perf_counter() - t0)
+        return resp
+
+    @staticmethod
+    def _result(resp: requests.Response, path: str) -> Any:
+        if resp.status_code >= 400:
+            raise PritunlHTTPError(resp.status_code, path, resp.text)
+
+        if resp.headers.get("content-type", "").lower().startswith("application/json"):
+            return resp.json()
+
+        return resp.text
+
+    @abstractmethod
+    def request(self, method: str, path: str, json_body: Any | None = None, params: dict[str, Any] | None = None) -> Any:
+        """Send one authenticated call and return the decoded response (see _result)."""
+
+    def list_organizations(self):
+        return self.request("GET", "/organization")
+
+    def get_user(self, org_id: str, user_id: str) -> dict[str, Any] | None:
+        """One user by id; None if the server does not know it."""
+        try:
+            resp = self.request("GET", f"/user/{org_id}/{user_id}")
+        except PritunlHTTPError as e:
+            if e.status_code == 404:
+                return None
+            raise
+        if not isinstance(resp, dict):
+            raise RuntimeError("Unexpected user format from target.")
+        return resp
+
+    def list_users(self, org_id: str) -> list[dict[str, Any]]:
+        users: list[dict[str, Any]] = []
+        for page in self.iter_user_pages(org_id):
+            users.extend(page)
+        return users
+
+    def _user_page(self, org_id: str, page: int) -> list[dict[str, Any]]:
+        resp = self.request("GET", f"/user/{org_id}", params={"page": page})
+        if not isinstance(resp, dict) or not isinstance(resp.get("users"), list):
+            raise RuntimeError("Unexpected user list format from target.")
+        return resp["users"]
+
+    def iter_user_pages(self, org_id: str) -> Iterator[list[dict[str, Any]]]:
+        """
+        Yield the org's users page by page, in order.
+
+        Page 0 tells us page_total (Pritunl counts pages 0..page_total
+        inclusive). The remaining pages are fetched by up to page_concurrency
+        threads, at most 2x that many ahead of the consumer, so memory stays
+        bounded by the page size. Servers that ignore ?page and return a
+        plain list yield it as one page.
+        """
+        first = self.request("GET", f"/user/{org_id}", params={"page": 0})
+        if isinstance(first, list):
+            yield first
+            return
+        if not isinstance(first, dict) or not isinstance(first.get("users"), list):
+            raise RuntimeError("Unexpected user list format from target.")
+
+        yield first["users"]
+
+        last_page = int(first.get("page_total") or 0)
+        if last_page < 1:
+            return
+
+        workers = max(1, self.page_concurrency)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pritunl-pages")
+        pending: deque[Future] = deque()
+        next_page = 1
+
+        def submit() -> None:
+            nonlocal next_page
+            pending.append(submit_in_context(pool, self._user_page, org_id, next_page))
+            next_page += 1
+
+        try:
+            while next_page <= last_page and len(pending) < workers * 2:
+                submit()
+            while pending:
+                users = pending.popleft().result()
+                if next_page <= last_page:
+                    submit()
+                yield users
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
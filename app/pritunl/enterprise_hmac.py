@@ -1,22 +1,29 @@
 import base64
 import hashlib
 import hmac
-import json
 import time
 import uuid
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 
 import requests
 
+from .client import PritunlClient
+
 
 @dataclass
-class EnterpriseHmacClient:
+class EnterpriseHmacClient(PritunlClient):
     base_url: str
     api_token: str
     api_secret: str
     verify_tls: bool = True
     timeout_s: int = 15
+    # Only used to label metrics
+    target_name: str = ""
+    # Concurrent page fetches when listing users
+    page_concurrency: int = 4
+
+    _session: requests.Session | None = field(default=None, init=False, repr=False, compare=False)
 
     def _auth_headers(self, method: str, path: str) -> dict[str, str]:
         """
@@ -53,38 +60,10 @@ class EnterpriseHmacClient:
             "Auth-Signature": auth_signature,
         }
 
-    def request(self, method: str, path: str, json_body: Any | None = None) -> Any:
+    def request(self, method: str, path: str, json_body: Any | None = None, params: dict[str, Any] | None = None) -> Any:
         if not path.startswith("/"):
             path = "/" + path
 
-        url = self.base_url.rstrip("/") + path
-
-        headers = self._auth_headers(method, path)
-
-        data = None
-        if json_body is not None:
-            headers["Content-Type"] = "application/json"
-            data = json.dumps(json_body)
-
-        resp = requests.request(
-            method=method.upper(),
-            url=url,
-            headers=headers,
-            data=data,
-            timeout=self.timeout_s,
-            verify=self.verify_tls,
-        )
-
-        if resp.status_code >= 400:
-            raise RuntimeError(f"HTTP {resp.status_code} from {path}: {resp.text[:300]}")
-
-        if resp.headers.get("content-type", "").lower().startswith("application/json"):
-            return resp.json()
-
-        return resp.text
-
-    def list_organizations(self):
-        return self.request("GET", "/organization")
-
-    def list_users(self, org_id: str):
-        return self.request("GET", f"/user/{org_id}")
+        # The signature covers the path only, never the query string
+        resp = self._send(method, path, self._auth_headers(method, path), json_body=json_body, params=params)
+        return self._result(resp, path)
@@ -0,0 +1,58 @@
+from sqlalchemy import String, Boolean, DateTime, Integer, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..db import Base
+
+
+class TargetUser(Base):
+    """Local copy of one Pritunl user of a target (see app/pritunl/store.py)."""
+    __tablename__ = "target_users"
+    __table_args__ = (
+        Index("ix_target_users_target_email", "target_id", "email_key"),
+    )
+
+    target_id: Mapped[str] = mapped_column(String, primary_key=True)
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    org_id: Mapped[str] = mapped_column(String)
+
+    # Lower-cased, stripped email: the key imports match on
+    email_key: Mapped[str] = mapped_column(String, default="")
+    email: Mapped[str] = mapped_column(String, default="")
+    name: Mapped[str] = mapped_column(String, default="")
+    disabled: Mapped[bool] = mapped_column(Boolean, default=False)
+    groups: Mapped[list] = mapped_column(JSONB, default=list)
+
+    # Hash of the fields above; a refresh only rewrites rows whose hash changed
+    content_hash: Mapped[str] = mapped_column(String)
+    refreshed_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class TargetUserSync(Base):
+    """Refresh state of a target's user store."""
+    __tablename__ = "target_user_syncs"
+
+    target_id: Mapped[str] = mapped_column(String, primary_key=True)
+
+    # [{id, name}] of the orgs covered by the last refresh
+    orgs: Mapped[list] = mapped_column(JSONB, default=list)
+    user_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    # Set by writes through this app (apply, target edits): next read refreshes
+    stale: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    refreshed_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_stats: Mapped[dict] = mapped_column(JSONB, default=dict)
+
+
+class PritunlSession(Base):
+    """Login session of a session_login target, shared by all workers (see app/pritunl/sessions.py)."""
+    __tablename__ = "pritunl_sessions"
+
+    target_id: Mapped[str] = mapped_column(String, primary_key=True)
+    # Sessions of other credentials (the target was edited) are ignored
+    username: Mapped[str] = mapped_column(String)
+    # Encrypted JSON {"cookies": {...}, "csrf_token": "..."}
+    state_enc: Mapped[str] = mapped_column(String)
+
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
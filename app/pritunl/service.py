@@ -1,20 +1,45 @@
 import json
-from typing import Any
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
 
 from ..crypto import decrypt_str
+from ..observability.tracing import span, submit_in_context
+from ..settings import settings
 from ..targets.models import Target
+from .client import PritunlClient
 from .enterprise_hmac import EnterpriseHmacClient
+from .session_login import SessionLoginClient
+from .sessions import db_session_store
 
 
 def _parse_creds(target: Target) -> dict[str, Any]:
     return json.loads(decrypt_str(target.credentials_enc))
 
 
-def build_client(target: Target) -> EnterpriseHmacClient:
+def build_client(target: Target) -> PritunlClient:
+    creds = _parse_creds(target)
+
+    if target.auth_mode == "session_login":
+        username = (creds.get("username") or "").strip()
+        password = creds.get("password") or ""
+        if not username or not password:
+            raise RuntimeError("Missing login username/password for target")
+        return SessionLoginClient(
+            base_url=target.base_url,
+            username=username,
+            password=password,
+            verify_tls=target.verify_tls,
+            target_name=target.name,
+            page_concurrency=settings.pritunl_page_concurrency,
+            target_id=target.id,
+            store=db_session_store,
+        )
+
     if target.auth_mode != "enterprise_hmac":
-        raise RuntimeError("Target auth_mode is not enterprise_hmac")
+        raise RuntimeError(f"Unknown target auth_mode '{target.auth_mode}'")
 
-    creds = _parse_creds(target)
     token = (creds.get("api_token") or "").strip()
     secret = (creds.get("api_secret") or "").strip()
     if not token or not secret:
@@ -25,6 +50,8 @@ def build_client(target: Target) -> EnterpriseHmacClient:
         api_token=token,
         api_secret=secret,
         verify_tls=target.verify_tls,
+        target_name=target.name,
+        page_concurrency=settings.pritunl_page_concurrency,
     )
 
 
@@ -41,4 +68,111 @@ def choose_org(orgs: list[dict[str, Any]], org_name: str | None) -> dict[str, An
     if len(orgs) == 1:
         return orgs[0]
 
-    raise RuntimeError("Multiple orgs found; set Org Name on the target to disambiguate")
+    raise RuntimeError("Multiple orgs found; set Org Name on the target to one org, a comma-separated list, or *")
+
+
+def choose_orgs(orgs: list[dict[str, Any]], org_name: str | None) -> list[dict[str, Any]]:
+    """
+    Orgs a target covers. org_name may be blank (the server's only org), "*"
+    (every org), or a comma-separated list of org names.
+    """
+    if not orgs:
+        raise RuntimeError("No organizations returned by target")
+
+    spec = (org_name or "").strip()
+    if spec == "*":
+        return sorted(orgs, key=lambda o: (o.get("name") or ""))
+
+    names = [n.strip() for n in spec.split(",") if n.strip()]
+    if len(names) <= 1:
+        return [choose_org(orgs, names[0] if names else None)]
+
+    by_name = {(o.get("name") or "").strip(): o for o in orgs}
+    missing = [n for n in names if n not in by_name]
+    if missing:
+        raise RuntimeError(f"Org(s) not found on target: {', '.join(missing)}")
+    return [by_name[n] for n in dict.fromkeys(names)]
+
+
+def resolve_orgs(client: PritunlClient, target: Target) -> list[dict[str, Any]]:
+    """The orgs the target covers (see choose_orgs for the Org Name syntax)."""
+    chosen = choose_orgs(client.list_organizations(), target.org_name)
+    if any(not o.get("id") for o in chosen):
+        raise RuntimeError("Chosen org did not include an 'id' field.")
+    return chosen
+
+
+def fetch_users(client: PritunlClient, org_id: str) -> list[dict[str, Any]]:
+    users = client.list_users(org_id)
+    if not isinstance(users, list):
+        raise RuntimeError("Unexpected user list format from target.")
+    return users
+
+
+def org_workers(n_orgs: int) -> int:
+    """Worker threads for per-org listing/apply (PRITUNL_ORG_CONCURRENCY)."""
+    return max(1, min(n_orgs, settings.pritunl_org_concurrency))
+
+
+def iter_all_user_pages(client: PritunlClient, orgs: list[dict[str, Any]]) -> Iterator[list[dict[str, Any]]]:
+    """
+    Pages of the users of every org, in no particular order. Each user's
+    "organization" is set to the org it was listed from.
+
+    PRITUNL_ORG_CONCURRENCY orgs are listed at a time on worker threads, which
+    hand pages over through a small bounded queue: listing overlaps with the
+    consumer's work and memory stays bounded by the page size, not the
+    target's user count. Stopping early cancels the remaining listings.
+    """
+    pages: queue.Queue[list[dict[str, Any]]] = queue.Queue(maxsize=max(2, client.page_concurrency))
+    stop = threading.Event()
+
+    def list_org(org: dict[str, Any]) -> None:
+        with span("pritunl.list_org_users", org=org.get("name")) as sp:
+            n = 0
+            for page in client.iter_user_pages(org["id"]):
+                for u in page:
+                    u["organization"] = org["id"]
+                n += len(page)
+                while True:
+                    if stop.is_set():
+                        return
+                    try:
+                        pages.put(page, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+            sp.attributes["users"] = n
+
+    pool = ThreadPoolExecutor(max_workers=org_workers(len(orgs)), thread_name_prefix="org-list")
+    futures = [submit_in_context(pool, list_org, o) for o in orgs]
+    try:
+        while True:
+            try:
+                page = pages.get(timeout=0.05)
+            except queue.Empty:
+                failed = next((f for f in futures if f.done() and f.exception() is not None), None)
+                if failed is not None:
+                    failed.result()
+                # Producers only finish after their last put, so an empty queue now means done
+                if all(f.done() for f in futures) and pages.empty():
+                    break
+                continue
+            yield page
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def fetch_users_by_id(client: PritunlClient, org_id: str, user_ids: list[str]) -> dict[str, dict[str, Any] | None]:
+    """Targeted lookups, page_concurrency at a time. Unknown ids map to None."""
+    if not user_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(user_ids), client.page_concurrency)),
+                            thread_name_prefix="pritunl-lookup") as pool:
+        futures = {uid: submit_in_context(pool, client.get_user, org_id, uid) for uid in user_ids}
+        return {uid: f.result() for uid, f in futures.items()}
+
+
+def org_label(orgs: list[dict[str, Any]]) -> str:
+    return ", ".join(str(o.get("name") or o.get("id")) for o in orgs)
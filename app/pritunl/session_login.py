@@ -0,0 +1,162 @@
+"""
+Client for targets without API tokens (Pritunl Community Edition,
+auth_mode session_login): authenticates like the admin web UI.
+
+Logging in (POST /auth/session) yields a session cookie; the CSRF token the
+UI sends on every call comes from /state. That pair is the SessionState. It
+is shared by every client of the same target in this worker, and, through a
+SessionStore (app/pritunl/sessions.py), by all workers, so bulk jobs log in
+once instead of once per operation. When Pritunl answers 401 (expired or
+revoked session) the client logs in again, once, and retries the call; a
+store makes sure concurrent workers do not all log in at the same time.
+"""
+import http.cookiejar
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Protocol
+
+import requests
+
+from .client import PritunlClient
+
+# Endpoints that hand out the CSRF token, newest Pritunl first
+_CSRF_PATHS = ("/state", "/auth/csrf")
+
+
+@dataclass(frozen=True)
+class SessionState:
+    cookies: dict[str, str]
+    csrf_token: str = ""
+
+
+class SessionStore(Protocol):
+    def load(self, target_id: str, username: str) -> SessionState | None: ...
+
+    def save(self, target_id: str, username: str, state: SessionState) -> None: ...
+
+    def renew(
+        self, target_id: str, username: str, stale: SessionState | None, login: Callable[[], SessionState],
+    ) -> SessionState: ...
+
+
+_states_lock = threading.Lock()
+_states: dict[tuple[str, str, str], SessionState] = {}
+_login_locks: dict[tuple[str, str, str], threading.Lock] = defaultdict(threading.Lock)
+
+
+def forget_sessions(target_id: str | None = None) -> None:
+    """Drop this worker's cached sessions (of one target, or all)."""
+    with _states_lock:
+        for key in [k for k in _states if target_id is None or k[0] == target_id]:
+            _states.pop(key, None)
+
+
+@dataclass
+class SessionLoginClient(PritunlClient):
+    base_url: str
+    username: str
+    password: str
+    verify_tls: bool = True
+    timeout_s: int = 15
+    # Only used to label metrics
+    target_name: str = ""
+    # Concurrent page fetches when listing users
+    page_concurrency: int = 4
+    # Sessions are shared per target id (falls back to base_url without one)
+    target_id: str = ""
+    store: SessionStore | None = None
+
+    _session: requests.Session | None = field(default=None, init=False, repr=False, compare=False)
+
+    def _new_session(self) -> requests.Session:
+        s = super()._new_session()
+        # Cookies travel in the shared SessionState, never in this pool's jar
+        s.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        return s
+
+    def _key(self) -> tuple[str, str, str]:
+        return (self.target_id or self.base_url, self.base_url, self.username)
+
+    def _current(self) -> SessionState:
+        key = self._key()
+        with _states_lock:
+            state = _states.get(key)
+        if state is not None:
+            return state
+        if self.store is not None:
+            state = self.store.load(self.target_id, self.username)
+            if state is not None:
+                with _states_lock:
+                    _states.setdefault(key, state)
+                return state
+        return self._renew(None)
+
+    def _renew(self, stale: SessionState | None) -> SessionState:
+        """A session other than stale: one another thread/worker just made, or a fresh login."""
+        key = self._key()
+        with _states_lock:
+            login_lock = _login_locks[key]
+        with login_lock:
+            with _states_lock:
+                state = _states.get(key)
+            if state is None or state == stale:
+                if self.store is not None:
+                    state = self.store.renew(self.target_id, self.username, stale, self._login)
+                else:
+                    state = self._login()
+                with _states_lock:
+                    _states[key] = state
+            return state
+
+    def _login(self) -> SessionState:
+        resp = self._send("POST", "/auth/session", {}, json_body={"username": self.username, "password": self.password})
+        if resp.status_code in (401, 403):
+            raise RuntimeError(f"Pritunl login failed for '{self.username}' (HTTP {resp.status_code}); check the target's credentials.")
+        self._result(resp, "/auth/session")
+        cookies = resp.cookies.get_dict()
+        if not cookies:
+            raise RuntimeError("Pritunl login returned no session cookie.")
+        return SessionState(cookies=cookies, csrf_token=self._csrf_token(cookies))
+
+    def _csrf_token(self, cookies: dict[str, str]) -> str:
+        for path in _CSRF_PATHS:
+            resp = self._send("GET", path, {}, cookies=cookies)
+            if resp.status_code == 404:
+                continue
+            data = self._result(resp, path)
+            if isinstance(data, dict) and data.get("csrf_token"):
+                return str(data["csrf_token"])
+        return ""
+
+    def _call(self, state: SessionState, method: str, path: str, json_body: Any, params: dict[str, Any] | None) -> requests.Response:
+        headers = {"Csrf-Token": state.csrf_token} if state.csrf_token else {}
+        return self._send(method, path, headers, json_body=json_body, params=params, cookies=state.cookies)
+
+    def request(self, method: str, path: str, json_body: Any | None = None, params: dict[str, Any] | None = None) -> Any:
+        if not path.startswith("/"):
+            path = "/" + path
+
+        state = self._current()
+        resp = self._call(state, method, path, json_body, params)
+        if resp.status_code == 401:
+            state = self._renew(state)
+            resp = self._call(state, method, path, json_body, params)
+        elif resp.cookies:
+            self._refreshed(state, resp.cookies.get_dict())
+        return self._result(resp, path)
+
+    def _refreshed(self, state: SessionState, cookies: dict[str, str]) -> None:
+        """Pritunl re-issued the session cookie: keep using (and share) the new one."""
+        merged = {**state.cookies, **cookies}
+        if merged == state.cookies:
+            return
+        new = SessionState(cookies=merged, csrf_token=state.csrf_token)
+        key = self._key()
+        with _states_lock:
+            if _states.get(key) != state:
+                return  # someone already replaced it
+            _states[key] = new
+        if self.store is not None:
+            self.store.save(self.target_id, self.username, new)
+
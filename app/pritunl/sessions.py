@@ -0,0 +1,73 @@
+"""
+Postgres SessionStore for session_login targets (pritunl_sessions).
+
+The cookie and CSRF token are stored encrypted with the master key, like
+target credentials. Renewals take a per-target advisory lock and re-read the
+row first, so when a session expires only one worker logs in and the others
+pick up its new session.
+"""
+import json
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..crypto import decrypt_str, encrypt_str
+from ..db import SessionLocal
+from ..importer.apply import advisory_lock_key_from_str
+from ..invalidation import register_handler
+from .models import PritunlSession
+from .session_login import SessionState, forget_sessions
+
+
+def _read(db: Session, target_id: str, username: str) -> SessionState | None:
+    row = db.get(PritunlSession, target_id, populate_existing=True)
+    if row is None or row.username != username:
+        return None
+    try:
+        data = json.loads(decrypt_str(row.state_enc))
+    except Exception:
+        return None  # master key rotated: log in again
+    return SessionState(cookies=dict(data.get("cookies") or {}), csrf_token=data.get("csrf_token") or "")
+
+
+def _write(db: Session, target_id: str, username: str, state: SessionState) -> None:
+    enc = encrypt_str(json.dumps({"cookies": state.cookies, "csrf_token": state.csrf_token}))
+    stmt = pg_insert(PritunlSession).values(target_id=target_id, username=username, state_enc=enc)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[PritunlSession.target_id],
+        set_={"username": stmt.excluded.username, "state_enc": stmt.excluded.state_enc, "updated_at": text("now()")},
+    ))
+
+
+class DbSessionStore:
+    def load(self, target_id: str, username: str) -> SessionState | None:
+        with SessionLocal() as db:
+            return _read(db, target_id, username)
+
+    def save(self, target_id: str, username: str, state: SessionState) -> None:
+        with SessionLocal() as db:
+            _write(db, target_id, username, state)
+            db.commit()
+
+    def renew(
+        self, target_id: str, username: str, stale: SessionState | None, login: Callable[[], SessionState],
+    ) -> SessionState:
+        with SessionLocal() as db:
+            k = advisory_lock_key_from_str(f"pritunl-session:{target_id}")
+            db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": k})
+            current = _read(db, target_id, username)
+            if current is not None and current != stale:
+                db.commit()
+                return current  # another worker already logged in
+            state = login()
+            _write(db, target_id, username, state)
+            db.commit()
+            return state
+
+
+db_session_store = DbSessionStore()
+
+# Edited targets may have new credentials or a new URL
+register_handler("target", forget_sessions)
@@ -0,0 +1,87 @@
+"""
+Per-worker cache of the organizations + user list a preview evaluates against.
+
+The list comes from the Postgres user store (app/pritunl/store.py); keeping it
+in memory saves re-reading a large org when the same CSV is re-uploaded.
+Snapshots are kept for USER_SNAPSHOT_TTL_S and dropped early when a store
+refresh, an apply or a target edit publishes a "users"/"target" invalidation
+(see app/invalidation.py).
+
+Apply never uses this cache: it always re-lists live users before writing.
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from ..invalidation import register_handler
+from ..settings import settings
+
+# Only fields that influence a preview take part in the fingerprint
+_FINGERPRINT_FIELDS = ("id", "organization", "email", "name", "disabled", "groups")
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    orgs: list[dict[str, Any]]
+    users: list[dict[str, Any]]
+    fingerprint: str
+    fetched_at: float
+
+
+def users_fingerprint(org_ids: list[str], users: list[dict[str, Any]]) -> str:
+    """Order-independent content hash of the preview-relevant user fields."""
+    rows = sorted(
+        json.dumps([u.get(f) for f in _FINGERPRINT_FIELDS], sort_keys=True, default=str, separators=(",", ":"))
+        for u in users
+    )
+    h = hashlib.sha256(",".join(sorted(org_ids)).encode("utf-8"))
+    for r in rows:
+        h.update(b"\n")
+        h.update(r.encode("utf-8"))
+    return h.hexdigest()
+
+
+_lock = threading.Lock()
+_snapshots: dict[str, UserSnapshot] = {}
+
+
+def get_user_snapshot(
+    target_id: str,
+    load: Callable[[], tuple[list[dict[str, Any]], list[dict[str, Any]]]],
+) -> tuple[UserSnapshot, bool]:
+    """
+    Return (snapshot, from_cache). load() must return (orgs, users) and is only
+    called when there is no fresh snapshot for the target.
+    """
+    now = time.monotonic()
+    with _lock:
+        snap = _snapshots.get(target_id)
+    if snap is not None and (now - snap.fetched_at) < settings.user_snapshot_ttl_s:
+        return snap, True
+
+    orgs, users = load()
+    snap = UserSnapshot(
+        orgs=orgs,
+        users=users,
+        fingerprint=users_fingerprint([str(o.get("id") or "") for o in orgs], users),
+        fetched_at=time.monotonic(),
+    )
+    if settings.user_snapshot_ttl_s > 0:
+        with _lock:
+            _snapshots[target_id] = snap
+    return snap, False
+
+
+def invalidate_user_snapshot(target_id: str | None = None) -> None:
+    with _lock:
+        if target_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(target_id, None)
+
+
+register_handler("users", invalidate_user_snapshot)
+register_handler("target", invalidate_user_snapshot)
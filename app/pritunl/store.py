@@ -0,0 +1,273 @@
+"""
+Postgres store of each target's Pritunl users (target_users).
+
+Preview, export and the connection test read users from here. They only list
+users from Pritunl when the store is older than USER_STORE_MAX_AGE_S, was
+marked stale by a write through this app, or a refresh is requested. A
+refresh lists every org of the target once and upserts only the users whose
+content hash changed; users that disappeared are deleted.
+
+Apply does not trust the store: it re-lists live users before writing and
+marks the store stale afterwards.
+"""
+import hashlib
+import json
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Iterable, Iterator
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..importer.apply import advisory_lock_key_from_str, now_utc
+from ..invalidation import publish
+from ..observability.tracing import span
+from ..settings import settings
+from ..targets.models import Target
+from .client import PritunlClient
+from .models import TargetUser, TargetUserSync
+from .service import build_client, iter_all_user_pages, resolve_orgs
+
+_UPSERT_COLUMNS = ("org_id", "email_key", "email", "name", "disabled", "groups", "content_hash")
+_CHUNK = 1000
+
+
+@dataclass
+class RefreshStats:
+    users: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> int:
+        return self.inserted + self.updated + self.deleted
+
+
+@dataclass
+class StoredUsers:
+    orgs: list[dict[str, Any]]
+    users: list[dict[str, Any]]
+    refreshed_at: datetime
+
+
+def _groups(v: Any) -> list[str]:
+    if isinstance(v, str):
+        v = v.split(",")
+    return [str(g).strip() for g in (v or []) if str(g).strip()]
+
+
+def _user_row(target_id: str, u: dict[str, Any]) -> dict[str, Any] | None:
+    user_id = str(u.get("id") or "")
+    if not user_id:
+        return None
+    email = (u.get("email") or "").strip()
+    row = {
+        "target_id": target_id,
+        "user_id": user_id,
+        "org_id": str(u.get("organization") or ""),
+        "email_key": email.lower(),
+        "email": email,
+        "name": (u.get("name") or "").strip(),
+        "disabled": bool(u.get("disabled", False)),
+        "groups": _groups(u.get("groups")),
+    }
+    raw = json.dumps([row[c] for c in _UPSERT_COLUMNS if c != "content_hash"] + [user_id], separators=(",", ":"))
+    row["content_hash"] = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return row
+
+
+def _user_dict(r: Any) -> dict[str, Any]:
+    """A stored row in the shape Pritunl returns users in (the fields we use)."""
+    return {
+        "id": r.user_id,
+        "organization": r.org_id,
+        "email": r.email,
+        "name": r.name,
+        "disabled": r.disabled,
+        "groups": list(r.groups or []),
+    }
+
+
+def stored_shape(u: dict[str, Any] | None) -> dict[str, Any] | None:
+    """A live Pritunl user as the store (and so every preview) sees it."""
+    if u is None:
+        return None
+    row = _user_row("", u)
+    if row is None:
+        return None
+    return _user_dict(SimpleNamespace(**row))
+
+
+def _chunks(seq: list[Any], n: int = _CHUNK) -> Iterator[list[Any]]:
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+_LOCK_POLL_S = 0.25
+
+
+def _lock(db: Session, target: Target) -> None:
+    """
+    Serialize refreshes of one target; released when the transaction ends.
+
+    A refresh holds the lock for the whole listing, so waiters poll for at
+    most USER_STORE_LOCK_WAIT_S instead of blocking (and pinning a pooled
+    connection) until a slow target has been listed.
+    """
+    k = advisory_lock_key_from_str(f"user-store:{target.id}")
+    deadline = time.monotonic() + settings.user_store_lock_wait_s
+    while not db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": k}).scalar():
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Users of target '{target.name}' are being refreshed by another request; try again shortly.")
+        time.sleep(_LOCK_POLL_S)
+
+
+def _is_fresh(sync: TargetUserSync | None) -> bool:
+    if sync is None or sync.refreshed_at is None or sync.stale:
+        return False
+    return (now_utc() - sync.refreshed_at).total_seconds() < settings.user_store_max_age_s
+
+
+def _write_changed(db: Session, rows: list[dict[str, Any]]) -> None:
+    stmt = pg_insert(TargetUser).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TargetUser.target_id, TargetUser.user_id],
+        set_={**{c: stmt.excluded[c] for c in _UPSERT_COLUMNS}, "refreshed_at": func.now()},
+    )
+    db.execute(stmt)
+
+
+def _upsert(db: Session, target_id: str, pages: Iterable[list[dict[str, Any]]]) -> RefreshStats:
+    """
+    Write changed users page by page as they are listed. Only ids and content
+    hashes are kept for the whole target.
+    """
+    have = dict(db.execute(
+        select(TargetUser.user_id, TargetUser.content_hash).where(TargetUser.target_id == target_id)
+    ).all())
+
+    stats = RefreshStats()
+    changed: list[dict[str, Any]] = []
+    seen: set[str] = set()
+    for page in pages:
+        for u in page:
+            row = _user_row(target_id, u)
+            if row is None or row["user_id"] in seen:
+                continue
+            seen.add(row["user_id"])
+            old = have.get(row["user_id"])
+            if old == row["content_hash"]:
+                stats.unchanged += 1
+                continue
+            if old is None:
+                stats.inserted += 1
+            else:
+                stats.updated += 1
+            changed.append(row)
+            if len(changed) >= _CHUNK:
+                _write_changed(db, changed)
+                changed = []
+    if changed:
+        _write_changed(db, changed)
+    stats.users = len(seen)
+
+    gone = [uid for uid in have if uid not in seen]
+    for chunk in _chunks(gone):
+        db.execute(delete(TargetUser).where(TargetUser.target_id == target_id, TargetUser.user_id.in_(chunk)))
+    stats.deleted = len(gone)
+    return stats
+
+
+def refresh_target_users(
+    db: Session,
+    target: Target,
+    client: PritunlClient | None = None,
+) -> RefreshStats:
+    """List the target's users from Pritunl and bring the store up to date. Commits."""
+    with span("user_store.refresh", target=target.name) as sp:
+        try:
+            _lock(db, target)
+            c = client or build_client(target)
+            orgs = resolve_orgs(c, target)
+            # Pages are upserted as they arrive; the whole user list is never held in memory
+            with span("user_store.upsert") as usp:
+                stats = _upsert(db, target.id, iter_all_user_pages(c, orgs))
+                usp.attributes["users"] = stats.users
+
+            sync = db.get(TargetUserSync, target.id) or TargetUserSync(target_id=target.id)
+            sync.orgs = [{"id": o["id"], "name": o.get("name")} for o in orgs]
+            sync.user_count = stats.users
+            sync.stale = False
+            sync.refreshed_at = now_utc()
+            sync.last_stats = asdict(stats)
+            db.add(sync)
+            if stats.changed:
+                publish(db, "users", target.id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        sp.attributes.update(asdict(stats))
+    return stats
+
+
+def ensure_fresh(
+    db: Session,
+    target: Target,
+    client: PritunlClient | None = None,
+) -> TargetUserSync:
+    """The target's refresh state, refreshing first when the store is missing, stale or too old."""
+    sync = db.get(TargetUserSync, target.id)
+    if _is_fresh(sync):
+        return sync
+
+    # Another request may be refreshing the same target: wait for it, then re-check
+    _lock(db, target)
+    sync = db.get(TargetUserSync, target.id, populate_existing=True)
+    if _is_fresh(sync):
+        db.commit()
+        return sync
+
+    refresh_target_users(db, target, client)
+    return db.get(TargetUserSync, target.id)
+
+
+def load_target_users(
+    db: Session,
+    target: Target,
+    client: PritunlClient | None = None,
+) -> StoredUsers:
+    sync = ensure_fresh(db, target, client)
+    users = [_user_dict(r) for r in db.execute(
+        select(TargetUser).where(TargetUser.target_id == target.id).order_by(TargetUser.org_id, TargetUser.email_key)
+    ).scalars()]
+    return StoredUsers(orgs=list(sync.orgs or []), users=users, refreshed_at=sync.refreshed_at)
+
+
+def iter_target_users(db: Session, target_id: str) -> Iterator[dict[str, Any]]:
+    """Stream stored users ordered by org and email without loading them all."""
+    rows = db.execute(
+        select(TargetUser)
+        .where(TargetUser.target_id == target_id)
+        .order_by(TargetUser.org_id, TargetUser.email_key)
+        .execution_options(yield_per=_CHUNK)
+    ).scalars()
+    for r in rows:
+        yield _user_dict(r)
+
+
+def mark_stale(db: Session, target_id: str) -> None:
+    """Force the next read to refresh. Runs in the caller's transaction."""
+    db.execute(update(TargetUserSync).where(TargetUserSync.target_id == target_id).values(stale=True))
+
+
+def org_user_counts(db: Session, target_id: str) -> dict[str, int]:
+    """Stored users per org id (how big a full re-list of each org would be)."""
+    return dict(db.execute(
+        select(TargetUser.org_id, func.count()).where(TargetUser.target_id == target_id).group_by(TargetUser.org_id)
+    ).all())
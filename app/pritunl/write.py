@@ -1,10 +1,10 @@
 from typing import Any
 
-from .enterprise_hmac import EnterpriseHmacClient
+from .client import PritunlClient
 
 
 def create_user(
-    client: EnterpriseHmacClient,
+    client: PritunlClient,
     org_id: str,
     name: str,
     email: str,
@@ -54,11 +54,11 @@ def create_user(
     return user_obj
 
 
-def update_user_full(client: EnterpriseHmacClient, org_id: str, user_id: str, full_user_obj: dict[str, Any]) -> dict[str, Any]:
+def update_user_full(client: PritunlClient, org_id: str, user_id: str, full_user_obj: dict[str, Any]) -> dict[str, Any]:
     full_user_obj = dict(full_user_obj)
     full_user_obj["organization_id"] = org_id
     return client.request("PUT", f"/user/{org_id}/{user_id}", json_body=full_user_obj)
 
 
-def delete_user(client: EnterpriseHmacClient, org_id: str, user_id: str) -> Any:
+def delete_user(client: PritunlClient, org_id: str, user_id: str) -> Any:
     return client.request("DELETE", f"/user/{org_id}/{user_id}")
@@ -16,5 +16,52 @@ class Settings(BaseModel):
 
     allow_delete: bool = os.getenv("ALLOW_DELETE", "false").lower() == "true"
 
+    # How long a worker trusts its cached guardrail settings before re-checking the version
+    settings_cache_ttl_s: float = float(os.getenv("SETTINGS_CACHE_TTL_S", "5"))
+
+    # How long a preview may reuse a target's user list (0 = always re-list)
+    user_snapshot_ttl_s: float = float(os.getenv("USER_SNAPSHOT_TTL_S", "60"))
+    # How old the Postgres user store may get before a read re-lists users from Pritunl
+    user_store_max_age_s: float = float(os.getenv("USER_STORE_MAX_AGE_S", "900"))
+    # How long a read waits for another request's refresh of the same target before giving up
+    user_store_lock_wait_s: float = float(os.getenv("USER_STORE_LOCK_WAIT_S", "30"))
+
+    # Parallel page fetches when listing a large org's users
+    pritunl_page_concurrency: int = int(os.getenv("PRITUNL_PAGE_CONCURRENCY", "4"))
+    # Orgs of a multi-org target listed/applied in parallel
+    pritunl_org_concurrency: int = int(os.getenv("PRITUNL_ORG_CONCURRENCY", "4"))
+
+    # Apply pending schema migrations on startup (otherwise refuse to start when behind)
+    auto_migrate: bool = os.getenv("AUTO_MIGRATE", "true").lower() == "true"
+
+    # Prometheus /metrics endpoint; only served when METRICS_TOKEN is set, to scrapers
+    # sending "Authorization: Bearer <token>"
+    metrics_enabled: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    metrics_token: str | None = os.getenv("METRICS_TOKEN") or None
+
+    # Span exporter: none | jsonfile | "package.module:factory"
+    trace_exporter: str = os.getenv("TRACE_EXPORTER", "none")
+    trace_file: str = os.getenv("TRACE_FILE", "/tmp/pbadmin-traces.jsonl")
+
+    # On-demand request profiler (armed from /superadmin)
+    profile_dir: str = os.getenv("PROFILE_DIR", "/tmp/pbadmin-profiles")
+    profiler_interval_ms: float = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+
+    # Subscribe to cross-worker cache invalidations (Postgres LISTEN/NOTIFY)
+    invalidation_listen: bool = os.getenv("CACHE_INVALIDATION_LISTEN", "true").lower() == "true"
+
+    # gzip/brotli for HTML, CSV and JSON responses of at least COMPRESSION_MIN_SIZE bytes
+    compression_enabled: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    compression_min_size: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    compression_gzip_level: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+    compression_brotli_quality: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+    # Compiled templates are cached here across worker restarts ("" = in memory only)
+    template_cache_dir: str = os.getenv("TEMPLATE_CACHE_DIR", "/tmp/pbadmin-jinja-cache")
+
+    # Run queued applies in this worker; runners also poll every APPLY_QUEUE_POLL_S
+    apply_runner: bool = os.getenv("APPLY_RUNNER", "true").lower() == "true"
+    apply_queue_poll_s: float = float(os.getenv("APPLY_QUEUE_POLL_S", "5"))
+
 
 settings = Settings()
@@ -16,5 +16,8 @@ class AppSettings(Base):
 
     require_typed_confirm: Mapped[bool] = mapped_column(Boolean, default=True)
 
+    # Bumped on every change; workers compare it against their cached copy
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
+
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
@@ -1,5 +1,29 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
 from sqlalchemy.orm import Session
+
+from .settings import settings as app_config
 from .settings_db import AppSettings
+from .invalidation import register_handler
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """Read-only copy of AppSettings, safe to share between requests."""
+    version: int
+    warn_disable_count: int
+    warn_delete_count: int
+    warn_group_clear_count: int
+    warn_create_count: int
+    require_typed_confirm: bool
+
+
+_cache_lock = threading.Lock()
+_cached: SettingsSnapshot | None = None
+_checked_at: float = 0.0
 
 
 def get_settings(db: Session) -> AppSettings:
@@ -10,3 +34,80 @@ def get_settings(db: Session) -> AppSettings:
         db.commit()
         db.refresh(s)
     return s
+
+
+def _snapshot(s: AppSettings) -> SettingsSnapshot:
+    return SettingsSnapshot(
+        version=int(s.version or 0),
+        warn_disable_count=int(s.warn_disable_count),
+        warn_delete_count=int(s.warn_delete_count),
+        warn_group_clear_count=int(s.warn_group_clear_count),
+        warn_create_count=int(s.warn_create_count),
+        require_typed_confirm=bool(s.require_typed_confirm),
+    )
+
+
+def get_cached_settings(db: Session) -> SettingsSnapshot:
+    """
+    Guardrail settings for read paths (preview, superadmin page).
+
+    Within SETTINGS_CACHE_TTL_S the in-process copy is returned without touching
+    the DB. After that only the version counter is read; the full row is
+    reloaded only when another worker has bumped it. Changes published on the
+    invalidation bus drop the copy immediately.
+    """
+    global _cached, _checked_at
+
+    now = time.monotonic()
+    cached = _cached
+    if cached is not None and (now - _checked_at) < app_config.settings_cache_ttl_s:
+        return cached
+
+    if cached is not None:
+        version = db.query(AppSettings.version).filter(AppSettings.id == "global").scalar()
+        if version is not None and int(version) == cached.version:
+            with _cache_lock:
+                _checked_at = now
+            return cached
+
+    snap = _snapshot(get_settings(db))
+    with _cache_lock:
+        _cached = snap
+        _checked_at = now
+    return snap
+
+
+def guardrail_warnings(s: SettingsSnapshot, summary: Any) -> tuple[dict[str, bool], list[str]]:
+    """Which guardrail thresholds a preview summary meets or exceeds (warnings only), and messages for them."""
+    warn = {
+        "creates": (s.warn_create_count > 0 and summary.creates >= s.warn_create_count),
+        "disables": (s.warn_disable_count > 0 and summary.disables >= s.warn_disable_count),
+        "deletes": (s.warn_delete_count > 0 and summary.deletes >= s.warn_delete_count),
+        "clears": (s.warn_group_clear_count > 0 and summary.clears >= s.warn_group_clear_count),
+    }
+
+    msgs = []
+    if warn["disables"]:
+        msgs.append(f"Disables in batch: {summary.disables} (warn threshold: {s.warn_disable_count})")
+    if warn["deletes"]:
+        msgs.append(f"Deletes in batch: {summary.deletes} (warn threshold: {s.warn_delete_count})")
+    if warn["clears"]:
+        msgs.append(f"Group clears in batch: {summary.clears} (warn threshold: {s.warn_group_clear_count})")
+    if warn["creates"]:
+        msgs.append(f"Creates in batch: {summary.creates} (warn threshold: {s.warn_create_count})")
+    return warn, msgs
+
+
+def bump_settings_version(s: AppSettings) -> None:
+    """Call before committing a change to AppSettings so other workers reload it."""
+    s.version = int(s.version or 0) + 1
+
+
+def invalidate_settings_cache() -> None:
+    global _cached, _checked_at
+    with _cache_lock:
+        _cached = None
+        _checked_at = 0.0
+
+
+register_handler("settings", lambda _key: invalidate_settings_cache())
@@ -1,24 +1,26 @@
 import csv
 import io
 import json
-from typing import Any
 
 from fastapi import APIRouter, Depends, Form, Request, UploadFile, File
 from fastapi.responses import RedirectResponse
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 
-from ..db import get_db
+from ..db import SessionLocal, get_db
 from ..crypto import encrypt_str
 from .models import Target
 from ..auth.routes import require_login
-from ..pritunl.service import build_client, choose_org
-from ..pritunl.write import create_user, update_user_full, delete_user
-from ..importer.preview import preview_csv_against_users, preview_report_csv
-from ..importer.models import ImportBatch, ImportRow, AuditLog
-from ..importer.apply import sha256_hex, stable_json_hash, acquire_target_lock, release_target_lock, get_actor_from_request, now_utc
-from ..settings import settings
-from ..settings_service import get_settings
+from ..pritunl.models import TargetUserSync
+from ..pritunl.store import ensure_fresh, iter_target_users, load_target_users, mark_stale, refresh_target_users
+from ..importer.preview import preview_report_csv
+from ..importer.blobs import batch_csv
+from ..importer.models import ApplyJob, ImportBatch, ImportRow
+from ..importer.apply import get_actor_from_request
+from ..importer.queue import BatchNotApplicable, enqueue_apply, queue_position, run_next
+from ..importer.service import PreviewOptions, apply_refusal, items_from_rows, run_preview
+from ..settings_service import get_cached_settings, guardrail_warnings
+from ..invalidation import publish
 
 router = APIRouter()
 
@@ -91,6 +93,8 @@ def targets_new_post(
     )
 
     db.add(t)
+    db.flush()
+    publish(db, "target", t.id)
     db.commit()
     return RedirectResponse("/targets", status_code=303)
 
@@ -139,6 +143,8 @@ def targets_create(
     )
 
     db.add(t)
+    db.flush()
+    publish(db, "target", t.id)
     db.commit()
     return RedirectResponse("/targets", status_code=303)
 
@@ -153,12 +159,47 @@ def target_detail(request: Request, target_id: str, db: Session = Depends(get_db
     if not t:
         return RedirectResponse("/targets", status_code=303)
 
+    recent_batches = (
+        db.query(ImportBatch)
+        .filter(ImportBatch.target_id == t.id)
+        .order_by(ImportBatch.created_at.desc())
+        .limit(10)
+        .all()
+    )
+
     return _templates(request).TemplateResponse(
         "target_detail.html",
-        {"request": request, "target": t, "result": None, "error": None},
+        {
+            "request": request,
+            "target": t,
+            "result": None,
+            "error": None,
+            "recent_batches": recent_batches,
+            "user_store": db.get(TargetUserSync, t.id),
+        },
     )
 
 
+@router.post("/targets/{target_id}/users/refresh")
+def target_users_refresh(request: Request, target_id: str, db: Session = Depends(get_db)):
+    redir = require_login(request)
+    if redir:
+        return redir
+
+    t = db.query(Target).filter(Target.id == target_id).first()
+    if not t:
+        return RedirectResponse("/targets", status_code=303)
+
+    try:
+        refresh_target_users(db, t)
+    except Exception as e:
+        return _templates(request).TemplateResponse(
+            "target_detail.html",
+            {"request": request, "target": t, "result": None, "error": str(e), "user_store": db.get(TargetUserSync, t.id)},
+        )
+    return RedirectResponse(f"/targets/{t.id}", status_code=303)
+
+
 @router.get("/targets/{target_id}/import/template.csv")
 def target_import_template_csv(request: Request, target_id: str, db: Session = Depends(get_db)):
     """
@@ -211,48 +252,56 @@ def target_export_csv(request: Request, target_id: str, db: Session = Depends(ge
     if not t:
         return RedirectResponse("/targets", status_code=303)
 
-    if t.auth_mode != "enterprise_hmac":
-        return Response("Export is implemented for enterprise_hmac targets only (for now).", status_code=400)
-
-    client = build_client(t)
-    orgs = client.list_organizations()
-    chosen = choose_org(orgs, t.org_name)
-    org_id = chosen.get("id")
-    if not org_id:
-        return Response("Chosen org did not include an 'id' field.", status_code=500)
-
-    users = client.list_users(org_id)
-    if not isinstance(users, list):
-        return Response("Unexpected user list format from target.", status_code=500)
-
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["action", "email", "username", "groups_mode", "groups", "status"])
-
-    for u in users:
-        username = (u.get("name") or "").strip()
-        email = (u.get("email") or "").strip()
-
-        groups = u.get("groups") or []
-        if isinstance(groups, list):
-            groups_str = ",".join([str(g).strip() for g in groups if str(g).strip()])
-        else:
-            groups_str = str(groups).strip()
-
-        disabled = bool(u.get("disabled", False))
-        w.writerow(["", email, username, "replace", groups_str, "disabled" if disabled else "active"])
+    try:
+        sync = ensure_fresh(db, t)
+    except RuntimeError as e:
+        return Response(str(e), status_code=500)
+    org_names = {o["id"]: o.get("name") or "" for o in (sync.orgs or [])}
+    # The org column lets the export be re-imported into a multi-org target as-is
+    with_org = len(org_names) > 1
+
+    def _export_rows():
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        buf.write("\ufeff")
+        w.writerow(["action", "email", "username", "groups_mode", "groups", "status"] + (["org"] if with_org else []))
+
+        # The request's session is closed before the body streams
+        sdb = SessionLocal()
+        try:
+            for n, u in enumerate(iter_target_users(sdb, t.id), start=1):
+                groups_str = ",".join(u["groups"])
+                row = ["", u["email"], u["name"], "replace", groups_str, "disabled" if u["disabled"] else "active"]
+                if with_org:
+                    row.append(org_names.get(u["organization"], ""))
+                w.writerow(row)
+
+                # Bounded chunks keep memory flat for large orgs
+                if n % 1000 == 0:
+                    yield buf.getvalue().encode("utf-8")
+                    buf.seek(0)
+                    buf.truncate()
+        finally:
+            sdb.close()
+        yield buf.getvalue().encode("utf-8")
 
-    csv_bytes = ("\ufeff" + buf.getvalue()).encode("utf-8")
     filename = f"{t.name}_users.csv".replace(" ", "_")
     headers = {
-        "Content-Type": "text/csv; charset=utf-8",
         "Content-Disposition": f'attachment; filename="{filename}"',
     }
-    return Response(content=csv_bytes, headers=headers)
+    return StreamingResponse(_export_rows(), media_type="text/csv; charset=utf-8", headers=headers)
 
 
 @router.post("/targets/{target_id}/import/preview")
-async def target_import_preview(request: Request, target_id: str, file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def target_import_preview(
+    request: Request,
+    target_id: str,
+    file: UploadFile = File(...),
+    base_batch_id: str = Form(default=""),
+    mode: str = Form(default="actions"),
+    disable_missing: str | None = Form(default=None),
+    db: Session = Depends(get_db),
+):
     redir = require_login(request)
     if redir:
         return redir
@@ -261,73 +310,16 @@ async def target_import_preview(request: Request, target_id: str, file: UploadFi
     if not t:
         return RedirectResponse("/targets", status_code=303)
 
-    if t.auth_mode != "enterprise_hmac":
-        return _templates(request).TemplateResponse(
-            "import_preview.html",
-            {
-                "request": request,
-                "target": t,
-                "error": "Preview is implemented for enterprise_hmac targets only (for now).",
-                "summary": None,
-                "items": None,
-                "job_id": None,
-                "batch_id": None,
-                "preview_sha256": None,
-                "can_apply": False,
-                "apply_disabled_reason": "enterprise_hmac only",
-                "apply_result": None,
-            "warn": warn,
-            "warn_msgs": warn_msgs,
-            },
-        )
-
     csv_bytes = await file.read()
-    csv_sha = sha256_hex(csv_bytes)
-
-    client = build_client(t)
-    orgs = client.list_organizations()
-    chosen = choose_org(orgs, t.org_name)
-    org_id = chosen.get("id")
-    if not org_id:
-        return _templates(request).TemplateResponse(
-            "import_preview.html",
-            {
-                "request": request,
-                "target": t,
-                "error": "Chosen org did not include an 'id' field.",
-                "summary": None,
-                "items": None,
-                "job_id": None,
-                "batch_id": None,
-                "preview_sha256": None,
-                "can_apply": False,
-                "apply_disabled_reason": "org error",
-                "apply_result": None,
-            },
-        )
-
-    users = client.list_users(org_id)
-    if not isinstance(users, list):
-        return _templates(request).TemplateResponse(
-            "import_preview.html",
-            {
-                "request": request,
-                "target": t,
-                "error": "Unexpected user list format from target.",
-                "summary": None,
-                "items": None,
-                "job_id": None,
-                "batch_id": None,
-                "preview_sha256": None,
-                "can_apply": False,
-                "apply_disabled_reason": "user list error",
-                "apply_result": None,
-            },
-        )
 
     try:
-        _job_id, summary, items_ui, items_full = preview_csv_against_users(csv_bytes, users)
-    except Exception as e:
+        options = PreviewOptions(
+            mode=(mode or "actions").strip().lower(),
+            disable_missing=disable_missing is not None,
+            base_batch_id=base_batch_id.strip() or None,
+        )
+        outcome = run_preview(db, t, csv_bytes, get_actor_from_request(request), options=options)
+    except (ValueError, RuntimeError) as e:
         return _templates(request).TemplateResponse(
             "import_preview.html",
             {
@@ -345,92 +337,16 @@ async def target_import_preview(request: Request, target_id: str, file: UploadFi
             },
         )
 
-    plan_for_hash = [
-        {
-            "row": it.row,
-            "action": it.action,
-            "email": it.email,
-            "username": it.username,
-            "status": it.status,
-            "before": it.before,
-            "after": it.after,
-            "error": it.error,
-            "desired": it.desired,
-            "diff": it.diff,
-            "will_apply": it.will_apply,
-        }
-        for it in items_full
-    ]
-    preview_sha = stable_json_hash(plan_for_hash)
-
-    actor = get_actor_from_request(request)
-
-    batch = ImportBatch(
-        target_id=t.id,
-        created_by=actor,
-        status="previewed",
-        csv_sha256=csv_sha,
-        csv_bytes=csv_bytes,
-        preview_sha256=preview_sha,
-        summary={
-            "total_rows": summary.total_rows,
-            "actioned_rows": summary.actioned_rows,
-            "creates": summary.creates,
-            "updates": summary.updates,
-            "disables": summary.disables,
-            "enables": summary.enables,
-            "deletes": summary.deletes,
-            "clears": summary.clears,
-            "skips": summary.skips,
-            "errors": summary.errors,
-        },
-        meta={
-            "org_id": org_id,
-            "org_name": chosen.get("name"),
-        },
-    )
-    db.add(batch)
-    db.commit()
-
-    for it in items_full:
-        r = ImportRow(
-            batch_id=batch.id,
-            row_num=it.row,
-            action=it.action,
-            email=it.email,
-            username=it.username,
-            status=it.status,
-            before=it.before,
-            after=it.after,
-            error=it.error,
-            desired=it.desired or {},
-            diff=it.diff or {},
-            will_apply=bool(it.will_apply and it.status == "ok"),
-        )
-        db.add(r)
-    db.commit()
+    batch = outcome.batch
+    summary = outcome.summary
+    items_ui = outcome.items_ui
+    preview_sha = outcome.preview_sha256
 
     can_apply = (summary.actioned_rows > 0) and (summary.errors == 0)
     apply_disabled_reason = "Apply enabled only when Actioned rows > 0 and Errors == 0."
 
     # Guardrails (warnings only): highlight if thresholds are met/exceeded
-    app_settings = get_settings(db)
-    warn = {
-        "creates": (app_settings.warn_create_count > 0 and summary.creates >= app_settings.warn_create_count),
-        "disables": (app_settings.warn_disable_count > 0 and summary.disables >= app_settings.warn_disable_count),
-        "deletes": (app_settings.warn_delete_count > 0 and summary.deletes >= app_settings.warn_delete_count),
-        "clears": (app_settings.warn_group_clear_count > 0 and summary.clears >= app_settings.warn_group_clear_count),
-    }
-
-    warn_msgs = []
-    if warn["disables"]:
-        warn_msgs.append(f"Disables in batch: {summary.disables} (warn threshold: {app_settings.warn_disable_count})")
-    if warn["deletes"]:
-        warn_msgs.append(f"Deletes in batch: {summary.deletes} (warn threshold: {app_settings.warn_delete_count})")
-    if warn["clears"]:
-        warn_msgs.append(f"Group clears in batch: {summary.clears} (warn threshold: {app_settings.warn_group_clear_count})")
-    if warn["creates"]:
-        warn_msgs.append(f"Creates in batch: {summary.creates} (warn threshold: {app_settings.warn_create_count})")
+    warn, warn_msgs = guardrail_warnings(get_cached_settings(db), summary)
 
     return _templates(request).TemplateResponse(
         "import_preview.html",
@@ -448,6 +364,8 @@ async def target_import_preview(request: Request, target_id: str, file: UploadFi
             "can_apply": can_apply,
             "apply_disabled_reason": apply_disabled_reason,
             "apply_result": None,
+            "reused": outcome.reused,
+            "delta": outcome.delta,
         },
     )
 
@@ -467,23 +385,7 @@ def target_import_preview_report(request: Request, target_id: str, job: str, db:
         return Response("Preview report not found (batch id expired). Re-run preview.", status_code=404)
 
     rows = db.query(ImportRow).filter(ImportRow.batch_id == batch.id).order_by(ImportRow.row_num.asc()).all()
-
-    from ..importer.preview import PreviewItem  # type: ignore
-    items = []
-    for r in rows:
-        items.append(PreviewItem(
-            row=r.row_num,
-            action=r.action,
-            email=r.email,
-            username=r.username,
-            status=r.status,
-            before=r.before,
-            after=r.after,
-            error=r.error,
-            desired=r.desired,
-            diff=r.diff,
-            will_apply=r.will_apply,
-        ))
+    items = items_from_rows(db, batch, rows)
 
     csv_bytes = preview_report_csv(items)
     filename = f"{t.name}_preview_report.csv".replace(" ", "_")
@@ -495,6 +397,30 @@ def target_import_preview_report(request: Request, target_id: str, job: str, db:
     return Response(content=csv_bytes, headers=headers)
 
 
+@router.get("/targets/{target_id}/import/upload.csv")
+def target_import_upload(request: Request, target_id: str, job: str, db: Session = Depends(get_db)):
+    """The CSV a batch was previewed from, as uploaded."""
+    redir = require_login(request)
+    if redir:
+        return redir
+
+    t = db.query(Target).filter(Target.id == target_id).first()
+    if not t:
+        return RedirectResponse("/targets", status_code=303)
+
+    batch = db.query(ImportBatch).filter(ImportBatch.id == job, ImportBatch.target_id == t.id).first()
+    data = batch_csv(db, batch) if batch else None
+    if data is None:
+        return Response("Upload not found for this batch.", status_code=404)
+
+    filename = f"{t.name}_upload_{batch.id[:8]}.csv".replace(" ", "_")
+    headers = {
+        "Content-Type": "text/csv; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    return Response(content=data, headers=headers)
+
+
 @router.post("/targets/{target_id}/import/apply")
 def target_import_apply(
     request: Request,
@@ -519,347 +445,74 @@ def target_import_apply(
     if not batch:
         return Response("Batch not found for this target. Re-run preview.", status_code=404)
 
-    if batch.preview_sha256 != preview_sha256:
-        return Response("Preview hash mismatch. Re-run preview.", status_code=400)
+    refusal = apply_refusal(batch, preview_sha256)
+    if refusal:
+        return Response(refusal, status_code=400)
 
-    if batch.status not in {"previewed", "failed"}:
-        return Response(f"Batch status is '{batch.status}', cannot apply.", status_code=400)
+    actor = get_actor_from_request(request)
 
-    if int((batch.summary or {}).get("errors", 0)) != 0:
-        return Response("Batch contains preview errors. Fix CSV and re-run preview.", status_code=400)
+    # Runs right away when the target is idle; otherwise waits its turn in the queue
+    try:
+        job = enqueue_apply(db, t, batch, actor)
+    except BatchNotApplicable as e:
+        return Response(str(e), status_code=400)
+    if run_next(db, t.id, only=job.id) is None:
+        return RedirectResponse(f"/targets/{t.id}/apply/{job.id}", status_code=303)
+    return _apply_result_page(request, db, t, job)
 
-    if t.auth_mode != "enterprise_hmac":
-        return Response("Apply is implemented for enterprise_hmac targets only (for now).", status_code=400)
 
-    actor = get_actor_from_request(request)
+@router.get("/targets/{target_id}/apply/{job_id}")
+def target_apply_status(request: Request, target_id: str, job_id: str, db: Session = Depends(get_db)):
+    redir = require_login(request)
+    if redir:
+        return redir
 
-    acquire_target_lock(db, t.id)
-    try:
-        batch.status = "applying"
-        db.add(batch)
-        db.commit()
-
-        client = build_client(t)
-        orgs = client.list_organizations()
-        chosen = choose_org(orgs, t.org_name)
-        org_id = chosen.get("id")
-        if not org_id:
-            raise RuntimeError("Chosen org did not include an 'id' field")
-
-        users = client.list_users(org_id)
-        if not isinstance(users, list):
-            raise RuntimeError("Unexpected user list format from target")
-
-        user_by_email: dict[str, dict[str, Any]] = {}
-        for u in users:
-            em = (u.get("email") or "").strip().lower()
-            if em and em not in user_by_email:
-                user_by_email[em] = u
-
-        rows = db.query(ImportRow).filter(ImportRow.batch_id == batch.id).order_by(ImportRow.row_num.asc()).all()
-
-        results = {"applied": 0, "skipped": 0, "failed": 0, "details": []}
-
-        for r in rows:
-            if not r.will_apply:
-                r.apply_status = "skipped"
-                r.apply_result = {"reason": "will_apply=false or status!=ok"}
-                results["skipped"] += 1
-                db.add(r)
-                continue
-
-            email = (r.email or "").strip().lower()
-            action = (r.action or "").strip().lower()
-            existing = user_by_email.get(email)
-
-            try:
-                if action == "create":
-                    if existing:
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "idempotent: already exists"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    name = (r.username or "").strip()
-                    if not name:
-                        raise RuntimeError("Create requires username")
-
-                    groups = (r.desired or {}).get("groups") or []
-                    resp = create_user(
-                        client,
-                        org_id,
-                        name=name,
-                        email=email,
-                        groups=groups if t.supports_groups else None,
-                        send_key_email=True,
-                    )
-
-                    db.add(AuditLog(
-                        actor=actor,
-                        target_id=t.id,
-                        batch_id=batch.id,
-                        row_id=r.id,
-                        email=email,
-                        operation="user.create",
-                        success=True,
-                        request={"email": email, "name": name, "groups": groups},
-                        response={"result": resp},
-                    ))
-
-                    r.apply_status = "applied"
-                    r.apply_result = {"result": resp}
-                    r.applied_at = now_utc()
-                    results["applied"] += 1
-
-                elif action == "update":
-                    if not existing:
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "missing user for update; ignored"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    user_id = existing.get("id")
-                    if not user_id:
-                        raise RuntimeError("Existing user record missing id")
-
-                    merged = dict(existing)
-
-                    # Username is read-only for update; do NOT set merged["name"]
-
-                    gm = ((r.desired or {}).get("groups_mode") or "").lower()
-                    groups_cell = (r.desired or {}).get("groups_cell") or ""
-                    desired_groups = (r.desired or {}).get("groups")
-
-                    if t.supports_groups:
-                        if gm == "clear":
-                            merged["groups"] = []
-                        elif gm == "replace":
-                            if str(groups_cell) != "":
-                                merged["groups"] = desired_groups or []
-                        else:
-                            pass  # blank/unknown => do nothing
-
-                    # idempotent best-effort
-                    if merged.get("groups") == existing.get("groups"):
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "idempotent: no change"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    resp = update_user_full(client, org_id, user_id, merged)
-
-                    db.add(AuditLog(
-                        actor=actor,
-                        target_id=t.id,
-                        batch_id=batch.id,
-                        row_id=r.id,
-                        email=email,
-                        operation="user.update",
-                        success=True,
-                        request={"user_id": user_id},
-                        response={"result": resp},
-                    ))
-
-                    r.apply_status = "applied"
-                    r.apply_result = {"result": resp}
-                    r.applied_at = now_utc()
-                    results["applied"] += 1
-
-                elif action == "disable":
-                    if not existing:
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "missing user for disable; ignored"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    user_id = existing.get("id")
-                    if not user_id:
-                        raise RuntimeError("Existing user record missing id")
-
-                    if bool(existing.get("disabled", False)) is True:
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "idempotent: already disabled"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    merged = dict(existing)
-                    merged["disabled"] = True
-
-                    resp = update_user_full(client, org_id, user_id, merged)
-
-                    db.add(AuditLog(
-                        actor=actor,
-                        target_id=t.id,
-                        batch_id=batch.id,
-                        row_id=r.id,
-                        email=email,
-                        operation="user.disable",
-                        success=True,
-                        request={"user_id": user_id, "disabled": True},
-                        response={"result": resp},
-                    ))
-
-                    r.apply_status = "applied"
-                    r.apply_result = {"result": resp}
-                    r.applied_at = now_utc()
-                    results["applied"] += 1
-
-                elif action == "enable":
-                    if not existing:
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "missing user for enable; ignored"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    user_id = existing.get("id")
-                    if not user_id:
-                        raise RuntimeError("Existing user record missing id")
-
-                    if bool(existing.get("disabled", False)) is False:
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "idempotent: already enabled"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    merged = dict(existing)
-                    merged["disabled"] = False
-
-                    resp = update_user_full(client, org_id, user_id, merged)
-
-                    db.add(AuditLog(
-                        actor=actor,
-                        target_id=t.id,
-                        batch_id=batch.id,
-                        row_id=r.id,
-                        email=email,
-                        operation="user.enable",
-                        success=True,
-                        request={"user_id": user_id, "disabled": False},
-                        response={"result": resp},
-                    ))
-
-                    r.apply_status = "applied"
-                    r.apply_result = {"result": resp}
-                    r.applied_at = now_utc()
-                    results["applied"] += 1
-
-                elif action == "delete":
-                    if not settings.allow_delete:
-                        r.apply_status = "failed"
-                        r.apply_result = {"error": "ALLOW_DELETE=false"}
-                        results["failed"] += 1
-                        db.add(r)
-                        continue
-
-                    if not existing:
-                        r.apply_status = "skipped"
-                        r.apply_result = {"reason": "missing user for delete; ignored"}
-                        results["skipped"] += 1
-                        db.add(r)
-                        continue
-
-                    user_id = existing.get("id")
-                    if not user_id:
-                        raise RuntimeError("Existing user record missing id")
-
-                    resp = delete_user(client, org_id, user_id)
-
-                    db.add(AuditLog(
-                        actor=actor,
-                        target_id=t.id,
-                        batch_id=batch.id,
-                        row_id=r.id,
-                        email=email,
-                        operation="user.delete",
-                        success=True,
-                        request={"user_id": user_id},
-                        response={"result": resp if isinstance(resp, dict) else {"text": str(resp)}},
-                    ))
-
-                    r.apply_status = "applied"
-                    r.apply_result = {"result": resp}
-                    r.applied_at = now_utc()
-                    results["applied"] += 1
-
-                else:
-                    r.apply_status = "skipped"
-                    r.apply_result = {"reason": f"unknown/unsupported action '{action}'"}
-                    results["skipped"] += 1
-
-            except Exception as e:
-                results["failed"] += 1
-                r.apply_status = "failed"
-                r.apply_result = {"error": str(e)}
-
-                db.add(AuditLog(
-                    actor=actor,
-                    target_id=t.id,
-                    batch_id=batch.id,
-                    row_id=r.id,
-                    email=email,
-                    operation=f"user.{action}",
-                    success=False,
-                    error=str(e),
-                    request={"row": r.row_num, "action": action},
-                    response={},
-                ))
-
-            db.add(r)
-            results["details"].append({"row": r.row_num, "email": email, "action": action, "status": r.apply_status})
-
-        batch.status = "applied" if results["failed"] == 0 else "failed"
-        db.add(batch)
-        db.commit()
-
-        items_ui = []
-        for rr in rows[:200]:
-            items_ui.append({
-                "row": rr.row_num,
-                "action": rr.action,
-                "email": rr.email,
-                "username": rr.username,
-                "status": rr.status,
-                "before": rr.before,
-                "after": rr.after,
-                "error": rr.error,
-            })
-
-        class SummaryObj:
-            pass
-        s = SummaryObj()
-        for k, v in (batch.summary or {}).items():
-            setattr(s, k, v)
+    t = db.query(Target).filter(Target.id == target_id).first()
+    if not t:
+        return RedirectResponse("/targets", status_code=303)
 
-        return _templates(request).TemplateResponse(
-            "import_preview.html",
-            {
-                "request": request,
-                "target": t,
-                "error": None,
-                "summary": s,
-                "items": items_ui,
-                "job_id": batch.id,
-                "batch_id": batch.id,
-                "preview_sha256": batch.preview_sha256,
-                "can_apply": False,
-                "apply_disabled_reason": "Already applied.",
-                "apply_result": json.dumps(results, indent=2),
-            },
-        )
+    job = db.query(ApplyJob).filter(ApplyJob.id == job_id, ApplyJob.target_id == t.id).first()
+    if not job:
+        return Response("Apply job not found for this target.", status_code=404)
+
+    if job.status in {"applied", "failed"}:
+        return _apply_result_page(request, db, t, job)
+
+    position = queue_position(db, job) if job.status in {"queued", "running"} else None
+    return _templates(request).TemplateResponse(
+        "apply_status.html",
+        {"request": request, "target": t, "job": job, "position": position},
+    )
+
+
+def _apply_result_page(request: Request, db: Session, t: Target, job: ApplyJob):
+    batch = db.query(ImportBatch).filter(ImportBatch.id == job.batch_id).first()
+    rows = db.query(ImportRow).filter(ImportRow.batch_id == batch.id).order_by(ImportRow.row_num.asc()).limit(200).all()
+    items_ui = items_from_rows(db, batch, rows)
+
+    class SummaryObj:
+        pass
+    s = SummaryObj()
+    for k, v in (batch.summary or {}).items():
+        setattr(s, k, v)
+
+    return _templates(request).TemplateResponse(
+        "import_preview.html",
+        {
+            "request": request,
+            "target": t,
+            "error": None,
+            "summary": s,
+            "items": items_ui,
+            "job_id": batch.id,
+            "batch_id": batch.id,
+            "preview_sha256": batch.preview_sha256,
+            "can_apply": False,
+            "apply_disabled_reason": "Already applied.",
+            "apply_result": json.dumps(job.results or {}, indent=2),
+        },
+    )
 
-    finally:
-        try:
-            release_target_lock(db, t.id)
-            db.commit()
-        except Exception:
-            pass
 
 
 @router.get("/targets/{target_id}/edit")
@@ -941,6 +594,9 @@ def target_edit_post(
         t.credentials_enc = encrypt_str(json.dumps(new_creds))
 
     db.add(t)
+    publish(db, "target", t.id)
+    # Org Name or credentials may have changed: re-list on the next read
+    mark_stale(db, t.id)
     db.commit()
     return RedirectResponse(f"/targets/{t.id}", status_code=303)
 
@@ -955,27 +611,15 @@ def target_test_connection(request: Request, target_id: str, db: Session = Depen
     if not t:
         return RedirectResponse("/targets", status_code=303)
 
-    if t.auth_mode != "enterprise_hmac":
-        return _templates(request).TemplateResponse(
-            "target_detail.html",
-            {"request": request, "target": t, "result": None, "error": "Test is implemented for enterprise_hmac only (for now)."},
-        )
-
     try:
-        client = build_client(t)
-        orgs = client.list_organizations()
-        chosen = choose_org(orgs, t.org_name)
-        org_id = chosen.get("id")
-        org_name = chosen.get("name")
-
-        if not org_id:
-            raise RuntimeError("Chosen org did not include an 'id' field")
-
-        users = client.list_users(org_id)
+        # The test always talks to Pritunl, and leaves the store up to date
+        refresh_target_users(db, t)
+        stored = load_target_users(db, t)
+        orgs, users = stored.orgs, stored.users
 
         result = {
-            "org_name": org_name,
-            "org_id": org_id,
+            "org_name": ", ".join(str(o.get("name") or o["id"]) for o in orgs),
+            "org_id": ", ".join(o["id"] for o in orgs),
             "user_count": len(users) if isinstance(users, list) else None,
             "sample_users": [
                 {
@@ -0,0 +1,36 @@
+"""
+Jinja setup shared by all routes (app.state.templates).
+
+Compiled templates are kept in a FileSystemBytecodeCache under
+TEMPLATE_CACHE_DIR, so a restarted worker loads bytecode instead of compiling
+every template again (entries are keyed by the template source, so edited
+templates are recompiled). warm_templates() loads them all at startup, before
+the first request needs one.
+"""
+import logging
+import os
+
+from jinja2 import FileSystemBytecodeCache
+from starlette.templating import Jinja2Templates
+
+from .settings import settings
+
+log = logging.getLogger(__name__)
+
+TEMPLATE_DIR = "app/templates"
+
+
+def build_templates() -> Jinja2Templates:
+    templates = Jinja2Templates(directory=TEMPLATE_DIR)
+    if settings.template_cache_dir:
+        try:
+            os.makedirs(settings.template_cache_dir, exist_ok=True)
+            templates.env.bytecode_cache = FileSystemBytecodeCache(settings.template_cache_dir)
+        except OSError:
+            log.warning("template cache dir %s unusable; compiling templates in memory only", settings.template_cache_dir)
+    return templates
+
+
+def warm_templates(templates: Jinja2Templates) -> None:
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(name)
@@ -0,0 +1,250 @@
+"""
+End-to-end preview + apply benchmark against the local Pritunl stand-in.
+
+Runs the real pipeline (app.importer.service.run_preview / run_apply) with a
+real database, so it needs the same environment as the app, pointed at a
+scratch Postgres database:
+
+  DATABASE_URL=... SESSION_SECRET=... PRITUNL_UI_MASTER_KEY=... \\
+    python -m bench.bench_apply --sizes 1000,10000,100000 --latency-ms 5
+
+Each batch size runs in its own subprocess so peak RSS is per size. Results
+are printed and written to bench/results/apply-<timestamp>.json.
+
+CSV mix per batch: 60% group updates, 20% disables, 20% creates.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from .pritunl_stub import StubConfig, start_stub
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def build_csv(size: int, existing_users: int, groups: int) -> bytes:
+    lines = ["action,email,username,groups_mode,groups"]
+    for i in range(size):
+        bucket = i % 10
+        if bucket < 6 and i < existing_users:
+            g = f"group-{i % groups:03d},group-{(i + 7) % groups:03d}"
+            lines.append(f'update,user{i:07d}@example.com,,replace,"{g}"')
+        elif bucket < 8 and i < existing_users:
+            lines.append(f"disable,user{i:07d}@example.com,,,")
+        else:
+            lines.append(f"create,new{i:07d}@bench.example.com,New User {i},replace,group-{i % groups:03d}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _run_one(args: argparse.Namespace) -> dict[str, Any]:
+    # Imported lazily so the driver process does not need app settings
+    from app.crypto import encrypt_str
+    from app.db import SessionLocal
+    from sqlalchemy import or_
+
+    from app.importer.models import AuditLog, ContentBlob, ImportBatch, ImportRow
+    from app.importer.service import run_apply, run_preview
+    from app.migrations import ensure_schema
+    from app.pritunl.enterprise_hmac import EnterpriseHmacClient
+    from app.pritunl.models import TargetUser, TargetUserSync
+    from app.targets.models import Target
+
+    @dataclass
+    class TimedClient(EnterpriseHmacClient):
+        latencies: list[float] = field(default_factory=list)
+
+        def request(self, method: str, path: str, json_body: Any | None = None, params: dict[str, Any] | None = None) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return super().request(method, path, json_body=json_body, params=params)
+            finally:
+                self.latencies.append(time.perf_counter() - t0)
+
+    size = args.one
+    cfg = StubConfig(
+        users=max(size, args.users),
+        groups=args.groups,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+    )
+    server = start_stub(cfg)
+    csv_bytes = build_csv(size, cfg.users, cfg.groups)
+
+    ensure_schema()
+    db = SessionLocal()
+    target = Target(
+        name=f"bench-{uuid.uuid4().hex[:8]}",
+        base_url=server.base_url,
+        auth_mode="enterprise_hmac",
+        verify_tls=False,
+        supports_groups=True,
+        org_name=None,
+        credentials_enc=encrypt_str(json.dumps({"api_token": cfg.api_token, "api_secret": cfg.api_secret})),
+    )
+    db.add(target)
+    db.commit()
+
+    client = TimedClient(base_url=server.base_url, api_token=cfg.api_token, api_secret=cfg.api_secret, verify_tls=False)
+
+    batch_id = None
+    try:
+        t0 = time.perf_counter()
+        outcome = run_preview(db, target, csv_bytes, "bench", client=client)
+        preview_s = time.perf_counter() - t0
+        preview_calls = list(client.latencies)
+        batch_id = outcome.batch.id
+        rss_after_preview = peak_rss_bytes()
+
+        client.latencies.clear()
+        t0 = time.perf_counter()
+        results, _rows = run_apply(db, target, outcome.batch, "bench", client=client)
+        apply_s = time.perf_counter() - t0
+        apply_calls = list(client.latencies)
+
+        actioned = outcome.summary.actioned_rows
+        return {
+            "rows": size,
+            "org_users": cfg.users,
+            "latency_ms": cfg.latency_ms,
+            "error_rate": cfg.error_rate,
+            "preview": {
+                "seconds": round(preview_s, 4),
+                "rows_per_s": round(size / preview_s, 1) if preview_s else None,
+                "calls": len(preview_calls),
+                "call_p50_ms": round(percentile(preview_calls, 50) * 1000, 2),
+                "call_p99_ms": round(percentile(preview_calls, 99) * 1000, 2),
+            },
+            "apply": {
+                "seconds": round(apply_s, 4),
+                "rows_per_s": round(actioned / apply_s, 1) if apply_s else None,
+                "calls": len(apply_calls),
+                "call_p50_ms": round(percentile(apply_calls, 50) * 1000, 2),
+                "call_p99_ms": round(percentile(apply_calls, 99) * 1000, 2),
+                "applied": results["applied"],
+                "skipped": results["skipped"],
+                "failed": results["failed"],
+            },
+            "peak_rss_bytes": {
+                "after_preview": rss_after_preview,
+                "after_apply": peak_rss_bytes(),
+            },
+            "stub": {
+                "calls": server.state.calls,
+                "auth_failures": server.state.auth_failures,
+                "injected_errors": server.state.injected_errors,
+            },
+        }
+    finally:
+        if not args.keep:
+            db.rollback()
+            blobs: set[str] = set()
+            if batch_id:
+                batch = db.get(ImportBatch, batch_id)
+                if batch is not None:
+                    blobs = {b for b in (batch.csv_sha256, (batch.meta or {}).get("users_blob")) if b}
+                db.query(AuditLog).filter(AuditLog.batch_id == batch_id).delete()
+                db.query(ImportRow).filter(ImportRow.batch_id == batch_id).delete()
+                db.query(ImportBatch).filter(ImportBatch.id == batch_id).delete()
+            # Blobs are shared by content hash: keep those another (e.g. --keep) batch still uses
+            for sha in blobs:
+                in_use = db.query(ImportBatch.id).filter(
+                    or_(ImportBatch.csv_sha256 == sha, ImportBatch.meta["users_blob"].astext == sha)
+                ).first()
+                if in_use is None:
+                    db.query(ContentBlob).filter(ContentBlob.sha256 == sha).delete()
+            db.query(TargetUser).filter(TargetUser.target_id == target.id).delete()
+            db.query(TargetUserSync).filter(TargetUserSync.target_id == target.id).delete()
+            db.query(Target).filter(Target.id == target.id).delete()
+            db.commit()
+        db.close()
+        server.shutdown()
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="End-to-end preview/apply benchmark")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="comma-separated batch sizes")
+    ap.add_argument("--users", type=int, default=0, help="org size (default: batch size)")
+    ap.add_argument("--groups", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--keep", action="store_true", help="keep the bench target/batches in the database")
+    ap.add_argument("--out", default="", help="results file (default: bench/results/apply-<timestamp>.json)")
+    ap.add_argument("--one", type=int, default=0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.one:
+        print(json.dumps(_run_one(args)))
+        return
+
+    passthrough = [
+        "--users", str(args.users), "--groups", str(args.groups),
+        "--latency-ms", str(args.latency_ms), "--latency-jitter-ms", str(args.latency_jitter_ms),
+        "--error-rate", str(args.error_rate),
+    ] + (["--keep"] if args.keep else [])
+
+    runs = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        out = subprocess.check_output(
+            [sys.executable, "-m", "bench.bench_apply", "--one", str(size)] + passthrough,
+            text=True,
+            env=os.environ.copy(),
+        )
+        run = json.loads(out.strip().splitlines()[-1])
+        runs.append(run)
+        p, a = run["preview"], run["apply"]
+        print(
+            f"{size:>8} rows  preview {p['seconds']:>8.2f}s  "
+            f"p50 {p['call_p50_ms']:>7.2f}ms  p99 {p['call_p99_ms']:>7.2f}ms  "
+            f"apply {a['seconds']:>8.2f}s  {a['rows_per_s'] or 0:>9.1f} rows/s  "
+            f"p50 {a['call_p50_ms']:>7.2f}ms  p99 {a['call_p99_ms']:>7.2f}ms  "
+            f"rss {run['peak_rss_bytes']['after_apply'] / 2**20:>7.1f}MiB  failed {a['failed']}",
+            file=sys.stderr,
+        )
+
+    report = {
+        "benchmark": "apply",
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "runs": runs,
+    }
+    out_path = Path(args.out) if args.out else RESULTS_DIR / f"apply-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, indent=2))
+    print(f"wrote {out_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Micro-benchmark for the preview engine (app/importer/preview.py).
+
+Stages timed per roster:
+  index   build_user_index_by_email over the org's users
+  groups  _split_groups over every groups cell in the CSV
+  preview preview_csv_against_users end to end
+  report  preview_report_csv over the full item list
+
+Each stage runs once untraced for wall time and once under tracemalloc for
+peak memory. Runs are appended to a JSON history file and compared with the
+previous run for the same (rows, group cardinality, stage); a slowdown above
+--threshold is reported as a regression.
+
+  python -m bench.bench_preview --sizes 10000,100000,1000000 --cardinality 10,1000
+"""
+import argparse
+import csv
+import gc
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+from app.importer.preview import (
+    _split_groups,
+    build_user_index_by_email,
+    preview_csv_against_users,
+    preview_report_csv,
+)
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_HISTORY = RESULTS_DIR / "preview_history.json"
+
+# Share of CSV rows per action; the rest are blank (ignored) rows
+ACTION_MIX = [("update", 0.55), ("disable", 0.15), ("enable", 0.05), ("create", 0.15)]
+
+
+def synth_users(n: int, cardinality: int, rnd: random.Random) -> list[dict[str, Any]]:
+    groups = [f"grp-{g:05d}" for g in range(cardinality)]
+    return [
+        {
+            "id": f"{i:024x}",
+            "name": f"User {i}",
+            "email": f"user{i:07d}@example.com",
+            "groups": rnd.sample(groups, k=min(3, cardinality)),
+            "disabled": rnd.random() < 0.1,
+        }
+        for i in range(n)
+    ]
+
+
+def synth_csv(n: int, cardinality: int, rnd: random.Random) -> bytes:
+    groups = [f"grp-{g:05d}" for g in range(cardinality)]
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["action", "email", "username", "groups_mode", "groups"])
+    for i in range(n):
+        x = rnd.random()
+        action = ""
+        for name, share in ACTION_MIX:
+            if x < share:
+                action = name
+                break
+            x -= share
+        if action == "create":
+            email = f"new{i:07d}@example.com"
+            w.writerow([action, email, f"New {i}", "replace", ",".join(rnd.sample(groups, k=min(2, cardinality)))])
+        elif action == "update":
+            w.writerow([action, f"user{i:07d}@example.com", "", "replace", ",".join(rnd.sample(groups, k=min(4, cardinality)))])
+        else:
+            w.writerow([action, f"user{i:07d}@example.com", "", "", ""])
+    return buf.getvalue().encode("utf-8")
+
+
+def _measure(fn: Callable[[], Any]) -> tuple[float, int, Any]:
+    gc.collect()
+    t0 = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t0
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        _cur, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def run_case(rows: int, cardinality: int, seed: int) -> dict[str, dict[str, float]]:
+    rnd = random.Random(seed)
+    users = synth_users(rows, cardinality, rnd)
+    csv_bytes = synth_csv(rows, cardinality, rnd)
+    cells = [r.get("groups") or "" for r in csv.DictReader(io.StringIO(csv_bytes.decode("utf-8")))]
+
+    stages: dict[str, dict[str, float]] = {}
+
+    s, peak, _ = _measure(lambda: build_user_index_by_email(users))
+    stages["index"] = {"seconds": s, "peak_bytes": peak}
+
+    s, peak, _ = _measure(lambda: [_split_groups(c) for c in cells])
+    stages["groups"] = {"seconds": s, "peak_bytes": peak}
+
+    s, peak, res = _measure(lambda: preview_csv_against_users(csv_bytes, users))
+    stages["preview"] = {"seconds": s, "peak_bytes": peak}
+    items_full = res[3]
+
+    s, peak, _ = _measure(lambda: preview_report_csv(items_full))
+    stages["report"] = {"seconds": s, "peak_bytes": peak}
+
+    return stages
+
+
+def load_history(path: Path) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
+    return json.loads(path.read_text())
+
+
+def compare(prev: dict[str, Any] | None, cur: dict[str, Any], threshold: float) -> list[str]:
+    if not prev:
+        return []
+    prev_cases = {(c["rows"], c["cardinality"]): c["stages"] for c in prev.get("cases", [])}
+    out = []
+    for case in cur["cases"]:
+        before = prev_cases.get((case["rows"], case["cardinality"]))
+        if not before:
+            continue
+        for stage, m in case["stages"].items():
+            b = before.get(stage)
+            if not b or not b.get("seconds"):
+                continue
+            ratio = m["seconds"] / b["seconds"]
+            if ratio > 1.0 + threshold:
+                out.append(
+                    f"rows={case['rows']} cardinality={case['cardinality']} {stage}: "
+                    f"{b['seconds']:.3f}s -> {m['seconds']:.3f}s (+{(ratio - 1) * 100:.0f}%)"
+                )
+    return out
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Preview engine micro-benchmark")
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--cardinality", default="10,1000", help="comma-separated distinct group counts")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--history", default=str(DEFAULT_HISTORY))
+    ap.add_argument("--threshold", type=float, default=0.20, help="relative slowdown flagged as regression")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    ap.add_argument("--no-record", action="store_true", help="compare only, do not append to history")
+    args = ap.parse_args()
+
+    cases = []
+    for rows in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        for card in [int(c) for c in args.cardinality.split(",") if c.strip()]:
+            stages = run_case(rows, card, args.seed)
+            cases.append({"rows": rows, "cardinality": card, "stages": stages})
+            for stage, m in stages.items():
+                print(
+                    f"{rows:>8} rows  {card:>5} groups  {stage:<8} {m['seconds']:>8.3f}s  "
+                    f"peak {m['peak_bytes'] / 2**20:>8.1f}MiB",
+                    file=sys.stderr,
+                )
+
+    run = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "cases": cases,
+    }
+
+    history_path = Path(args.history)
+    history = load_history(history_path)
+    regressions = compare(history[-1] if history else None, run, args.threshold)
+
+    if not args.no_record:
+        history.append(run)
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        history_path.write_text(json.dumps(history, indent=2))
+
+    if regressions:
+        print(f"\nREGRESSIONS (> {args.threshold * 100:.0f}% slower than previous run):", file=sys.stderr)
+        for r in regressions:
+            print(f"  {r}", file=sys.stderr)
+        if args.fail_on_regression:
+            sys.exit(1)
+    elif history[:-1] or args.no_record:
+        print("\nno regressions against previous run", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Local stand-in for the subset of the Pritunl API the app uses.
+
+Speaks the Enterprise HMAC auth scheme (same signing as
+app/pritunl/enterprise_hmac.py) as well as the admin login used by
+app/pritunl/session_login.py (session cookie + Csrf-Token header), and the
+endpoints used by app/pritunl/write.py:
+
+  POST   /auth/session             (login; sets the session cookie)
+  GET    /state                    ({"csrf_token": ...})
+  GET    /organization
+  GET    /user/{org_id}            (?page=N -> {page, page_total, users})
+  GET    /user/{org_id}/{user_id}
+  POST   /user/{org_id}
+  PUT    /user/{org_id}/{user_id}
+  DELETE /user/{org_id}/{user_id}
+
+Run standalone:
+  python -m bench.pritunl_stub --port 9700 --users 10000 --latency-ms 20
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs
+
+DEFAULT_TOKEN = "bench-token"
+DEFAULT_SECRET = "bench-secret"
+DEFAULT_USERNAME = "pritunl"
+DEFAULT_PASSWORD = "bench-password"
+SESSION_COOKIE = "session"
+
+# Pritunl rejects requests whose timestamp is off by more than this
+MAX_CLOCK_SKEW_S = 300
+
+
+def _object_id() -> str:
+    return uuid.uuid4().hex[:24]
+
+
+@dataclass
+class StubConfig:
+    api_token: str = DEFAULT_TOKEN
+    api_secret: str = DEFAULT_SECRET
+    username: str = DEFAULT_USERNAME
+    password: str = DEFAULT_PASSWORD
+    # Login sessions expire after this long (0: never)
+    session_ttl_s: float = 0.0
+    orgs: int = 1
+    users: int = 1000
+    groups: int = 20
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    # Fraction of write calls (POST/PUT/DELETE) answered with HTTP 500
+    error_rate: float = 0.0
+    seed: int = 1
+    # Users per page for GET /user/{org_id}?page=N
+    page_size: int = 100
+
+
+@dataclass
+class StubState:
+    orgs: dict[str, dict[str, Any]] = field(default_factory=dict)
+    users: dict[str, dict[str, dict[str, Any]]] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    calls: int = 0
+    auth_failures: int = 0
+    logins: int = 0
+    # session id -> (csrf token, created at)
+    sessions: dict[str, tuple[str, float]] = field(default_factory=dict)
+    injected_errors: int = 0
+
+
+def seed_state(cfg: StubConfig) -> StubState:
+    rnd = random.Random(cfg.seed)
+    state = StubState()
+    group_names = [f"group-{g:03d}" for g in range(max(cfg.groups, 1))]
+    per_org = cfg.users // max(cfg.orgs, 1)
+
+    n = 0
+    for o in range(max(cfg.orgs, 1)):
+        org_id = _object_id()
+        state.orgs[org_id] = {"id": org_id, "name": f"bench-org-{o}"}
+        state.users[org_id] = {}
+        for _ in range(per_org):
+            uid = _object_id()
+            state.users[org_id][uid] = {
+                "id": uid,
+                "organization": org_id,
+                "organization_name": f"bench-org-{o}",
+                "name": f"user{n:07d}",
+                "email": f"user{n:07d}@example.com",
+                "groups": rnd.sample(group_names, k=min(3, len(group_names))),
+                "disabled": False,
+                "type": "client",
+                "auth_type": "local",
+            }
+            n += 1
+    return state
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "PritunlStubServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def _send(self, status: int, body: Any, cookie: str | None = None) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if cookie:
+            self.send_header("Set-Cookie", f"{SESSION_COOKIE}={cookie}; Path=/; HttpOnly")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _session(self) -> tuple[str, str] | None:
+        """(session id, csrf token) of a live login session, from the cookie."""
+        cfg = self.server.cfg
+        state = self.server.state
+        jar = SimpleCookie(self.headers.get("Cookie", ""))
+        sid = jar[SESSION_COOKIE].value if SESSION_COOKIE in jar else ""
+        with state.lock:
+            entry = state.sessions.get(sid)
+            if entry is None:
+                return None
+            if cfg.session_ttl_s and time.time() - entry[1] > cfg.session_ttl_s:
+                state.sessions.pop(sid, None)
+                return None
+        return sid, entry[0]
+
+    def _auth_ok(self) -> bool:
+        cfg = self.server.cfg
+        if "Auth-Token" not in self.headers:
+            session = self._session()
+            return session is not None and hmac.compare_digest(session[1], self.headers.get("Csrf-Token", ""))
+
+        token = self.headers.get("Auth-Token", "")
+        ts = self.headers.get("Auth-Timestamp", "")
+        nonce = self.headers.get("Auth-Nonce", "")
+        sig = self.headers.get("Auth-Signature", "")
+        if token != cfg.api_token or not ts or not nonce or not sig:
+            return False
+        try:
+            if abs(time.time() - int(ts)) > MAX_CLOCK_SKEW_S:
+                return False
+        except ValueError:
+            return False
+
+        path = self.path.split("?", 1)[0]
+        auth_string = "&".join([token, ts, nonce, self.command.upper(), path]).encode("utf-8")
+        expected = base64.b64encode(
+            hmac.new(cfg.api_secret.encode("utf-8"), auth_string, hashlib.sha256).digest()
+        ).decode("utf-8")
+        return hmac.compare_digest(expected, sig)
+
+    def _read_json(self) -> Any:
+        n = int(self.headers.get("Content-Length") or 0)
+        if n <= 0:
+            return None
+        return json.loads(self.rfile.read(n))
+
+    def _handle(self) -> None:
+        cfg = self.server.cfg
+        state = self.server.state
+
+        body = self._read_json()
+
+        with state.lock:
+            state.calls += 1
+
+        if cfg.latency_ms or cfg.latency_jitter_ms:
+            time.sleep(max(0.0, cfg.latency_ms + random.uniform(-cfg.latency_jitter_ms, cfg.latency_jitter_ms)) / 1000.0)
+
+        path = self.path.split("?", 1)[0]
+        if path == "/auth/session" and self.command.upper() == "POST":
+            creds = body or {}
+            if creds.get("username") != cfg.username or creds.get("password") != cfg.password:
+                self._send(401, {"error": "invalid credentials"})
+                return
+            sid = uuid.uuid4().hex
+            with state.lock:
+                state.logins += 1
+                state.sessions[sid] = (uuid.uuid4().hex, time.time())
+            self._send(200, {}, cookie=sid)
+            return
+        if path == "/state" and self.command.upper() == "GET":
+            session = self._session()
+            if session is None:
+                self._send(401, {"error": "unauthorized"})
+                return
+            self._send(200, {"csrf_token": session[1]})
+            return
+
+        if not self._auth_ok():
+            with state.lock:
+                state.auth_failures += 1
+            self._send(401, {"error": "unauthorized"})
+            return
+
+        method = self.command.upper()
+        if method != "GET" and cfg.error_rate and random.random() < cfg.error_rate:
+            with state.lock:
+                state.injected_errors += 1
+            self._send(500, {"error": "injected"})
+            return
+
+        path, _, query = self.path.partition("?")
+        parts = [p for p in path.split("/") if p]
+        params = parse_qs(query)
+
+        if parts == ["organization"] and method == "GET":
+            self._send(200, list(state.orgs.values()))
+            return
+
+        if len(parts) < 2 or parts[0] != "user" or parts[1] not in state.users:
+            self._send(404, {"error": "not found"})
+            return
+
+        org_id = parts[1]
+        org_users = state.users[org_id]
+
+        if len(parts) == 2:
+            if method == "GET":
+                with state.lock:
+                    listing = list(org_users.values())
+                if "page" in params:
+                    # Same shape as Pritunl: pages 0..page_total inclusive
+                    page = int(params["page"][0])
+                    size = max(cfg.page_size, 1)
+                    self._send(200, {
+                        "page": page,
+                        "page_total": len(listing) // size,
+                        "users": listing[page * size:(page + 1) * size],
+                    })
+                    return
+                self._send(200, listing)
+                return
+            if method == "POST":
+                uid = _object_id()
+                user = {
+                    "id": uid,
+                    "organization": org_id,
+                    "organization_name": state.orgs[org_id]["name"],
+                    "name": (body or {}).get("name", ""),
+                    "email": (body or {}).get("email", ""),
+                    "groups": (body or {}).get("groups") or [],
+                    "disabled": bool((body or {}).get("disabled", False)),
+                    "type": "client",
+                    "auth_type": "local",
+                }
+                with state.lock:
+                    org_users[uid] = user
+                self._send(200, [user])
+                return
+
+        if len(parts) == 3:
+            uid = parts[2]
+            with state.lock:
+                user = org_users.get(uid)
+            if user is None:
+                self._send(404, {"error": "user not found"})
+                return
+            if method == "GET":
+                self._send(200, user)
+                return
+            if method == "PUT":
+                updated = dict(user)
+                for k in ("name", "email", "groups", "disabled"):
+                    if body and k in body:
+                        updated[k] = body[k]
+                with state.lock:
+                    org_users[uid] = updated
+                self._send(200, updated)
+                return
+            if method == "DELETE":
+                with state.lock:
+                    org_users.pop(uid, None)
+                self._send(200, {})
+                return
+
+        self._send(405, {"error": "method not allowed"})
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+    do_DELETE = _handle
+
+
+class PritunlStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr: tuple[str, int], cfg: StubConfig):
+        super().__init__(addr, _Handler)
+        self.cfg = cfg
+        self.state = seed_state(cfg)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub(cfg: StubConfig, host: str = "127.0.0.1", port: int = 0) -> PritunlStubServer:
+    """Start the stub on a background thread. Call .shutdown() when done."""
+    server = PritunlStubServer((host, port), cfg)
+    threading.Thread(target=server.serve_forever, name="pritunl-stub", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local Pritunl API stand-in for benchmarks")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9700)
+    ap.add_argument("--orgs", type=int, default=1)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--groups", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--page-size", type=int, default=100)
+    ap.add_argument("--token", default=DEFAULT_TOKEN)
+    ap.add_argument("--secret", default=DEFAULT_SECRET)
+    ap.add_argument("--username", default=DEFAULT_USERNAME)
+    ap.add_argument("--password", default=DEFAULT_PASSWORD)
+    ap.add_argument("--session-ttl-s", type=float, default=0.0)
+    args = ap.parse_args()
+
+    cfg = StubConfig(
+        api_token=args.token,
+        api_secret=args.secret,
+        username=args.username,
+        password=args.password,
+        session_ttl_s=args.session_ttl_s,
+        orgs=args.orgs,
+        users=args.users,
+        groups=args.groups,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        page_size=args.page_size,
+    )
+    server = PritunlStubServer((args.host, args.port), cfg)
+    print(f"Pritunl stub listening on {server.base_url} ({args.users} users, {args.orgs} org(s))")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()